@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Ingest replay
+Replays recorded sensor data into `/api/forward-serial` (or any endpoint taking
+the agent's {"records": [...]} batches) as one or many virtual agents, then
+reports throughput, latency percentiles and errors. No devices needed.
+Usage:
+    python agent/replay.py data/sensor_data.csv --server http://localhost:5000/api/forward-serial --token mytoken
+    python agent/replay.py data/tenants/user_1/*.csv --speed 10 --agents 20 --token tokA --token tokB
+    python agent/replay.py export.ndjson --speed 0 --agents 50 --json
+
+Inputs:
+- forwarded data CSVs (timestamp,port,data), including gzip/xz cold partitions
+- sensor CSVs (timestamp plus numeric columns), sent as JSON lines per row
+- NDJSON from /api/export?format=ndjson, or captured agent records
+  ({"port", "data", "ts"} per line)
+
+--speed 1 keeps the recorded spacing between readings, --speed 10 plays it ten
+times faster and --speed 0 sends as fast as the server accepts. Each virtual
+agent replays the whole recording under its own port names (COM3 -> COM3@va2),
+like that many identical gateways; --token may be repeated to spread agents
+over several tokens. Batching follows the serial agent (--batch-size,
+--flush-interval), and 429/503 answers are waited out and resent unless
+--no-retry is given.
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import lzma
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+import requests
+
+TIME_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M:%S.%f')
+
+
+def parse_time(value):
+    """Recorded timestamp -> datetime, or None"""
+    if not value:
+        return None
+    value = str(value).strip().rstrip('Z')
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def open_recording(path):
+    if path.endswith('.gz'):
+        return io.TextIOWrapper(gzip.open(path, 'rb'), encoding='utf-8', errors='replace', newline='')
+    if path.endswith('.xz'):
+        return io.TextIOWrapper(lzma.open(path, 'rb'), encoding='utf-8', errors='replace', newline='')
+    return open(path, 'r', encoding='utf-8', errors='replace', newline='')
+
+
+def read_csv_records(path):
+    """(timestamp, port, data line) per row of a forwarded or sensor CSV"""
+    stem = os.path.basename(path).split('.')[0]
+    with open_recording(path) as f:
+        for row in csv.DictReader(f):
+            ts = parse_time(row.get('timestamp'))
+            if 'data' in row:
+                if row['data']:
+                    yield ts, row.get('port') or stem, row['data']
+                continue
+            values = {}
+            for name, value in row.items():
+                if name in ('timestamp', 'port') or value in (None, ''):
+                    continue
+                try:
+                    values[name] = float(value)
+                except ValueError:
+                    continue
+            if values:
+                yield ts, row.get('port') or stem, json.dumps(values)
+
+
+def read_ndjson_records(path):
+    """(timestamp, port, data line) per line of an NDJSON export or record capture"""
+    stem = os.path.basename(path).split('.')[0]
+    with open_recording(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(record, dict):
+                continue
+            data = record.get('data', record.get('line'))
+            if data is None:
+                data = {k: v for k, v in record.items() if k not in ('timestamp', 'ts', 'port')}
+            if isinstance(data, (dict, list)):
+                data = json.dumps(data)
+            if data:
+                yield parse_time(record.get('ts') or record.get('timestamp')), record.get('port') or stem, str(data)
+
+
+def load_recording(paths, limit=None):
+    """Every record of PATHS as (offset seconds, port, data, recorded time), in recorded time order"""
+    records = []
+    for path in paths:
+        reader = read_ndjson_records if '.ndjson' in path or '.jsonl' in path else read_csv_records
+        records.extend(reader(path))
+    timed = [r for r in records if r[0] is not None]
+    start = min(r[0] for r in timed) if timed else None
+    # Untimed rows (e.g. text lines without a timestamp) are sent as fast as possible
+    replay = [((ts - start).total_seconds() if ts else 0.0, port, data, ts) for ts, port, data in records]
+    replay.sort(key=lambda r: r[0])
+    return replay[:limit] if limit else replay
+
+
+def parse_retry_after(value, default=1.0):
+    """Seconds from a Retry-After header (delay-seconds form), capped at a minute"""
+    try:
+        return min(max(float(value), 0.1), 60.0)
+    except (TypeError, ValueError):
+        return default
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(q / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class ReplayStats:
+    """Counters shared by all virtual agents"""
+    def __init__(self):
+        self.latencies = []
+        self.statuses = Counter()
+        self.records_sent = 0
+        self.records_accepted = 0
+        self.requests = 0
+        self.errors = 0
+        self.max_behind = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, status, latency, records, accepted, behind):
+        with self.lock:
+            self.requests += 1
+            self.statuses[status] += 1
+            self.latencies.append(latency)
+            if status in (200, 201):
+                self.records_sent += records
+                self.records_accepted += accepted
+            elif status not in (429, 503):
+                self.errors += 1
+            self.max_behind = max(self.max_behind, behind)
+
+    def report(self, elapsed, agents, speed):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            return {
+                'agents': agents,
+                'speed': speed or 'max',
+                'elapsed_s': round(elapsed, 2),
+                'requests': self.requests,
+                'records_sent': self.records_sent,
+                'records_accepted': self.records_accepted,
+                'records_per_s': round(self.records_sent / elapsed, 1) if elapsed else None,
+                'requests_per_s': round(self.requests / elapsed, 1) if elapsed else None,
+                'latency_ms': {name: round(percentile(latencies, q) * 1000, 1) if latencies else None
+                               for name, q in (('p50', 50), ('p90', 90), ('p99', 99), ('max', 100))},
+                'statuses': {str(status): n for status, n in sorted(self.statuses.items(), key=str)},
+                'throttled': self.statuses[429],
+                'shed': self.statuses[503],
+                'errors': self.errors,
+                # Failed requests other than 429/503, which are resent after Retry-After
+                'error_rate': round(self.errors / self.requests, 4) if self.requests else 0.0,
+                # Real-time runs: how far sends fell behind the recorded schedule
+                'max_behind_s': round(self.max_behind, 2)
+            }
+
+
+class VirtualAgent(threading.Thread):
+    """Replays the recording on its own schedule and HTTP session, batching like the serial agent"""
+    def __init__(self, index, records, args, token, stats, started):
+        super().__init__(daemon=True)
+        self.index = index
+        self.records = records
+        self.args = args
+        self.stats = stats
+        self.started = started
+        self.suffix = f"@va{index}" if args.agents > 1 else ''
+        self.session = requests.Session()
+        self.session.headers['X-DEVICE-AGENT-TOKEN'] = token
+        self.running = True
+
+    def due(self, offset):
+        return offset / self.args.speed if self.args.speed else 0.0
+
+    def run(self):
+        position = 0
+        while self.running and position < len(self.records):
+            # Wait for the next reading, then gather what is due within the flush interval
+            wait = self.due(self.records[position][0]) - (time.monotonic() - self.started)
+            if wait > 0:
+                time.sleep(min(wait, 1.0))
+                continue
+            batch_due = self.due(self.records[position][0])
+            end = position
+            while end < len(self.records) and end - position < self.args.batch_size:
+                if self.due(self.records[end][0]) > batch_due + self.args.flush_interval:
+                    break
+                end += 1
+            last_due = self.due(self.records[end - 1][0])
+            wait = last_due - (time.monotonic() - self.started)
+            if wait > 0:
+                time.sleep(wait)
+            self.send(self.records[position:end], last_due)
+            position = end
+
+    def send(self, batch, scheduled):
+        now = datetime.now()
+        payload = {'records': [{'port': port + self.suffix, 'data': data,
+                                'ts': (recorded if self.args.timestamps == 'original' and recorded else now)
+                                .strftime('%Y-%m-%d %H:%M:%S')}
+                               for _, port, data, recorded in batch]}
+        while self.running:
+            behind = max(time.monotonic() - self.started - scheduled, 0.0) if self.args.speed else 0.0
+            sent_at = time.perf_counter()
+            try:
+                resp = self.session.post(self.args.server, json=payload, timeout=self.args.timeout)
+                status = resp.status_code
+            except requests.RequestException as e:
+                status, resp = 'error', None
+                if self.args.verbose:
+                    print(f"va{self.index}: request error: {e}", file=sys.stderr)
+            latency = time.perf_counter() - sent_at
+            accepted = 0
+            if status in (200, 201):
+                try:
+                    accepted = int(resp.json().get('accepted', len(batch)))
+                except (ValueError, AttributeError, TypeError):
+                    accepted = len(batch)
+            self.stats.record(status, latency, len(batch), accepted, behind)
+            if status in (429, 503) and not self.args.no_retry:
+                time.sleep(parse_retry_after(resp.headers.get('Retry-After')))
+                continue
+            return
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay recorded sensor data into the ingest endpoint')
+    parser.add_argument('recordings', nargs='+', help='CSV (.csv, .csv.gz, .csv.xz) or NDJSON (.ndjson, .jsonl) files')
+    parser.add_argument('--server', default='http://localhost:5000/api/forward-serial', help='Ingest endpoint URL')
+    parser.add_argument('--token', action='append', default=[],
+                        help='Agent token (DEVICE_AGENT_TOKEN or one of DEVICE_AGENT_TOKENS); repeatable')
+    parser.add_argument('--agents', type=int, default=1, help='Concurrent virtual agents')
+    parser.add_argument('--speed', type=float, default=1.0, help='Playback speed (1 = recorded pace, 0 = as fast as possible)')
+    parser.add_argument('--batch-size', type=int, default=100, help='Max records per request')
+    parser.add_argument('--flush-interval', type=float, default=1.0, help='Max seconds a record waits for its batch')
+    parser.add_argument('--timestamps', choices=('now', 'original'), default='now',
+                        help='Send the time of sending, or the recorded timestamps')
+    parser.add_argument('--limit', type=int, default=None, help='Replay only the first N records')
+    parser.add_argument('--duration', type=float, default=None, help='Stop after N seconds')
+    parser.add_argument('--timeout', type=float, default=10.0, help='HTTP timeout per request')
+    parser.add_argument('--no-retry', action='store_true', help='Count 429/503 answers instead of waiting and resending')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    parser.add_argument('--verbose', action='store_true', help='Print request errors as they happen')
+    args = parser.parse_args()
+
+    tokens = args.token or [os.getenv('DEVICE_AGENT_TOKEN', '')]
+    records = load_recording(args.recordings, args.limit)
+    if not records:
+        parser.error('no records found in the given files')
+
+    span = records[-1][0]
+    print(f"Replaying {len(records)} record(s) spanning {span:.0f}s with {args.agents} agent(s) "
+          f"at {'max' if not args.speed else f'{args.speed:g}x'} speed -> {args.server}", file=sys.stderr)
+
+    stats = ReplayStats()
+    started = time.monotonic()
+    agents = [VirtualAgent(i + 1, records, args, tokens[i % len(tokens)], stats, started) for i in range(args.agents)]
+    for agent in agents:
+        agent.start()
+    try:
+        while any(agent.is_alive() for agent in agents):
+            if args.duration and time.monotonic() - started >= args.duration:
+                break
+            time.sleep(0.2)
+    except KeyboardInterrupt:
+        print("Stopping...", file=sys.stderr)
+    for agent in agents:
+        agent.running = False
+    for agent in agents:
+        agent.join(timeout=args.timeout)
+
+    report = stats.report(time.monotonic() - started, args.agents, args.speed)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    latency = report['latency_ms']
+    print(f"Sent {report['records_sent']} record(s) in {report['requests']} request(s) over {report['elapsed_s']}s")
+    print(f"Throughput: {report['records_per_s']} records/s, {report['requests_per_s']} requests/s")
+    print(f"Latency ms: p50 {latency['p50']}  p90 {latency['p90']}  p99 {latency['p99']}  max {latency['max']}")
+    print(f"Statuses: {report['statuses']}  (throttled {report['throttled']}, shed {report['shed']})")
+    print(f"Errors: {report['errors']} ({report['error_rate']:.2%} of requests)")
+    if args.speed:
+        print(f"Max behind schedule: {report['max_behind_s']}s")
+
+
+if __name__ == '__main__':
+    main()
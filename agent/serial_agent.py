@@ -1,65 +1,362 @@
 #!/usr/bin/env python3
 """
 Local Serial Agent
-Reads lines from a serial port and POSTS them to the app's `/api/forward-serial` endpoint.
+Reads lines from one or more serial ports and POSTS them to the app's `/api/forward-serial` endpoint.
 Usage:
     python agent/serial_agent.py --port COM3 --baud 9600 --server http://localhost:5000/api/forward-serial --token mytoken
+    python agent/serial_agent.py --port "/dev/ttyUSB*" --port /dev/ttyACM0 --server ... --token ...
+
+--port may be repeated and may be a glob; matching ports that appear later
+(hotplug) are picked up, and unplugged ones are reopened when they return.
+All ports share one upload thread and one HTTP connection pool, and lines
+from different ports are sent together in batches.
+
+Edge mode (--edge-window N) parses numeric fields and sends one
+count/min/max/mean/last summary per port every N seconds instead of every
+line; lines matching a --threshold (e.g. "temp>30") still go through raw.
+--delta sends raw readings as differences from the previous reading, with
+a full keyframe every --keyframe-every records.
 
 The receiving server must set the environment variable `DEVICE_AGENT_TOKEN` to match `--token`.
 """
 import argparse
+import fnmatch
+import glob
+import json
+import operator
+import queue
+import re
+import threading
 import time
-import sys
+import uuid
+from datetime import datetime
 import requests
 
 try:
     import serial
+    import serial.tools.list_ports
 except Exception as e:
     print("pyserial is required. Install with: pip install pyserial")
     raise
 
 
+NUMBER_PAIR = re.compile(r'([A-Za-z_]\w*)\s*[:=]\s*(-?\d+(?:\.\d+)?)')
+THRESHOLD_PATTERN = re.compile(r'^\s*(\w+)\s*(>=|<=|>|<)\s*(-?\d+(?:\.\d+)?)\s*$')
+THRESHOLD_OPS = {'>': operator.gt, '<': operator.lt, '>=': operator.ge, '<=': operator.le}
+# Device counters, not measurements
+SKIP_FIELDS = ('timestamp', 'ts', 'seq')
+DELTA_PRECISION = 6
+# Uploader.post() results
+SENT, RETRY, REJECTED = 'sent', 'retry', 'rejected'
+
+
+def parse_threshold(spec):
+    """'temp>30' -> ('temp', '>', 30.0)"""
+    match = THRESHOLD_PATTERN.match(spec)
+    if not match:
+        raise argparse.ArgumentTypeError(f"invalid threshold '{spec}' (expected e.g. temp>30)")
+    return match.group(1), match.group(2), float(match.group(3))
+
+
+def parse_numeric_fields(line):
+    """Numeric fields of a JSON object line or 'key=value' text, else None"""
+    if line.startswith('{'):
+        try:
+            data = json.loads(line)
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            values = {k: v for k, v in data.items()
+                      if isinstance(v, (int, float)) and not isinstance(v, bool) and k not in SKIP_FIELDS}
+            return values or None
+    values = {k: float(v) for k, v in NUMBER_PAIR.findall(line) if k not in SKIP_FIELDS}
+    return values or None
+
+
+class EdgeWindow:
+    """count/min/max/mean/last per numeric field over one time window"""
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.reset()
+
+    def reset(self):
+        self.started = time.time()
+        self.count = 0
+        self.fields = {}
+
+    def add(self, values):
+        self.count += 1
+        for name, value in values.items():
+            stats = self.fields.get(name)
+            if stats is None:
+                self.fields[name] = [1, value, value, value, value]
+            else:
+                stats[0] += 1
+                stats[1] += value
+                stats[2] = min(stats[2], value)
+                stats[3] = max(stats[3], value)
+                stats[4] = value
+
+    def due(self):
+        return time.time() - self.started >= self.seconds
+
+    def summary(self):
+        """Summary dict for the window (None if empty), then start the next one"""
+        if not self.count:
+            self.reset()
+            return None
+        summary = {'edge': 'window', 'window_s': self.seconds, 'count': self.count}
+        for name, (count, total, low, high, last) in self.fields.items():
+            # The plain field name carries the mean so charts keep working
+            summary[name] = round(total / count, DELTA_PRECISION)
+            summary[f'{name}_min'] = low
+            summary[f'{name}_max'] = high
+            summary[f'{name}_last'] = last
+        self.reset()
+        return summary
+
+
+class DeltaEncoder:
+    """Changed fields only, as differences from what the server last rebuilt"""
+    def __init__(self, keyframe_every=50):
+        self.keyframe_every = keyframe_every
+        self.base = None
+        self.since_key = 0
+        self.keyframe_requested = False
+
+    def request_keyframe(self):
+        """The server lost track of this port; make the next record a keyframe"""
+        self.keyframe_requested = True
+
+    def encode(self, values):
+        """(encoding, dict) for the next record"""
+        # Fields that appeared or disappeared cannot be expressed as a delta
+        if (self.base is None or self.keyframe_requested or self.since_key >= self.keyframe_every
+                or set(values) != set(self.base)):
+            self.base = dict(values)
+            self.since_key = 0
+            self.keyframe_requested = False
+            return 'key', dict(values)
+        self.since_key += 1
+        delta = {}
+        for name, value in values.items():
+            diff = round(value - self.base[name], DELTA_PRECISION)
+            if diff:
+                delta[name] = diff
+                # Track the value the server will rebuild, so rounding never drifts
+                self.base[name] = round(self.base[name] + diff, DELTA_PRECISION)
+        return 'delta', delta
+
+
+def expand_ports(patterns):
+    """Port names matching PATTERNS: plain names, filesystem globs or COM* style globs"""
+    found = set()
+    listed = [p.device for p in serial.tools.list_ports.comports()]
+    for pattern in patterns:
+        if not glob.has_magic(pattern):
+            found.add(pattern)
+            continue
+        found.update(glob.glob(pattern))
+        found.update(device for device in listed if fnmatch.fnmatch(device, pattern))
+    return sorted(found)
+
+
+class PortReader(threading.Thread):
+    """Reads one serial port into the shared upload queue until it fails"""
+    def __init__(self, port, baud, outbox, edge_window=0, thresholds=(), delta=False, keyframe_every=50):
+        super().__init__(daemon=True)
+        self.port = port
+        self.baud = baud
+        self.outbox = outbox
+        self.running = True
+        self.lines = 0
+        self.window = EdgeWindow(edge_window) if edge_window else None
+        self.thresholds = thresholds
+        self.delta = DeltaEncoder(keyframe_every) if delta else None
+        # Every record gets the next seq within this stream, so the server can
+        # drop records of a resent batch and spot gaps; reopening starts a new stream
+        self.stream = uuid.uuid4().hex[:12]
+        self.seq = 0
+
+    def run(self):
+        try:
+            ser = serial.Serial(self.port, self.baud, timeout=1)
+        except Exception as e:
+            print(f"Failed to open serial port {self.port}: {e}")
+            return
+
+        print(f"Reading {self.port}@{self.baud}")
+        try:
+            while self.running:
+                line = ser.readline().decode('utf-8', errors='replace').strip()
+                if line:
+                    self.lines += 1
+                    self.handle_line(line)
+                if self.window and self.window.due():
+                    summary = self.window.summary()
+                    if summary:
+                        self.submit(json.dumps(summary))
+        except Exception as read_err:
+            # Unplugged adapters end up here; the agent reopens the port if it comes back
+            print(f"Read error on {self.port}: {read_err}")
+        finally:
+            ser.close()
+
+    def handle_line(self, line):
+        values = parse_numeric_fields(line) if (self.window or self.delta) else None
+        if values is None:
+            # Banners, replies and free text always go through as-is
+            self.submit(line)
+            return
+        if self.window:
+            self.window.add(values)
+            if not self.crosses_threshold(values):
+                return
+        if self.delta:
+            encoding, encoded = self.delta.encode(values)
+            self.submit(json.dumps(encoded), encoding)
+        else:
+            self.submit(line)
+
+    def crosses_threshold(self, values):
+        for name, op, limit in self.thresholds:
+            if name in values and THRESHOLD_OPS[op](values[name], limit):
+                return True
+        return False
+
+    def submit(self, line, encoding=None):
+        # Counted even if the queue is full, so the server sees the gap
+        self.seq += 1
+        record = {'port': self.port, 'data': line, 'ts': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                  'seq': self.seq, 'stream': self.stream}
+        if encoding:
+            record['enc'] = encoding
+        try:
+            self.outbox.put_nowait(record)
+        except queue.Full:
+            print(f"Upload queue full, dropping line from {self.port}")
+
+
+def parse_retry_after(value, default=5.0):
+    """Seconds from a Retry-After header (delay-seconds form), capped at a minute"""
+    try:
+        return min(max(float(value), 0.5), 60.0)
+    except (TypeError, ValueError):
+        return default
+
+
+class Uploader(threading.Thread):
+    """Single upload pipeline: batches records from every port over one session"""
+    def __init__(self, url, token, outbox, batch_size=100, flush_interval=1.0):
+        super().__init__(daemon=True)
+        self.url = url
+        self.outbox = outbox
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.session = requests.Session()
+        self.session.headers['X-DEVICE-AGENT-TOKEN'] = token
+        self.sent = 0
+        self.rejected = 0
+        self.retry_after = None
+        self.running = True
+        # port -> DeltaEncoder, to ask for a keyframe when the server needs one
+        self.encoders = {}
+
+    def run(self):
+        pending = []
+        while self.running or pending:
+            deadline = time.time() + self.flush_interval
+            while len(pending) < self.batch_size:
+                try:
+                    pending.append(self.outbox.get(timeout=max(deadline - time.time(), 0.01)))
+                except queue.Empty:
+                    break
+            result = self.post(pending) if pending else None
+            if result == SENT:
+                self.sent += len(pending)
+                pending = []
+            elif result == REJECTED:
+                self.rejected += len(pending)
+                print(f"Dropped {len(pending)} record(s) the server rejected ({self.rejected} so far)")
+                pending = []
+            elif pending:
+                # Keep the batch and back off; readers keep filling the queue meanwhile
+                time.sleep(self.retry_after or min(self.flush_interval * 2, 5))
+                self.retry_after = None
+
+    def post(self, records):
+        """SENT, RETRY (keep the batch and back off) or REJECTED (resending will not help)"""
+        try:
+            resp = self.session.post(self.url, json={'records': records}, timeout=10)
+            if resp.status_code in (429, 503):
+                # Rate limited or shedding load: wait as long as the server asks, then resend
+                self.retry_after = parse_retry_after(resp.headers.get('Retry-After'))
+                print(f"Server asked to slow down ({resp.status_code}), retrying in {self.retry_after:.0f}s")
+                return RETRY
+            if resp.status_code not in (200, 201):
+                print(f"Server error {resp.status_code}: {resp.text}")
+                # Rejected as a whole (e.g. bad data) - retrying will not help
+                return REJECTED if resp.status_code < 500 else RETRY
+            print(f"Forwarded {len(records)} line(s) from {len(set(r['port'] for r in records))} port(s)")
+            try:
+                resync = resp.json().get('keyframe_needed') or []
+            except ValueError:
+                resync = []
+            for port in resync:
+                if port in self.encoders:
+                    print(f"Server needs a keyframe for {port}")
+                    self.encoders[port].request_keyframe()
+            return SENT
+        except requests.RequestException as re:
+            print(f"Request error: {re}")
+            return RETRY
+
+
 def main():
     parser = argparse.ArgumentParser(description='Local Serial Agent: forward serial lines to server')
-    parser.add_argument('--port', required=True, help='Serial port (e.g., COM3 or /dev/ttyUSB0)')
+    parser.add_argument('--port', required=True, action='append',
+                        help='Serial port or glob (e.g., COM3, /dev/ttyUSB0, "/dev/ttyUSB*"); repeatable')
     parser.add_argument('--baud', type=int, default=9600, help='Baudrate')
     parser.add_argument('--server', required=True, help='Server endpoint URL (e.g. http://localhost:5000/api/forward-serial)')
     parser.add_argument('--token', required=True, help='Agent token to authenticate with server (DEVICE_AGENT_TOKEN)')
+    parser.add_argument('--batch-size', type=int, default=100, help='Max lines per upload request')
+    parser.add_argument('--flush-interval', type=float, default=1.0, help='Max seconds a line waits before upload')
+    parser.add_argument('--rescan-interval', type=float, default=2.0, help='Seconds between hotplug scans')
+    parser.add_argument('--queue-size', type=int, default=10000, help='Lines buffered while the server is unreachable')
+    parser.add_argument('--edge-window', type=float, default=0,
+                        help='Send count/min/max/mean/last per N seconds instead of every reading (0 = off)')
+    parser.add_argument('--threshold', type=parse_threshold, action='append', default=[],
+                        help='In edge mode, forward readings matching e.g. "temp>30" raw; repeatable')
+    parser.add_argument('--delta', action='store_true', help='Delta-encode forwarded readings')
+    parser.add_argument('--keyframe-every', type=int, default=50, help='Full reading every N delta records')
     args = parser.parse_args()
 
-    url = args.server
-    headers = {'X-DEVICE-AGENT-TOKEN': args.token}
-
-    try:
-        ser = serial.Serial(args.port, args.baud, timeout=1)
-    except Exception as e:
-        print(f"Failed to open serial port {args.port}: {e}")
-        sys.exit(1)
+    outbox = queue.Queue(maxsize=args.queue_size)
+    uploader = Uploader(args.server, args.token, outbox, args.batch_size, args.flush_interval)
+    uploader.start()
+    readers = {}
 
-    print(f"Forwarding from {args.port}@{args.baud} -> {url}")
+    print(f"Forwarding from {', '.join(args.port)}@{args.baud} -> {args.server}")
 
     try:
         while True:
-            try:
-                if ser.in_waiting > 0:
-                    line = ser.readline().decode('utf-8', errors='replace').strip()
-                    if line:
-                        payload = {'port': args.port, 'data': line}
-                        try:
-                            resp = requests.post(url, json=payload, headers=headers, timeout=5)
-                            if resp.status_code not in (200, 201):
-                                print(f"Server error {resp.status_code}: {resp.text}")
-                            else:
-                                print(f"Forwarded: {line}")
-                        except requests.RequestException as re:
-                            print(f"Request error: {re}")
-                else:
-                    time.sleep(0.1)
-            except Exception as read_err:
-                print(f"Read/forward error: {read_err}")
-                time.sleep(1)
+            for port in expand_ports(args.port):
+                reader = readers.get(port)
+                if reader is None or not reader.is_alive():
+                    readers[port] = PortReader(port, args.baud, outbox, args.edge_window, args.threshold,
+                                               args.delta, args.keyframe_every)
+                    if readers[port].delta:
+                        uploader.encoders[port] = readers[port].delta
+                    readers[port].start()
+            time.sleep(args.rescan_interval)
+    except KeyboardInterrupt:
+        print("Stopping agent...")
     finally:
-        ser.close()
+        for reader in readers.values():
+            reader.running = False
+        uploader.running = False
+        uploader.join(timeout=args.flush_interval + 10)
+        print(f"Sent {uploader.sent} record(s), {uploader.rejected} rejected by the server")
 
 
 if __name__ == '__main__':
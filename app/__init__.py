@@ -1,3 +1,6 @@
+import time
+_import_started = time.perf_counter()
+
 from flask import Flask
 import os
 from flask_sqlalchemy import SQLAlchemy
@@ -5,34 +8,79 @@ from flask_login import LoginManager
 import secrets
 from flask import session, request, abort
 
+from app.startup import startup_timer, FAST_START
+
+startup_timer.record('import flask/sqlalchemy', time.perf_counter() - _import_started)
+
 db = SQLAlchemy()
 login_manager = LoginManager()
 
 def create_app():
-    app = Flask(__name__)
-    app.config['SECRET_KEY'] = 'super_secure_key_123'
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///users.db'
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    
-    db.init_app(app)
-    login_manager.init_app(app)
-    login_manager.login_view = 'routes.login'
-    login_manager.login_message_category = 'info'
+    with startup_timer.phase('config'):
+        app = Flask(__name__)
+        app.config['SECRET_KEY'] = 'super_secure_key_123'
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///users.db'
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        
+        db.init_app(app)
+        login_manager.init_app(app)
+        login_manager.login_view = 'routes.login'
+        login_manager.login_message_category = 'info'
     
     with app.app_context():
-        # Import models
-        from app.models import User, DeviceConnection
+        with startup_timer.phase('models'):
+            # Import models
+            from app.models import User, DeviceConnection
+            
+            @login_manager.user_loader
+            def load_user(user_id):
+                return User.query.get(int(user_id))
         
-        @login_manager.user_loader
-        def load_user(user_id):
-            return User.query.get(int(user_id))
+        with startup_timer.phase('blueprints'):
+            # Import and register blueprints
+            from app.routes import routes
+            app.register_blueprint(routes)
+            
+            # Requests in flight decide when ingest is shed (see app/admission.py)
+            from app.admission import admission_control
+            admission_control.init_app(app)
+            
+            # Opt-in request profiling (PROFILE_SAMPLE_RATE / PROFILE_SLOW_MS / X-Profile)
+            from app.profiler import request_profiler
+            request_profiler.init_app(app)
         
-        # Import and register blueprints
-        from app.routes import routes
-        app.register_blueprint(routes)
+        with startup_timer.phase('devices'):
+            from app.device_manager import start_scanning_from_env
+            start_scanning_from_env()
         
-        # Create all database tables
+        # Under FAST_START the schema is created by `flask init-db` (a release/migration step)
+        if not FAST_START:
+            with startup_timer.phase('schema'):
+                # Create all database tables
+                db.create_all()
+        
+        # Background retention/compaction of sensor data (ENABLE_RETENTION=true)
+        if os.getenv('ENABLE_RETENTION', 'false').lower() in ('1', 'true', 'yes'):
+            with startup_timer.phase('retention'):
+                from app.storage.retention import retention_service
+                retention_service.start()
+    
+    @app.cli.command('init-db')
+    def init_db():
+        """Create database tables"""
         db.create_all()
+        print("✅ Database tables created")
+    
+    @app.route('/healthz')
+    def healthz():
+        """Readiness probe; also reports startup timings, ingest admission, analytics pool and writer counters"""
+        from app.admission import admission_control
+        from app.ml_engine.executor import analytics_executor
+        from app.storage.writer import group_writer
+        return {'status': 'ok', 'startup': startup_timer.report(), 'ingest': admission_control.stats(),
+                'analytics': analytics_executor.stats(), 'writer': group_writer.stats()}
+    
+    print(startup_timer.summary())
 
     # CSRF protection removed to avoid blocking local web app requests
     # If you need CSRF protection later, reintroduce middleware or use Flask-WTF's CSRFProtect.
@@ -0,0 +1,153 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g
+
+
+def env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        print(f"Invalid {name}, using {default}")
+        return float(default)
+
+
+class TokenBucket:
+    """RATE tokens per second, holding at most BURST (negative while in debt)"""
+    def __init__(self, rate, burst, now=None):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now or time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, cost):
+        """Seconds until COST tokens are available (0 if they are now)
+
+        Costs above BURST only need a full bucket; charging them in full
+        then leaves the bucket in debt, which later requests wait out.
+        """
+        missing = min(cost, self.burst) - self.tokens
+        return max(missing, 0) / self.rate
+
+
+class RateLimiter:
+    """Token buckets by key (agent token, port), created on first use
+
+    Idle buckets are full anyway, so only the MAX_KEYS most recently used
+    are kept.
+    """
+    MAX_KEYS = 10000
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = OrderedDict()
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def bucket(self, key, now):
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.burst, now)
+            self.buckets[key] = bucket
+            while len(self.buckets) > self.MAX_KEYS:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+            bucket.refill(now)
+        return bucket
+
+
+class AdmissionControl:
+    """Admission for /api/forward-serial, so ingest cannot starve the dashboard
+
+    Two layers, both in memory:
+    - load shedding: at most INGEST_MAX_IN_FLIGHT ingest requests at once, and
+      none while INGEST_SHED_IN_FLIGHT requests of any kind are running
+      (answered with 503). Interactive requests are never shed.
+    - rate limits: token buckets per agent token (INGEST_TOKEN_RATE/_BURST)
+      and per port (INGEST_PORT_RATE/_BURST), charged one token per record
+      (answered with 429). A batch is charged all-or-nothing, and always
+      in full, so large batches cannot get past the rate.
+    Both responses carry Retry-After, which the agent waits out.
+    """
+    def __init__(self):
+        self.token_limits = RateLimiter(env_float('INGEST_TOKEN_RATE', 200), env_float('INGEST_TOKEN_BURST', 2000))
+        self.port_limits = RateLimiter(env_float('INGEST_PORT_RATE', 100), env_float('INGEST_PORT_BURST', 1000))
+        self.max_ingest = int(env_float('INGEST_MAX_IN_FLIGHT', 4))
+        self.shed_at = int(env_float('INGEST_SHED_IN_FLIGHT', 16))
+        self.in_flight = 0
+        self.ingest_in_flight = 0
+        self.shed = 0
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+    def init_app(self, app):
+        """Count every request in flight, the signal for shedding ingest"""
+        app.before_request(self._enter)
+        app.teardown_request(self._leave)
+
+    def _enter(self):
+        with self.lock:
+            self.in_flight += 1
+        g.admission_counted = True
+
+    def _leave(self, exc=None):
+        if g.pop('admission_counted', False):
+            with self.lock:
+                self.in_flight -= 1
+
+    def enter_ingest(self):
+        """Take an ingest slot; returns None, or seconds to wait if shedding"""
+        with self.lock:
+            busy = self.in_flight > self.shed_at
+            if busy or self.ingest_in_flight >= self.max_ingest:
+                self.shed += 1
+                # Longer back-off when interactive traffic is what fills the server
+                return 2.0 if busy else 1.0
+            self.ingest_in_flight += 1
+            return None
+
+    def leave_ingest(self):
+        with self.lock:
+            self.ingest_in_flight -= 1
+
+    def admit(self, token_key, port_counts):
+        """Charge a batch to its token and ports; returns 0, or seconds until it would fit"""
+        now = time.monotonic()
+        with self.lock:
+            charges = []
+            if self.token_limits.enabled:
+                charges.append((self.token_limits.bucket(token_key, now), sum(port_counts.values())))
+            if self.port_limits.enabled:
+                for port, count in port_counts.items():
+                    charges.append((self.port_limits.bucket((token_key, port), now), count))
+
+            wait = max([bucket.wait_for(cost) for bucket, cost in charges] or [0])
+            if wait > 0:
+                self.throttled += 1
+                return wait
+            for bucket, cost in charges:
+                bucket.tokens -= cost
+            return 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                'in_flight': self.in_flight,
+                'ingest_in_flight': self.ingest_in_flight,
+                'shed': self.shed,
+                'throttled': self.throttled
+            }
+
+
+# Global instance
+admission_control = AdmissionControl()
@@ -0,0 +1,136 @@
+import binascii
+import struct
+
+# Frame (before COBS): header | payload | crc16, terminated on the wire by 0x00
+#   header  <BBHIB: kind, sensor id, sequence, device millis, value count
+#   payload count x float32 for FRAME_READING, UTF-8 text for FRAME_TEXT
+#   crc     CRC-16/CCITT-FALSE over header + payload
+FRAME_READING = 0xA1
+FRAME_TEXT = 0xA2
+FRAME_HEADER = struct.Struct('<BBHIB')
+FRAME_CRC = struct.Struct('<H')
+FRAME_DELIMITER = b'\x00'
+BINARY_CAPABILITY = 'bin1'
+
+
+def crc16(data):
+    """CRC-16/CCITT-FALSE (poly 0x1021, init 0xFFFF), same as the sketch"""
+    return binascii.crc_hqx(data, 0xFFFF)
+
+
+def cobs_encode(data):
+    """Consistent Overhead Byte Stuffing: output contains no zero bytes"""
+    out = bytearray()
+    for block in data.split(b'\x00'):
+        # Runs longer than 254 bytes are split into 0xFF-coded chunks
+        while len(block) >= 254:
+            out.append(0xFF)
+            out += block[:254]
+            block = block[254:]
+        out.append(len(block) + 1)
+        out += block
+    return bytes(out)
+
+
+def cobs_decode(data):
+    out = bytearray()
+    index = 0
+    while index < len(data):
+        code = data[index]
+        index += 1
+        if code == 0 or index + code - 1 > len(data):
+            raise ValueError('Invalid COBS block')
+        out += data[index:index + code - 1]
+        index += code - 1
+        if code < 0xFF and index < len(data):
+            out.append(0)
+    return bytes(out)
+
+
+def encode_frame(sensor_id, sequence, millis, values=(), text=None):
+    """Build one wire frame (COBS encoded, delimiter included)"""
+    if text is not None:
+        payload = text.encode('utf-8')
+        header = FRAME_HEADER.pack(FRAME_TEXT, sensor_id, sequence & 0xFFFF, millis & 0xFFFFFFFF, 0)
+    else:
+        payload = struct.pack(f'<{len(values)}f', *values)
+        header = FRAME_HEADER.pack(FRAME_READING, sensor_id, sequence & 0xFFFF, millis & 0xFFFFFFFF, len(values))
+    body = header + payload
+    return cobs_encode(body + FRAME_CRC.pack(crc16(body))) + FRAME_DELIMITER
+
+
+class FrameDecoder:
+    """Per-device decoder for binary frames
+
+    Field names come from the device's "SCHEMA <id>: name,name" lines, so a
+    decoded reading is the same dict the text protocol's JSON line gives.
+    """
+    def __init__(self):
+        self.schemas = {}
+        self.last_sequence = {}
+        self.frames = 0
+        self.errors = 0
+        self.dropped = 0
+
+    def add_schema(self, line):
+        """Parse 'SCHEMA 1: temp,humidity,heart_rate'; False if LINE isn't one"""
+        if not line.startswith('SCHEMA '):
+            return False
+        try:
+            sensor_id, names = line[7:].split(':', 1)
+            self.schemas[int(sensor_id)] = [n.strip() for n in names.split(',') if n.strip()]
+        except ValueError:
+            return False
+        return True
+
+    def decode(self, raw):
+        """Decode one delimited frame -> ('reading', dict) / ('text', str) / None"""
+        raw = raw.rstrip(FRAME_DELIMITER)
+        if not raw:
+            return None
+        try:
+            body = cobs_decode(raw)
+        except ValueError:
+            self.errors += 1
+            return None
+        if len(body) < FRAME_HEADER.size + FRAME_CRC.size:
+            self.errors += 1
+            return None
+
+        payload_end = len(body) - FRAME_CRC.size
+        (crc,) = FRAME_CRC.unpack_from(body, payload_end)
+        if crc != crc16(body[:payload_end]):
+            self.errors += 1
+            return None
+
+        kind, sensor_id, sequence, millis, count = FRAME_HEADER.unpack_from(body)
+        payload = body[FRAME_HEADER.size:payload_end]
+        self.frames += 1
+
+        if kind == FRAME_TEXT:
+            return 'text', payload.decode('utf-8', errors='replace')
+        if kind != FRAME_READING or len(payload) != count * 4:
+            self.errors += 1
+            return None
+        self._track_sequence(sensor_id, sequence)
+
+        values = struct.unpack(f'<{count}f', payload)
+        names = self.schemas.get(sensor_id) or [f'value{i}' for i in range(count)]
+        reading = {'sensor': f'bin{sensor_id}'}
+        for name, value in zip(names, values):
+            reading[name] = round(value, 4)
+        reading['timestamp'] = millis
+        reading['seq'] = sequence
+        return 'reading', reading
+
+    def _track_sequence(self, sensor_id, sequence):
+        last = self.last_sequence.get(sensor_id)
+        if last is not None:
+            gap = (sequence - last - 1) & 0xFFFF
+            # Large gaps are a device reset, not loss
+            if 0 < gap < 1000:
+                self.dropped += gap
+        self.last_sequence[sensor_id] = sequence
+
+    def stats(self):
+        return {'frames': self.frames, 'errors': self.errors, 'dropped': self.dropped}
@@ -0,0 +1,67 @@
+import os
+import threading
+import time
+
+
+class ChangeTracker:
+    """Monotonic change sequence for devices and the port inventory
+
+    Every device update, connect/disconnect and inventory change takes the
+    next sequence number. Pollers send back the last sequence they saw and
+    get either nothing (304) or just the devices that changed since then.
+    """
+    def __init__(self):
+        self.sequence = 0
+        self.device_seq = {}
+        self.removed_seq = {}
+        self.inventory_seq = 0
+        self.inventory_key = None
+        # Sequences are per process, so tags carry a boot id to stay unique across workers
+        self.boot_id = f"{os.getpid():x}{int(time.time()):x}"
+        self.lock = threading.Lock()
+
+    def bump_device(self, port_name):
+        with self.lock:
+            self.sequence += 1
+            self.device_seq[port_name] = self.sequence
+            self.removed_seq.pop(port_name, None)
+            return self.sequence
+
+    def remove_device(self, port_name):
+        with self.lock:
+            self.sequence += 1
+            self.device_seq.pop(port_name, None)
+            self.removed_seq[port_name] = self.sequence
+            return self.sequence
+
+    def update_inventory(self, ports):
+        """Bump the inventory sequence only if the scanned port list changed"""
+        key = tuple(sorted((p['device'], p['status']) for p in ports))
+        with self.lock:
+            if key != self.inventory_key:
+                self.inventory_key = key
+                self.sequence += 1
+                self.inventory_seq = self.sequence
+            return self.inventory_seq
+
+    def devices_version(self):
+        with self.lock:
+            return max([0] + list(self.device_seq.values()) + list(self.removed_seq.values()))
+
+    def current(self):
+        with self.lock:
+            return self.sequence
+
+    def changed_since(self, since):
+        """(changed ports, removed ports) with a sequence greater than SINCE"""
+        with self.lock:
+            changed = [port for port, seq in self.device_seq.items() if seq > since]
+            removed = [port for port, seq in self.removed_seq.items() if seq > since]
+            return changed, removed
+
+    def etag(self, *versions):
+        return f"{self.boot_id}-" + "-".join(str(v) for v in versions)
+
+
+# Global instance
+change_tracker = ChangeTracker()
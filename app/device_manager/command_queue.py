@@ -0,0 +1,200 @@
+import itertools
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+# Device replies: "COMMAND_RESPONSE: text" (in order) or "COMMAND_RESPONSE[17]: text" (tagged)
+REPLY_PATTERN = re.compile(r'^COMMAND_RESPONSE(?:\[(\d+)\])?:\s?(.*)$')
+# Banner a device prints to advertise optional features, e.g. "CAPS: cmd_id"
+CAPS_PATTERN = re.compile(r'^CAPS:\s*(.*)$')
+
+_command_ids = itertools.count(1)
+
+
+class PendingCommand:
+    """One queued command; `future` resolves with the device reply text"""
+    def __init__(self, port_name, command, timeout=5.0, expect_reply=True):
+        self.id = next(_command_ids)
+        self.port = port_name
+        self.command = command
+        self.timeout = timeout
+        self.expect_reply = expect_reply
+        self.created = time.time()
+        self.sent_at = None
+        self.finished_at = None
+        self.status = 'queued'
+        self.reply = None
+        self.error = None
+        self.future = Future()
+        self.lock = threading.Lock()
+
+    def finish(self, status, reply=None, error=None):
+        """Resolve the command; the first caller wins (reader thread vs cancel_all)"""
+        with self.lock:
+            if self.future.done():
+                return
+            self.status = status
+            self.reply = reply
+            self.error = error
+            self.finished_at = time.time()
+            if error:
+                self.future.set_exception(TimeoutError(error) if status == 'timeout' else RuntimeError(error))
+            else:
+                self.future.set_result(reply)
+
+    def to_dict(self):
+        return {
+            'command_id': self.id,
+            'port': self.port,
+            'command': self.command,
+            'status': self.status,
+            'reply': self.reply,
+            'error': self.error,
+            'latency_ms': round((self.finished_at - self.created) * 1000, 1) if self.finished_at else None
+        }
+
+
+class DeviceCommandQueue:
+    """Outbound commands for one serial device, driven by its reader thread
+
+    Web requests only enqueue; the reader thread writes queued commands
+    between reads, so the port is never touched from two threads. Up to
+    MAX_IN_FLIGHT commands are pipelined. Replies are matched by command id
+    when the device advertised "CAPS: cmd_id", otherwise in send order.
+    """
+    MAX_IN_FLIGHT = 4
+
+    def __init__(self, port_name, max_in_flight=MAX_IN_FLIGHT):
+        self.port_name = port_name
+        self.max_in_flight = max_in_flight
+        self.outbox = queue.Queue()
+        self.in_flight = deque()
+        self.tagged = False
+        self.capabilities = set()
+        self.lock = threading.Lock()
+
+    def submit(self, command, timeout=5.0, expect_reply=True):
+        pending = PendingCommand(self.port_name, command, timeout, expect_reply)
+        self.outbox.put(pending)
+        return pending
+
+    def pump(self, ser):
+        """Write queued commands (reader thread only); returns how many were sent"""
+        self.expire()
+        sent = 0
+        while True:
+            with self.lock:
+                if len(self.in_flight) >= self.max_in_flight:
+                    break
+            try:
+                pending = self.outbox.get_nowait()
+            except queue.Empty:
+                break
+            if pending.future.done():
+                continue
+
+            line = f"@{pending.id} {pending.command}" if self.tagged else pending.command
+            try:
+                ser.write(f"{line}\n".encode('utf-8'))
+            except Exception as e:
+                pending.finish('error', error=f'Write failed: {e}')
+                continue
+            pending.sent_at = time.time()
+            sent += 1
+            if pending.expect_reply:
+                pending.status = 'sent'
+                with self.lock:
+                    self.in_flight.append(pending)
+            else:
+                pending.finish('sent')
+        return sent
+
+    def handle_line(self, line):
+        """Consume LINE if it is a command reply or capability banner"""
+        caps = CAPS_PATTERN.match(line)
+        if caps:
+            self.capabilities = set(caps.group(1).replace(',', ' ').split())
+            self.tagged = 'cmd_id' in self.capabilities
+            return True
+
+        match = REPLY_PATTERN.match(line)
+        if not match:
+            return False
+        command_id, reply = match.group(1), match.group(2)
+
+        with self.lock:
+            pending = None
+            if command_id is not None:
+                for candidate in self.in_flight:
+                    if candidate.id == int(command_id):
+                        pending = candidate
+                        break
+                if pending is not None:
+                    self.in_flight.remove(pending)
+            elif self.in_flight:
+                # Untagged devices answer in order
+                pending = self.in_flight.popleft()
+
+        if pending is not None:
+            pending.finish('done', reply=reply)
+        return True
+
+    def expire(self, now=None):
+        """Time out overdue commands
+
+        In ordered mode a timed-out command keeps its slot for one more
+        timeout period, so a late reply is discarded rather than being
+        handed to the next command.
+        """
+        now = now or time.time()
+        # Timeouts differ per command, so any queued command may be overdue
+        with self.outbox.mutex:
+            overdue = [pending for pending in self.outbox.queue if now - pending.created > pending.timeout]
+            for pending in overdue:
+                self.outbox.queue.remove(pending)
+        for pending in overdue:
+            pending.finish('timeout', error='Timed out waiting to be sent')
+
+        with self.lock:
+            for pending in list(self.in_flight):
+                age = now - pending.created
+                if age > pending.timeout:
+                    pending.finish('timeout', error='No reply from device')
+                    if self.tagged or age > 2 * pending.timeout:
+                        self.in_flight.remove(pending)
+
+    def cancel_all(self, reason='Device disconnected'):
+        while True:
+            try:
+                self.outbox.get_nowait().finish('error', error=reason)
+            except queue.Empty:
+                break
+        with self.lock:
+            for pending in self.in_flight:
+                pending.finish('error', error=reason)
+            self.in_flight.clear()
+
+
+class CommandRegistry:
+    """Recent commands by id, for polling"""
+    def __init__(self, max_commands=1000):
+        self.commands = OrderedDict()
+        self.max_commands = max_commands
+        self.lock = threading.Lock()
+
+    def add(self, pending):
+        with self.lock:
+            self.commands[pending.id] = pending
+            while len(self.commands) > self.max_commands:
+                self.commands.popitem(last=False)
+
+    def get(self, command_id):
+        with self.lock:
+            return self.commands.get(command_id)
+
+
+# Global instance
+command_registry = CommandRegistry()
@@ -0,0 +1,122 @@
+import json
+import threading
+
+# Decimal places kept when rebuilding values, matching the agent's encoder
+DELTA_PRECISION = 6
+
+
+class DeltaDecoder:
+    """Rebuilds delta-encoded agent records into full JSON lines, drops resent ones
+
+    The agent sends a keyframe ({"enc": "key"}) with every field, then only
+    the fields that changed, as differences from the previous value
+    ({"enc": "delta"}). Every record from an agent port, raw or encoded,
+    carries a "seq" that grows by one per record and a "stream" id that
+    changes whenever the port is reopened, so records of a batch resent
+    after a lost response are recognised as duplicates and not stored twice.
+    State is kept per (user, port) in this process; a delta that cannot be
+    rebuilt (no keyframe seen, e.g. after a server restart, or a gap in seq)
+    is dropped and reported as needing a keyframe, which the agent sends next.
+
+    A request decodes through begin(); nothing it decodes is kept until
+    commit(), so a batch the server failed to store decodes again on resend.
+    """
+    def __init__(self):
+        # (user, port) -> (stream, last seq, base values or None)
+        self.state = {}
+        self.lock = threading.Lock()
+
+    def begin(self):
+        """DecodeBatch for one request's records"""
+        return DecodeBatch(self)
+
+    def decode(self, key, encoding, data_line, seq=None, stream=None):
+        """Decode one record and keep the result right away"""
+        batch = self.begin()
+        result = batch.decode(key, encoding, data_line, seq, stream)
+        batch.commit()
+        return result
+
+    def apply(self, updates):
+        with self.lock:
+            for key, new in updates.items():
+                current = self.state.get(key)
+                # A slow older request must not rewind what a newer one stored
+                if (current is not None and current[0] == new[0] and current[1] is not None
+                        and (new[1] is None or new[1] <= current[1])):
+                    continue
+                self.state[key] = new
+
+
+class DecodeBatch:
+    """One request's view of the decoder: sees its own records, keeps nothing until commit()"""
+    def __init__(self, decoder):
+        self.decoder = decoder
+        self.pending = {}
+
+    def lookup(self, key):
+        if key in self.pending:
+            return self.pending[key]
+        with self.decoder.lock:
+            return self.decoder.state.get(key)
+
+    def decode(self, key, encoding, data_line, seq=None, stream=None):
+        """(full line or None, reason) for DATA_LINE
+
+        reason is None when the line is to be stored, 'duplicate' for a
+        record already stored and 'keyframe' when the agent has to send a
+        keyframe.
+        """
+        encoded = encoding in ('key', 'delta')
+        if not encoded and seq is None:
+            # Unsequenced raw lines (older agents, replays) have nothing to track
+            return data_line, None
+        values = None
+        if encoded:
+            try:
+                values = json.loads(data_line)
+            except ValueError:
+                return None, 'keyframe'
+            if not isinstance(values, dict):
+                return None, 'keyframe'
+
+        state = self.lookup(key)
+        same_stream = state is not None and state[0] == stream
+        last_seq = state[1] if same_stream else None
+        gap = False
+        if seq is not None and last_seq is not None:
+            if seq <= last_seq:
+                return None, 'duplicate'
+            # Records went missing in between; the base is no longer what the agent assumes
+            gap = seq != last_seq + 1
+        seen = seq if seq is not None else last_seq
+        base = state[2] if same_stream and not gap else None
+
+        if encoding == 'key':
+            self.pending[key] = (stream, seen, dict(values))
+            return data_line, None
+        if encoding != 'delta':
+            self.pending[key] = (stream, seen, base)
+            return data_line, None
+        if base is None:
+            self.pending[key] = (stream, seen, None)
+            return None, 'keyframe'
+        base = dict(base)
+        for name, value in values.items():
+            previous = base.get(name)
+            if isinstance(value, (int, float)) and isinstance(previous, (int, float)):
+                base[name] = round(previous + value, DELTA_PRECISION)
+            else:
+                base[name] = value
+        self.pending[key] = (stream, seen, base)
+        return json.dumps(base), None
+
+    def commit(self, keys=None):
+        """Keep the decoded state of KEYS (default: every key in the batch)"""
+        if keys is None:
+            keys = list(self.pending)
+        self.decoder.apply({key: self.pending[key] for key in keys if key in self.pending})
+
+
+# Global instance
+delta_decoder = DeltaDecoder()
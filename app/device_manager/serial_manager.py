@@ -3,20 +3,51 @@ import serial.tools.list_ports
 import threading
 import time
 import json
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
+from .change_tracker import change_tracker
+from .command_queue import DeviceCommandQueue, command_registry
+from .binary_frames import FrameDecoder, FRAME_DELIMITER, BINARY_CAPABILITY
+
+# Baud rates tried by autodetection, most common first
+DETECT_BAUDRATES = (9600, 115200, 57600, 38400, 19200)
+# Lines sampled per baud rate, and how long each read may wait
+DETECT_SAMPLE_LINES = 3
+DETECT_READ_TIMEOUT = 1
+# Switch devices that offer binary frames over to them
+BINARY_FRAMES = os.getenv('SERIAL_BINARY_FRAMES', 'true').lower() in ('1', 'true', 'yes')
 
 class SerialDeviceManager:
+    SCAN_WORKERS = int(os.getenv('SCAN_WORKERS', '8'))
+    PROBE_TIMEOUT = float(os.getenv('SCAN_PROBE_TIMEOUT', '2'))
+    # Worst case of detect_port_settings (every rate sampled in full), plus time to open the port
+    DETECT_TIMEOUT = float(os.getenv('SCAN_DETECT_TIMEOUT',
+                                     len(DETECT_BAUDRATES) * DETECT_SAMPLE_LINES * DETECT_READ_TIMEOUT + 1))
+    
     def __init__(self):
         self.connected_devices = {}
         self.available_ports = []
         self.serial_threads = {}
         self.is_running = False
+        self.last_scan = 0
+        self.probe_pool = None
+        self.probes = {}
+        self.detected = {}
+        self.scan_lock = threading.Lock()
         
-    def scan_ports(self):
-        """Scan all available serial ports"""
-        self.available_ports = []
+    def scan_ports(self, detect=False):
+        """Scan all available serial ports
+
+        Ports are probed concurrently on a bounded pool, so a scan takes about
+        as long as the slowest port (capped at PROBE_TIMEOUT). Ports we already
+        hold open are not probed. With DETECT, each free port is also sampled
+        for its baud rate and line protocol.
+        """
+        available_ports = []
         ports = serial.tools.list_ports.comports()
         
+        futures = {}
         for port in ports:
             port_info = {
                 'device': port.device,
@@ -25,12 +56,135 @@ class SerialDeviceManager:
                 'manufacturer': port.manufacturer,
                 'product': port.product,
                 'interface': port.interface,
-                'status': self.check_port_status(port.device)
+                'status': 'connected' if port.device in self.connected_devices else None
             }
-            self.available_ports.append(port_info)
+            available_ports.append(port_info)
+            if port_info['status'] is None:
+                futures[port.device] = self._submit_probe(port.device, detect)
+        
+        pending = [f for f in futures.values() if f is not None]
+        if pending:
+            wait(pending, timeout=self.DETECT_TIMEOUT if detect else self.PROBE_TIMEOUT)
         
+        for port_info in available_ports:
+            if port_info['status'] is not None:
+                continue
+            future = futures.get(port_info['device'])
+            if future is None or not future.done():
+                # A hung adapter only costs its own slot, not the whole scan
+                port_info['status'] = 'timeout'
+                continue
+            try:
+                result = future.result()
+            except Exception:
+                result = {'status': 'busy'}
+            port_info['status'] = result['status']
+            if 'detected' in result:
+                self.detected[port_info['device']] = result['detected']
+        
+        # Detection results stick until the port goes away
+        present = set(p['device'] for p in available_ports)
+        self.detected = {port: d for port, d in self.detected.items() if port in present}
+        for port_info in available_ports:
+            if port_info['device'] in self.detected:
+                port_info['detected'] = self.detected[port_info['device']]
+        
+        self.available_ports = available_ports
+        self.last_scan = time.time()
+        change_tracker.update_inventory(available_ports)
         return self.available_ports
     
+    def get_available_ports(self, max_age=5):
+        """Last scan result if fresher than MAX_AGE seconds, else rescan"""
+        if time.time() - self.last_scan > max_age:
+            return self.scan_ports()
+        return self.available_ports
+    
+    def _submit_probe(self, port_name, detect):
+        """Start probing PORT_NAME unless an earlier probe of it is still stuck"""
+        with self.scan_lock:
+            if self.probe_pool is None:
+                self.probe_pool = ThreadPoolExecutor(max_workers=self.SCAN_WORKERS, thread_name_prefix='port-probe')
+            previous = self.probes.get(port_name)
+            if previous is not None and not previous.done():
+                return None
+            future = self.probe_pool.submit(self.probe_port, port_name, detect)
+            self.probes[port_name] = future
+            return future
+    
+    def probe_port(self, port_name, detect=False):
+        """Status of one port, plus baud/protocol detection when asked"""
+        if not detect:
+            return {'status': self.check_port_status(port_name)}
+        detected = self.detect_port_settings(port_name)
+        if detected is None:
+            return {'status': self.check_port_status(port_name)}
+        return {'status': 'available', 'detected': detected}
+    
+    def detect_port_settings(self, port_name, baudrates=DETECT_BAUDRATES, sample_lines=DETECT_SAMPLE_LINES):
+        """Sample a few lines at each baud rate; keep the one that reads cleanly
+
+        A rate whose first read times out empty is abandoned at once, so a
+        silent port costs one read timeout per rate.
+        """
+        best = None
+        for baudrate in baudrates:
+            try:
+                ser = serial.Serial(port_name, baudrate=baudrate, timeout=DETECT_READ_TIMEOUT)
+            except (OSError, serial.SerialException):
+                return None
+            try:
+                lines = []
+                for _ in range(sample_lines):
+                    line = ser.readline()
+                    if not line:
+                        break
+                    lines.append(line)
+            finally:
+                ser.close()
+            lines = [line for line in lines if line.strip()]
+            if not lines:
+                continue
+            
+            # Devices already sending binary frames: any frame with a good CRC settles it
+            frames = FrameDecoder()
+            for chunk in b''.join(lines).split(FRAME_DELIMITER)[1:-1]:
+                frames.decode(chunk)
+            if frames.frames:
+                return {'baudrate': baudrate, 'protocol': 'binary', 'score': 1.0, 'sample': None}
+            
+            decoded = []
+            for line in lines:
+                try:
+                    text = line.decode('utf-8').strip()
+                    if text.isprintable():
+                        decoded.append(text)
+                except UnicodeDecodeError:
+                    pass
+            score = len(decoded) / len(lines)
+            if best is None or score > best['score']:
+                best = {
+                    'baudrate': baudrate,
+                    'protocol': self.detect_protocol(decoded),
+                    'score': round(score, 2),
+                    'sample': decoded[-1] if decoded else None
+                }
+            if score >= 0.99:
+                break
+        return best
+    
+    def detect_protocol(self, lines):
+        """'json' if every sampled line parses as a JSON object, else 'text'"""
+        if not lines:
+            return 'unknown'
+        for line in lines:
+            try:
+                if not isinstance(json.loads(line), dict):
+                    return 'text'
+            except ValueError:
+                return 'text'
+        return 'json'
+    
     def check_port_status(self, port_name):
         """Check if port is busy or available"""
         try:
@@ -41,8 +195,12 @@ class SerialDeviceManager:
         except (OSError, serial.SerialException):
             return 'busy'
     
-    def connect_to_device(self, port_name, baudrate=9600):
-        """Connect to a serial device"""
+    def connect_to_device(self, port_name, baudrate=9600, binary=None):
+        """Connect to a serial device
+
+        BINARY (default SERIAL_BINARY_FRAMES) negotiates binary frames with
+        devices that advertise them; others stay on text lines.
+        """
         try:
             if port_name in self.connected_devices:
                 return {'success': False, 'message': 'Already connected to this port'}
@@ -63,10 +221,15 @@ class SerialDeviceManager:
                 'baudrate': baudrate,
                 'connected_at': datetime.now(),
                 'last_data': None,
-                'data_count': 0
+                'data_count': 0,
+                'commands': DeviceCommandQueue(port_name),
+                'binary': BINARY_FRAMES if binary is None else binary,
+                'framing': 'text',
+                'decoder': FrameDecoder()
             }
             
             self.connected_devices[port_name] = device_info
+            change_tracker.bump_device(port_name)
             
             # Start reading thread
             self.start_reading_thread(port_name)
@@ -84,9 +247,14 @@ class SerialDeviceManager:
                 if port_name in self.serial_threads:
                     self.serial_threads[port_name] = False
                 
+                commands = self.connected_devices[port_name].get('commands')
+                if commands:
+                    commands.cancel_all()
+                
                 # Close serial connection
                 self.connected_devices[port_name]['serial'].close()
                 del self.connected_devices[port_name]
+                change_tracker.remove_device(port_name)
                 
                 return {'success': True, 'message': f'Disconnected from {port_name}'}
             else:
@@ -102,9 +270,21 @@ class SerialDeviceManager:
                 try:
                     if port_name in self.connected_devices:
                         ser = self.connected_devices[port_name]['serial']
-                        if ser.in_waiting > 0:
-                            line = ser.readline().decode('utf-8').strip()
-                            if line:
+                        commands = self.connected_devices[port_name]['commands']
+                        # Writes happen here too, so reads and writes never interleave
+                        commands.pump(ser)
+                        if ser.in_waiting == 0:
+                            time.sleep(0.01)
+                        elif self.connected_devices[port_name]['framing'] == 'binary':
+                            self.process_frame(port_name, ser.read_until(FRAME_DELIMITER))
+                        else:
+                            raw = ser.readline()
+                            if FRAME_DELIMITER in raw and self.connected_devices[port_name]['binary']:
+                                # Still in binary mode from an earlier session
+                                self.connected_devices[port_name]['framing'] = 'binary'
+                                continue
+                            line = raw.decode('utf-8').strip()
+                            if line and not self.handle_control_line(port_name, line):
                                 # Process incoming data
                                 self.process_incoming_data(port_name, line)
                 except Exception as e:
@@ -116,17 +296,62 @@ class SerialDeviceManager:
         thread.daemon = True
         thread.start()
     
+    def handle_control_line(self, port_name, line):
+        """Consume command replies, capability banners and schema lines"""
+        device = self.connected_devices[port_name]
+        if device['decoder'].add_schema(line):
+            return True
+        if not device['commands'].handle_line(line):
+            return False
+        if (device['binary'] and device['framing'] == 'text' and not device.get('negotiating')
+                and BINARY_CAPABILITY in device['commands'].capabilities):
+            self.negotiate_binary(port_name)
+        return True
+    
+    def negotiate_binary(self, port_name):
+        """Ask the device for binary frames; switch once it confirms"""
+        device = self.connected_devices[port_name]
+        device['negotiating'] = True
+        pending = device['commands'].submit('BINARY_ON', timeout=5)
+        
+        def switched(future):
+            # Runs on the reader thread as the reply is read, before the next read
+            device['negotiating'] = False
+            if future.exception() is None and future.result().strip() == 'BINARY':
+                device['framing'] = 'binary'
+                print(f"📦 {port_name} switched to binary frames")
+        
+        pending.future.add_done_callback(switched)
+    
+    def process_frame(self, port_name, raw):
+        """Decode one binary frame into a reading or a control/text line"""
+        result = self.connected_devices[port_name]['decoder'].decode(raw)
+        if result is None:
+            return
+        kind, value = result
+        if kind == 'text':
+            if not self.handle_control_line(port_name, value):
+                self.process_incoming_data(port_name, value)
+        else:
+            self.process_incoming_data(port_name, value)
+    
     def process_incoming_data(self, port_name, data):
-        """Process incoming data from Arduino"""
+        """Process incoming data from Arduino (a text line or a decoded frame)"""
         try:
+            parsed_data = None
+            if isinstance(data, dict):
+                parsed_data = data
+                data = json.dumps(data)
+            
             # Update device info
             self.connected_devices[port_name]['last_data'] = data
             self.connected_devices[port_name]['data_count'] += 1
             self.connected_devices[port_name]['last_update'] = datetime.now()
+            change_tracker.bump_device(port_name)
             
             # Try to parse JSON data (common in Arduino projects)
             try:
-                parsed_data = json.loads(data)
+                parsed_data = parsed_data or json.loads(data)
                 print(f"JSON data from {port_name}: {parsed_data}")
             except:
                 print(f"Raw data from {port_name}: {data}")
@@ -134,15 +359,32 @@ class SerialDeviceManager:
         except Exception as e:
             print(f"Error processing data: {e}")
     
-    def send_command(self, port_name, command):
+    def submit_command(self, port_name, command, timeout=5.0, expect_reply=True):
+        """Queue a command for the device's reader thread; returns a PendingCommand
+
+        `pending.future` resolves with the reply text, or poll it by id through
+        get_command(). Never blocks on the serial port.
+        """
+        device = self.connected_devices.get(port_name)
+        if device is None:
+            raise KeyError('Device not connected')
+        if device.get('commands') is None:
+            raise ValueError('Device is forwarded by an agent and does not accept commands')
+        pending = device['commands'].submit(command, timeout, expect_reply)
+        command_registry.add(pending)
+        return pending
+    
+    def get_command(self, command_id):
+        pending = command_registry.get(command_id)
+        return pending.to_dict() if pending else None
+    
+    def send_command(self, port_name, command, timeout=5.0):
         """Send command to connected device"""
         try:
-            if port_name in self.connected_devices:
-                ser = self.connected_devices[port_name]['serial']
-                ser.write(f"{command}\n".encode('utf-8'))
-                return {'success': True, 'message': 'Command sent'}
-            else:
-                return {'success': False, 'message': 'Device not connected'}
+            pending = self.submit_command(port_name, command, timeout)
+            return {'success': True, 'message': 'Command queued', 'command_id': pending.id}
+        except KeyError:
+            return {'success': False, 'message': 'Device not connected'}
         except Exception as e:
             return {'success': False, 'message': f'Command failed: {str(e)}'}
     
@@ -155,6 +397,7 @@ class SerialDeviceManager:
                 'connected_at': info['connected_at'].strftime('%Y-%m-%d %H:%M:%S'),
                 'last_data': info['last_data'],
                 'data_count': info['data_count'],
+                'framing': info.get('framing', 'text'),
                 'status': 'connected'
             }
             connected.append(device_info)
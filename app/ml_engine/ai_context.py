@@ -1,3 +1,13 @@
+import re
+from datetime import datetime, timedelta
+
+TIMEFRAME_UNITS = {'minute': 'minutes', 'hour': 'hours', 'day': 'days', 'week': 'weeks'}
+# Questions about how sensors move together; single-sensor words ("temperature patterns") stay sensor_data
+CORRELATION_QUERY = re.compile(
+    r'\b(correlat\w*|relationships?|relate[sd]?\s+to|sensors?\s+(?:are\s+)?related|lags?|lagging'
+    r'|leads?\s+(?:or|and)\s+lags?|patterns?\s+(?:between|across|among)|move\s+together)\b')
+
+
 class IoTContextAI:
     def __init__(self):
         self.project_knowledge = {
@@ -7,6 +17,7 @@ class IoTContextAI:
                 'Read multiple sensor types',
                 'Predict future values', 
                 'Detect anomalies',
+                'Find correlated sensors and lags',
                 'Generate historical reports',
                 'Provide natural language insights',
                 'Manage device connections'
@@ -19,7 +30,10 @@ class IoTContextAI:
         """AI understands what user wants based on natural language"""
         query = query.lower()
         
-        if 'temperature' in query:
+        # Checked first: "does temperature correlate with humidity" is about both sensors
+        if CORRELATION_QUERY.search(query):
+            return {'intent': 'correlation', 'timeframe': self.extract_timeframe(query)}
+        elif 'temperature' in query:
             return {'intent': 'sensor_data', 'sensor': 'temperature', 'timeframe': self.extract_timeframe(query)}
         elif 'humidity' in query:
             return {'intent': 'sensor_data', 'sensor': 'humidity', 'timeframe': self.extract_timeframe(query)}
@@ -29,13 +43,21 @@ class IoTContextAI:
             return {'intent': 'sensor_data', 'sensor': 'vehicle', 'timeframe': self.extract_timeframe(query)}
         elif 'pressure' in query:
             return {'intent': 'sensor_data', 'sensor': 'pressure', 'timeframe': self.extract_timeframe(query)}
-        elif 'connect' in query or 'port' in query or 'com' in query:
+        elif 'vibration' in query or 'machine' in query:
+            return {'intent': 'sensor_data', 'sensor': 'vibration', 'timeframe': self.extract_timeframe(query)}
+        elif 'air' in query or 'pollution' in query:
+            return {'intent': 'sensor_data', 'sensor': 'air_quality', 'timeframe': self.extract_timeframe(query)}
+        elif 'voltage' in query or 'energy' in query or 'power' in query:
+            return {'intent': 'sensor_data', 'sensor': 'voltage', 'timeframe': self.extract_timeframe(query)}
+        elif 'amps' in query or 'ampere' in query:
+            return {'intent': 'sensor_data', 'sensor': 'current', 'timeframe': self.extract_timeframe(query)}
+        elif re.search(r'\b(connect\w*|ports?|com\d*)\b', query):
             return {'intent': 'device_connection'}
         elif 'prediction' in query or 'predict' in query or 'forecast' in query:
             return {'intent': 'prediction', 'timeframe': self.extract_timeframe(query)}
-        elif 'anomaly' in query or 'error' in query or 'problem' in query:
-            return {'intent': 'anomaly_detection'}
-        elif 'report' in query or 'summary' in query:
+        elif 'anomaly' in query or 'error' in query or 'problem' in query or 'issue' in query:
+            return {'intent': 'anomaly_detection', 'timeframe': self.extract_timeframe(query)}
+        elif 'report' in query or 'summary' in query or 'overview' in query:
             return {'intent': 'report', 'timeframe': self.extract_timeframe(query)}
         elif 'help' in query or 'what can you do' in query:
             return {'intent': 'help'}
@@ -44,9 +66,34 @@ class IoTContextAI:
     
     def extract_timeframe(self, query):
         """Extract time period from natural language"""
-        if 'last hour' in query: return 'last hour'
+        custom = re.search(r'(?:last|past)\s+(\d+)\s*(minute|hour|day|week)s?', query)
+        if custom: return f"last {custom.group(1)} {TIMEFRAME_UNITS[custom.group(2)]}"
+        elif 'last hour' in query: return 'last hour'
         elif 'today' in query: return 'today'
         elif 'yesterday' in query: return 'yesterday' 
         elif 'last week' in query: return 'last week'
         elif 'last month' in query: return 'last month'
-        else: return 'recent'
\ No newline at end of file
+        elif 'all time' in query: return 'all time'
+        else: return 'recent'
+
+    def timeframe_window(self, timeframe, now=None):
+        """Map a timeframe onto a (start, end) window of naive datetimes (None = open)"""
+        now = now or datetime.now()
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        custom = re.fullmatch(r'last (\d+) (minutes|hours|days|weeks)', timeframe or '')
+        if custom:
+            return now - timedelta(**{custom.group(2): int(custom.group(1))}), now
+        elif timeframe == 'last hour':
+            return now - timedelta(hours=1), now
+        elif timeframe == 'today':
+            return midnight, now
+        elif timeframe == 'yesterday':
+            return midnight - timedelta(days=1), midnight - timedelta(milliseconds=1)
+        elif timeframe == 'last week':
+            return now - timedelta(days=7), now
+        elif timeframe == 'last month':
+            return now - timedelta(days=30), now
+        elif timeframe == 'all time':
+            return None, None
+        else:  # recent
+            return now - timedelta(days=1), now
\ No newline at end of file
@@ -0,0 +1,44 @@
+"""Analytics run by the analytics executor, inline or in a worker process
+
+Tasks take numpy arrays (read-only views of shared memory when run in a
+worker) plus plain keyword arguments, and return new objects; they must
+not return views of their inputs.
+"""
+import numpy as np
+
+from app.storage.time_index import aggregate
+
+
+def summary_statistics(values):
+    """Dashboard statistics of a series (NaNs ignored, like pandas)"""
+    finite = values[~np.isnan(values)]
+    if len(finite) == 0:
+        return {}
+    return {
+        'count': int(len(values)),
+        'mean': round(float(finite.mean()), 2),
+        'median': round(float(np.median(finite)), 2),
+        'min': round(float(finite.min()), 2),
+        'max': round(float(finite.max()), 2),
+        'std': round(float(finite.std(ddof=1)), 2) if len(finite) > 1 else float('nan'),
+        'trend': 'increasing' if len(values) > 1 and values[-1] > values[0] else 'decreasing'
+    }
+
+
+def window_statistics(values):
+    """count/mean/min/max/std/trend of a raw window (see SensorSummaries.summarize)"""
+    from .sensor_summaries import trend_of
+    return {
+        'count': int(len(values)),
+        'mean': float(values.mean()),
+        'min': float(values.min()),
+        'max': float(values.max()),
+        'std': float(values.std()),
+        'trend': trend_of(values)
+    }
+
+
+def aggregate_series(timestamps, values, agg='mean', step=None):
+    """time_index.aggregate, returning copies"""
+    bucket_ts, result = aggregate(timestamps, values, agg, step)
+    return np.array(bucket_ts), np.array(result)
@@ -0,0 +1,278 @@
+import itertools
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app.storage.alignment import stream_aligner
+from app.storage.time_index import time_index
+from .executor import analytics_executor
+
+EPOCH = datetime(1970, 1, 1)
+# Grid points per window when no step is given
+WINDOW_POINTS = 500
+# Pairs need this many shared grid points before a coefficient is reported
+MIN_OVERLAP = 8
+MAX_LAG = 30
+
+
+def pairwise_sums(rows):
+    """(n, sx, sxx, sxy) of ROWS [t, k] for every pair of columns, NaNs skipped pairwise
+
+    n[i, j] counts rows where both i and j have a value; sx[i, j] and
+    sxx[i, j] sum column i over those rows. All four are plain matrix
+    products, and adding or removing rows just adds or subtracts their sums.
+    """
+    present = ~np.isnan(rows)
+    mask = present.astype(float)
+    values = np.where(present, rows, 0.0)
+    return mask.T @ mask, values.T @ mask, (values ** 2).T @ mask, values.T @ values
+
+
+def pearson_from_sums(n, sx, sxx, sxy, min_overlap=MIN_OVERLAP):
+    """Pearson matrix from pairwise_sums(); NaN where pairs overlap too little or do not vary"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = sxy - sx * sx.T / n
+        var = sxx - sx ** 2 / n
+        r = cov / np.sqrt(var * var.T)
+    r[(n < min_overlap) | ~np.isfinite(r)] = np.nan
+    return np.clip(r, -1.0, 1.0)
+
+
+def rank_columns(rows):
+    """Average ranks (ties share one) of each column's values; NaNs stay NaN"""
+    ranks = np.full(rows.shape, np.nan)
+    for column in range(rows.shape[1]):
+        present = ~np.isnan(rows[:, column])
+        values = rows[present, column]
+        ordered = np.sort(values)
+        ranks[present, column] = (np.searchsorted(ordered, values, side='left') +
+                                  np.searchsorted(ordered, values, side='right') + 1) / 2
+    return ranks
+
+
+def spearman_matrix(rows, min_overlap=MIN_OVERLAP):
+    """Spearman matrix: Pearson over ranks (each column ranked over all its own values)"""
+    return pearson_from_sums(*pairwise_sums(rank_columns(rows)), min_overlap=min_overlap)
+
+
+def lag_matrix(rows, max_lag=MAX_LAG, min_overlap=MIN_OVERLAP):
+    """(lag, correlation) of the strongest cross-correlation within ±MAX_LAG steps, every pair
+
+    lag[i, j] = L > 0 means column i follows column j by L steps. One pair of
+    matrix products per lag; negative lags are the transposes.
+    """
+    present = ~np.isnan(rows)
+    count = present.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.where(count > 0, np.where(present, rows, 0.0).sum(axis=0) / np.maximum(count, 1), 0.0)
+        std = np.sqrt(np.where(present, (rows - mean) ** 2, 0.0).sum(axis=0) / np.maximum(count, 1))
+        z = np.where(present & (std > 0), (rows - mean) / np.where(std > 0, std, 1.0), 0.0)
+    mask = (present & (std > 0)).astype(float)
+
+    steps = rows.shape[0]
+    best = np.full((rows.shape[1],) * 2, np.nan)
+    best_lag = np.zeros(best.shape, dtype=np.int64)
+    for lag in range(min(max_lag, steps - 1) + 1):
+        overlap = mask[lag:].T @ mask[:steps - lag]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r = (z[lag:].T @ z[:steps - lag]) / overlap
+        r[overlap < min_overlap] = np.nan
+        for candidate, signed_lag in ((r, lag), (r.T, -lag)):
+            better = np.abs(candidate) > np.nan_to_num(np.abs(best), nan=-1.0)
+            best = np.where(better, candidate, best)
+            best_lag = np.where(better, signed_lag, best_lag)
+    return best_lag, np.clip(best, -1.0, 1.0)
+
+
+def to_datetime(ms):
+    return EPOCH + timedelta(milliseconds=int(ms))
+
+
+class CorrelationWindow:
+    """Grid rows of one sliding window plus their pairwise sums
+
+    Values are shifted by the first rows' means before summing, so the sums
+    stay small and adding/removing rows does not lose precision.
+    """
+    REBUILD_AFTER = 500
+
+    def __init__(self, columns, fields, step, versions):
+        self.columns = columns
+        self.fields = fields
+        self.step = step
+        self.versions = versions
+        self.timestamps = np.empty(0, dtype=np.int64)
+        self.rows = np.empty((0, len(columns)))
+        self.shift = None
+        self.sums = None
+        self.version = None
+        self.updates = 0
+        self.end_ms = None
+        self.result = None
+
+    def add(self, timestamps, rows):
+        if len(rows) == 0:
+            return
+        if self.shift is None:
+            present = ~np.isnan(rows)
+            self.shift = np.where(present, rows, 0.0).sum(axis=0) / np.maximum(present.sum(axis=0), 1)
+        sums = pairwise_sums(rows - self.shift)
+        self.sums = sums if self.sums is None else tuple(a + b for a, b in zip(self.sums, sums))
+        self.timestamps = np.concatenate([self.timestamps, timestamps])
+        self.rows = np.concatenate([self.rows, rows])
+
+    def remove(self, keep):
+        """Keep only the rows in slice KEEP, subtracting the others' sums"""
+        dropped = np.ones(len(self.rows), dtype=bool)
+        dropped[keep] = False
+        if dropped.any():
+            sums = pairwise_sums(self.rows[dropped] - self.shift)
+            self.sums = tuple(a - b for a, b in zip(self.sums, sums))
+            self.timestamps = self.timestamps[keep]
+            self.rows = self.rows[keep]
+
+
+class CorrelationEngine:
+    """Pearson, Spearman and lagged cross-correlation across many streams
+
+    Streams are resampled to bucket means on a common grid (see
+    StreamAligner) over a window ending at the newest reading. Each window
+    is kept between calls: when data arrives only the new buckets are
+    aligned, and rows sliding out are subtracted, so Pearson costs
+    O(new rows * k^2) per update. Spearman and lags are recomputed from the
+    window rows (in the analytics pool when large) only when the window
+    moved, and cached per window version. Readings arriving late, into
+    buckets already closed, are picked up when the window is rebuilt
+    (every REBUILD_AFTER updates, or when a file shrinks).
+    """
+    MAX_WINDOWS = 32
+
+    def __init__(self):
+        self.windows = OrderedDict()
+        # key -> [lock, users]: requests for the same window wait for a single
+        # alignment, other windows are aligned in parallel. An entry lives
+        # until its last user is done, even if the window was evicted meanwhile
+        self.window_locks = {}
+        self.versions = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def analyze(self, streams, window_ms, step=None, max_lag=MAX_LAG):
+        """Correlation report for STREAMS (StreamSpecs) over the last WINDOW_MS"""
+        step = step or max(1000, window_ms // WINDOW_POINTS)
+        key = (tuple(spec.key() for spec in streams), window_ms, step)
+        sizes = tuple(os.path.getsize(spec.file_path) if os.path.exists(spec.file_path) else 0 for spec in streams)
+        latest = [time_index.latest_timestamp(spec.file_path) for spec in streams if os.path.exists(spec.file_path)]
+        latest = [ts for ts in latest if ts is not None]
+        if not latest:
+            return None
+        end_ms = max(latest)
+
+        with self.lock:
+            entry = self.window_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            return self._analyze(key, entry[0], streams, window_ms, step, max_lag, end_ms, sizes)
+        finally:
+            with self.lock:
+                entry[1] -= 1
+                if entry[1] == 0 and key not in self.windows:
+                    self.window_locks.pop(key, None)
+
+    def _analyze(self, key, window_lock, streams, window_ms, step, max_lag, end_ms, sizes):
+        with window_lock:
+            with self.lock:
+                state = self.windows.get(key)
+            # Aligning reads every stream from disk; only this window's requests wait for it
+            if (state is None or end_ms < state.end_ms or state.updates >= CorrelationWindow.REBUILD_AFTER
+                    or any(now < before for now, before in zip(sizes, state.versions))):
+                state = self._build(streams, window_ms, step, end_ms, sizes)
+            elif end_ms != state.end_ms:
+                self._advance(state, streams, window_ms, end_ms, sizes)
+            with self.lock:
+                self.windows[key] = state
+                self.windows.move_to_end(key)
+                while len(self.windows) > self.MAX_WINDOWS:
+                    evicted, _ = self.windows.popitem(last=False)
+                    if self.window_locks.get(evicted, (None, 0))[1] == 0:
+                        self.window_locks.pop(evicted, None)
+                if state.result is not None and state.result[0] == max_lag:
+                    return state.result[1]
+                timestamps, rows, sums, version = state.timestamps, state.rows, state.sums, state.version
+
+        # Outside the lock: the arrays are replaced, never modified, on update
+        k = len(state.columns)
+        pearson = pearson_from_sums(*sums) if sums is not None else np.full((k, k), np.nan)
+        spearman = analytics_executor.run(spearman_matrix, rows, cache_key=version)
+        lag_steps, lag_corr = analytics_executor.run(lag_matrix, rows, max_lag=max_lag, cache_key=(version, max_lag))
+        result = {
+            'columns': state.columns,
+            'fields': state.fields,
+            'step_ms': step,
+            'window_ms': window_ms,
+            'points': int(len(timestamps)),
+            'start': int(timestamps[0]) if len(timestamps) else None,
+            'end': end_ms,
+            'pearson': pearson,
+            'spearman': spearman,
+            'lag_ms': lag_steps * step,
+            'lag_correlation': lag_corr
+        }
+        result['top_pairs'] = top_pairs(result)
+        with self.lock:
+            if state.version == version:
+                state.result = (max_lag, result)
+        return result
+
+    def _build(self, streams, window_ms, step, end_ms, sizes):
+        start_ms = end_ms // step * step - window_ms + step
+        aligned = stream_aligner.align(streams, to_datetime(start_ms), to_datetime(end_ms), step, method='mean')
+        state = CorrelationWindow(aligned['columns'], aligned['fields'], step, sizes)
+        state.add(aligned['timestamps'], aligned['values'])
+        state.end_ms = end_ms
+        state.version = next(self.versions)
+        return state
+
+    def _advance(self, state, streams, window_ms, end_ms, sizes):
+        """Re-align from the last (possibly partial) bucket on, then slide the window start"""
+        step = state.step
+        resume = int(state.timestamps[-1]) if len(state.timestamps) else end_ms // step * step - window_ms + step
+        state.remove(slice(0, int(np.searchsorted(state.timestamps, resume, side='left'))))
+        aligned = stream_aligner.align(streams, to_datetime(resume), to_datetime(end_ms), step, method='mean')
+        state.add(aligned['timestamps'], aligned['values'])
+        window_start = end_ms // step * step - window_ms + step
+        state.remove(slice(int(np.searchsorted(state.timestamps, window_start, side='left')), None))
+        state.end_ms = end_ms
+        state.versions = sizes
+        state.updates += 1
+        state.version = next(self.versions)
+        state.result = None
+
+
+def top_pairs(result, limit=10):
+    """Most strongly correlated pairs (by |Pearson|), strongest first"""
+    pearson = result['pearson']
+    i, j = np.triu_indices(len(result['columns']), 1)
+    strength = np.abs(pearson[i, j])
+    ranked = [n for n in np.argsort(-np.nan_to_num(strength, nan=-1.0)) if not np.isnan(strength[n])][:limit]
+    pairs = []
+    for n in ranked:
+        a, b = int(i[n]), int(j[n])
+        spearman = result['spearman'][a, b]
+        lag_corr = result['lag_correlation'][a, b]
+        pairs.append({
+            'a': result['columns'][a],
+            'b': result['columns'][b],
+            'pearson': round(float(pearson[a, b]), 4),
+            'spearman': None if np.isnan(spearman) else round(float(spearman), 4),
+            # > 0: a follows b by this long
+            'lag_ms': int(result['lag_ms'][a, b]),
+            'lag_correlation': None if np.isnan(lag_corr) else round(float(lag_corr), 4)
+        })
+    return pairs
+
+
+# Global instance
+correlation_engine = CorrelationEngine()
@@ -0,0 +1,188 @@
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from app.admission import env_float
+
+ANALYTICS_PROCESSES = os.getenv('ANALYTICS_PROCESSES', 'true').lower() in ('1', 'true', 'yes')
+# Imported once by the forkserver, so each worker starts with numpy loaded
+WORKER_PRELOAD = ['app.ml_engine.analytics_tasks']
+
+
+class AnalyticsTimeout(TimeoutError):
+    """The analysis is still running; ask again shortly"""
+
+
+def share_array(array):
+    """Copy ARRAY into a new shared memory block; returns (block, descriptor)"""
+    array = np.ascontiguousarray(array)
+    block = SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+    return block, (block.name, array.shape, array.dtype.str)
+
+
+def _run_shared(task, descriptors, kwargs):
+    """Worker side: attach the shared inputs, run TASK, detach"""
+    blocks = [SharedMemory(name=name) for name, _, _ in descriptors]
+    try:
+        arrays = [np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+                  for block, (_, shape, dtype) in zip(blocks, descriptors)]
+        for array in arrays:
+            array.flags.writeable = False
+        result = task(*arrays, **kwargs)
+        del arrays
+        return result
+    finally:
+        for block in blocks:
+            block.close()
+
+
+class AnalyticsExecutor:
+    """CPU-heavy analytics off the request threads, in a process pool
+
+    Inputs of at least ANALYTICS_INLINE_POINTS values go to one of
+    ANALYTICS_WORKERS processes (default: one per core); smaller ones run
+    inline, where the hand-off would cost more than it saves. Arrays travel
+    through shared memory, so only their names are pickled. Requests with a
+    CACHE_KEY wait at most ANALYTICS_DEADLINE seconds and then get
+    AnalyticsTimeout; the job keeps running and its result lands in the
+    cache, so the retry is answered from it. Without a key nothing could
+    pick the result up later, so those wait for it. Workers come from a
+    forkserver that only preloads the task modules, never from a fork of the
+    threaded app process. ANALYTICS_PROCESSES=false runs everything inline.
+    """
+    MAX_CACHED = 128
+
+    def __init__(self):
+        self.workers = int(env_float('ANALYTICS_WORKERS', os.cpu_count() or 1))
+        self.inline_points = int(env_float('ANALYTICS_INLINE_POINTS', 200000))
+        self.deadline = env_float('ANALYTICS_DEADLINE', 5)
+        self.enabled = ANALYTICS_PROCESSES and self.workers > 0
+        # Forking the app process would copy locks held by its threads mid-operation
+        self.start_method = os.getenv('ANALYTICS_START_METHOD') or (
+            'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+        self.pool = None
+        self.cache = OrderedDict()
+        self.pending = {}
+        self.counts = {'inline': 0, 'offloaded': 0, 'cache_hits': 0, 'timeouts': 0, 'failures': 0}
+        self.lock = threading.Lock()
+
+    def run(self, task, *arrays, cache_key=None, deadline=None, **kwargs):
+        """TASK(*ARRAYS, **KWARGS), from the cache when CACHE_KEY was seen before"""
+        key = (task.__name__, cache_key) if cache_key is not None else None
+        with self.lock:
+            if key is not None and key in self.cache:
+                self.cache.move_to_end(key)
+                self.counts['cache_hits'] += 1
+                return self.cache[key]
+
+        if not self.enabled or sum(np.size(a) for a in arrays) < self.inline_points:
+            with self.lock:
+                self.counts['inline'] += 1
+            result = task(*arrays, **kwargs)
+        else:
+            future = self._submit(key, task, arrays, kwargs)
+            if future is None:
+                result = task(*arrays, **kwargs)
+            else:
+                if deadline is None:
+                    deadline = self.deadline if key is not None else None
+                try:
+                    result = future.result(timeout=deadline)
+                except FutureTimeout:
+                    with self.lock:
+                        self.counts['timeouts'] += 1
+                    raise AnalyticsTimeout(f"{task.__name__} still running")
+                except BrokenProcessPool:
+                    print(f"⚠️ Analytics worker died, running {task.__name__} inline")
+                    self._reset()
+                    result = task(*arrays, **kwargs)
+
+        if key is not None:
+            self._remember(key, result)
+        return result
+
+    def _submit(self, key, task, arrays, kwargs):
+        """Future for the job, reusing one still running for the same key; None if the pool is unusable"""
+        with self.lock:
+            future = self.pending.get(key) if key is not None else None
+            if future is not None:
+                return future
+            blocks, descriptors = [], []
+            try:
+                if self.pool is None:
+                    context = multiprocessing.get_context(self.start_method)
+                    if self.start_method == 'forkserver':
+                        context.set_forkserver_preload(WORKER_PRELOAD)
+                    self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+                    print(f"🧮 Analytics pool: {self.workers} {self.start_method} worker(s)")
+                for array in arrays:
+                    block, descriptor = share_array(array)
+                    blocks.append(block)
+                    descriptors.append(descriptor)
+                future = self.pool.submit(_run_shared, task, descriptors, kwargs)
+            except (OSError, RuntimeError, BrokenProcessPool) as e:
+                print(f"⚠️ Analytics pool unavailable ({e}), running inline")
+                self.counts['failures'] += 1
+                for block in blocks:
+                    self._release(block)
+                self.pool = None
+                self.enabled = False
+                return None
+            self.counts['offloaded'] += 1
+            if key is not None:
+                self.pending[key] = future
+        future.add_done_callback(lambda done: self._finished(key, done, blocks))
+        return future
+
+    def _finished(self, key, future, blocks):
+        for block in blocks:
+            self._release(block)
+        with self.lock:
+            if self.pending.get(key) is future:
+                del self.pending[key]
+        if key is not None and not future.cancelled() and future.exception() is None:
+            self._remember(key, future.result())
+
+    def _remember(self, key, result):
+        with self.lock:
+            self.cache[key] = result
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.MAX_CACHED:
+                self.cache.popitem(last=False)
+
+    def _release(self, block):
+        block.close()
+        try:
+            block.unlink()
+        except FileNotFoundError:
+            pass
+
+    def _reset(self):
+        with self.lock:
+            pool, self.pool = self.pool, None
+            self.pending.clear()
+            self.counts['failures'] += 1
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts, workers=self.workers if self.enabled else 0,
+                        running=len(self.pending), cached=len(self.cache))
+
+    def shutdown(self):
+        with self.lock:
+            pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+# Global instance
+analytics_executor = AnalyticsExecutor()
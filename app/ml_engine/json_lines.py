@@ -0,0 +1,237 @@
+import json
+import os
+import struct
+import threading
+from contextlib import contextmanager
+
+from app.storage.locks import file_lock
+
+INDEX_SUFFIX = '.idx'
+JSON_LINES_EXTENSIONS = ('.ndjson', '.jsonl')
+
+# Index interval and the inode of the data file the offsets belong to
+_HEADER = struct.Struct('<QQ')
+_ENTRY = struct.Struct('<Q')
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _lock_for(path):
+    with _locks_guard:
+        if path not in _locks:
+            _locks[path] = threading.Lock()
+        return _locks[path]
+
+
+class JsonLinesFile:
+    """Newline-delimited JSON file with a sidecar offset index
+
+    The sidecar (`<file>.idx`) stores the byte offset of every Nth record so
+    reads can seek straight to record K or to the last N records instead of
+    parsing the file from the start. Blank lines are not records. Appends
+    and index updates hold a lock on the sidecar, so several processes can
+    share one file.
+    """
+    INDEX_INTERVAL = 1000
+
+    def __init__(self, file_path, index_interval=None):
+        self.file_path = file_path
+        self.index_path = file_path + INDEX_SUFFIX
+        self.index_interval = index_interval or self.INDEX_INTERVAL
+        self.lock = _lock_for(os.path.abspath(file_path))
+        self.offsets = [0]
+        self.record_count = 0
+        self.scanned_to = 0
+        self.inode = None
+        self.index_size = None
+        self.index_loaded = False
+
+    def append(self, records):
+        """Append one record (dict) or a list of records"""
+        if isinstance(records, dict):
+            records = [records]
+
+        with self.lock, self._index_lock():
+            self._sync_index()
+            if os.path.exists(self.file_path) and os.path.getsize(self.file_path) > self.scanned_to:
+                # Terminate a partial line left by a crashed writer
+                with open(self.file_path, 'ab') as f:
+                    f.write(b'\n')
+                self._sync_index()
+
+            new_offsets = []
+            with open(self.file_path, 'ab') as f:
+                inode = os.fstat(f.fileno()).st_ino
+                offset = f.tell()
+                for record in records:
+                    if (self.record_count % self.index_interval == 0 and self.record_count > 0
+                            and offset > self.offsets[-1]):
+                        new_offsets.append(offset)
+                    line = (json.dumps(record, default=str) + '\n').encode('utf-8')
+                    f.write(line)
+                    offset += len(line)
+                    self.record_count += 1
+            self.scanned_to = offset
+            self.offsets.extend(new_offsets)
+            if inode != self.inode:
+                # We just created the file
+                self.inode = inode
+                self._rewrite_index()
+            else:
+                self._write_index_entries(new_offsets)
+
+    def count(self):
+        """Number of complete records in the file"""
+        with self.lock, self._index_lock():
+            self._sync_index()
+            return self.record_count
+
+    def read_record(self, k):
+        """Return record K (0-based), or None if out of range"""
+        for record in self.iter_records(k, k + 1):
+            return record
+        return None
+
+    def tail(self, n):
+        """Return the last N records"""
+        total = self.count()
+        return list(self.iter_records(max(total - n, 0)))
+
+    def iter_records(self, start=0, stop=None):
+        """Lazily yield records from index START up to (not including) STOP"""
+        with self.lock, self._index_lock():
+            self._sync_index()
+            total = self.record_count
+            checkpoint = min(start // self.index_interval, len(self.offsets) - 1)
+            offset = self.offsets[checkpoint]
+            end_offset = self.scanned_to
+
+        if stop is None or stop > total:
+            stop = total
+        if start >= stop:
+            return
+
+        position = checkpoint * self.index_interval
+        with open(self.file_path, 'rb') as f:
+            f.seek(offset)
+            while position < stop and f.tell() < end_offset:
+                line = f.readline()
+                if not line.endswith(b'\n'):
+                    break
+                if not line.strip():
+                    continue
+                if position >= start:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        yield {'raw': line.decode('utf-8', errors='replace').strip()}
+                position += 1
+
+    def iter_batches(self, batch_size, start=0):
+        """Yield lists of up to BATCH_SIZE records"""
+        batch = []
+        for record in self.iter_records(start):
+            batch.append(record)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    @contextmanager
+    def _index_lock(self):
+        """Held across processes while the file or its index is updated"""
+        with open(self.index_path, 'ab') as handle, file_lock(handle):
+            yield
+
+    def _load_index(self):
+        self.offsets = [0]
+        try:
+            stat = os.stat(self.file_path)
+            size, self.inode = stat.st_size, stat.st_ino
+        except FileNotFoundError:
+            size, self.inode = 0, None
+        try:
+            with open(self.index_path, 'rb') as f:
+                header = f.read(_HEADER.size)
+                body = f.read()
+        except FileNotFoundError:
+            header = body = b''
+
+        valid_header = len(header) == _HEADER.size and _HEADER.unpack(header)[0] > 0
+        if valid_header and _HEADER.unpack(header)[1] == (self.inode or 0):
+            # An existing index keeps the interval it was built with
+            self.index_interval = _HEADER.unpack(header)[0]
+            usable = len(body) - len(body) % _ENTRY.size
+            self.offsets += [entry[0] for entry in _ENTRY.iter_unpack(body[:usable])]
+            # Drop checkpoints that point past the data (file was truncated)
+            valid = [o for o in self.offsets if o <= size]
+            if len(valid) != len(self.offsets):
+                self.offsets = valid
+                self._rewrite_index()
+        else:
+            # Missing, unreadable or built for a file that has since been replaced
+            self._rewrite_index()
+
+        self.record_count = (len(self.offsets) - 1) * self.index_interval
+        self.scanned_to = self.offsets[-1]
+        self.index_size = self._index_file_size()
+        self.index_loaded = True
+
+    def _sync_index(self):
+        """Bring the index up to date with records appended by other writers"""
+        if not self.index_loaded or self._index_file_size() != self.index_size:
+            # First use, or another process wrote checkpoints since
+            self._load_index()
+
+        if not os.path.exists(self.file_path):
+            self.offsets = [0]
+            self.record_count = 0
+            self.scanned_to = 0
+            return
+
+        stat = os.stat(self.file_path)
+        size = stat.st_size
+        if size < self.scanned_to or stat.st_ino != self.inode:
+            # Truncated or replaced underneath us
+            self.index_loaded = False
+            self._load_index()
+        if size == self.scanned_to:
+            return
+
+        new_offsets = []
+        with open(self.file_path, 'rb') as f:
+            f.seek(self.scanned_to)
+            offset = self.scanned_to
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                if not line.strip():
+                    offset += len(line)
+                    continue
+                if self.record_count % self.index_interval == 0 and self.record_count > 0 and offset > self.offsets[-1]:
+                    new_offsets.append(offset)
+                offset += len(line)
+                self.record_count += 1
+        self.scanned_to = offset
+        self.offsets.extend(new_offsets)
+        self._write_index_entries(new_offsets)
+
+    def _write_index_entries(self, offsets):
+        if not offsets:
+            return
+        with open(self.index_path, 'ab') as f:
+            f.write(b''.join(_ENTRY.pack(o) for o in offsets))
+        self.index_size = self._index_file_size()
+
+    def _rewrite_index(self):
+        with open(self.index_path, 'wb') as f:
+            f.write(_HEADER.pack(self.index_interval, self.inode or 0))
+            f.write(b''.join(_ENTRY.pack(o) for o in self.offsets[1:]))
+        self.index_size = self._index_file_size()
+
+    def _index_file_size(self):
+        try:
+            return os.path.getsize(self.index_path)
+        except FileNotFoundError:
+            return None
@@ -1,13 +1,17 @@
 import pandas as pd
 import numpy as np
 import os
+from app.storage.tail_cache import tail_cache
 
 def predict_next_value(csv_file):
     try:
         if not os.path.exists(csv_file):
             return 0
             
-        df = pd.read_csv(csv_file)
+        if csv_file.endswith('.csv'):
+            df = tail_cache.tail_frame(csv_file, rows=2)
+        else:
+            df = pd.read_csv(csv_file)
         
         if len(df) < 2:
             return 0
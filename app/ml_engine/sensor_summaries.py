@@ -0,0 +1,278 @@
+import os
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app.storage.tail_cache import tail_cache, MISSING_TS
+from app.storage.time_index import time_index, to_ms
+from app.storage.data_catalog import data_catalog
+from .universal_reader import UniversalDataReader
+from .executor import analytics_executor
+from .analytics_tasks import window_statistics
+
+HOUR_MS = 3600 * 1000
+# Windows up to this long are answered exactly from the raw index
+EXACT_WINDOW = timedelta(hours=6)
+
+
+class SeriesRollup:
+    """Hourly count/sum/min/max/sum-of-squares for one (file, field) series"""
+    def __init__(self, sensor_type, unit, sensor_name):
+        self.sensor_type = sensor_type
+        self.unit = unit
+        self.sensor_name = sensor_name
+        self.hours = {}
+        self.count = 0
+        self.first_ts = None
+        self.last_ts = None
+        self.last_value = None
+
+    def add(self, timestamps, values):
+        """Fold new readings in (vectorized per batch)"""
+        keep = (timestamps != MISSING_TS) & ~np.isnan(values)
+        timestamps, values = timestamps[keep], values[keep]
+        if len(values) == 0:
+            return
+
+        hours, inverse = np.unique(timestamps // HOUR_MS * HOUR_MS, return_inverse=True)
+        counts = np.bincount(inverse)
+        sums = np.bincount(inverse, weights=values)
+        sumsqs = np.bincount(inverse, weights=values * values)
+        mins = np.full(len(hours), np.inf)
+        maxs = np.full(len(hours), -np.inf)
+        np.minimum.at(mins, inverse, values)
+        np.maximum.at(maxs, inverse, values)
+
+        for i, hour in enumerate(hours.tolist()):
+            bucket = self.hours.get(hour)
+            if bucket is None:
+                self.hours[hour] = [int(counts[i]), sums[i], mins[i], maxs[i], sumsqs[i]]
+            else:
+                bucket[0] += int(counts[i])
+                bucket[1] += sums[i]
+                bucket[2] = min(bucket[2], mins[i])
+                bucket[3] = max(bucket[3], maxs[i])
+                bucket[4] += sumsqs[i]
+
+        self.count += len(values)
+        newest = int(np.argmax(timestamps))
+        if self.last_ts is None or timestamps[newest] >= self.last_ts:
+            self.last_ts = int(timestamps[newest])
+            self.last_value = float(values[newest])
+        oldest = int(timestamps.min())
+        self.first_ts = oldest if self.first_ts is None else min(self.first_ts, oldest)
+
+    def buckets(self, start_ms, end_ms):
+        """(hour starts, [count, sum, min, max, sumsq] rows) overlapping [start_ms, end_ms]"""
+        hours = sorted(hour for hour in self.hours
+                       if (start_ms is None or hour + HOUR_MS > start_ms) and (end_ms is None or hour <= end_ms))
+        if not hours:
+            return np.empty(0, dtype=np.int64), np.empty((0, 5))
+        return np.array(hours, dtype=np.int64), np.array([self.hours[h] for h in hours])
+
+    def window(self, start_ms, end_ms):
+        """Combine the hourly buckets overlapping [start_ms, end_ms]"""
+        _, buckets = self.buckets(start_ms, end_ms)
+        if len(buckets) == 0:
+            return None
+        count = buckets[:, 0].sum()
+        mean = buckets[:, 1].sum() / count
+        variance = max(buckets[:, 4].sum() / count - mean * mean, 0.0)
+        hourly_means = buckets[:, 1] / buckets[:, 0]
+        return {
+            'count': int(count),
+            'mean': float(mean),
+            'min': float(buckets[:, 2].min()),
+            'max': float(buckets[:, 3].max()),
+            'std': float(np.sqrt(variance)),
+            'trend': trend_of(hourly_means)
+        }
+
+
+def trend_of(values):
+    """'increasing' / 'decreasing' / 'stable' comparing the first and second half"""
+    if len(values) < 2:
+        return 'stable'
+    half = len(values) // 2
+    first, second = np.mean(values[:half]), np.mean(values[half:])
+    spread = np.std(values) or 1.0
+    if second - first > 0.25 * spread:
+        return 'increasing'
+    if first - second > 0.25 * spread:
+        return 'decreasing'
+    return 'stable'
+
+
+class SensorSummaries:
+    """Per-sensor rollups kept current by ingest
+
+    Each refresh folds in only the rows the tail cache parsed since the last
+    one, so answering "temperature last week" is a lookup over at most a few
+    hundred hourly buckets rather than a scan of the raw files.
+    """
+    def __init__(self):
+        self.files = {}
+        self.reader = UniversalDataReader()
+        self.lock = threading.Lock()
+
+    def refresh(self, file_path):
+        """Fold newly appended rows of one CSV file into its rollups"""
+        if not file_path.endswith('.csv') or not os.path.exists(file_path):
+            return
+        data = tail_cache.get_series(file_path)
+        key = os.path.abspath(file_path)
+
+        with self.lock:
+            state = self.files.get(key)
+            if state is None or state['generation'] != data['generation']:
+                state = {'generation': data['generation'], 'rows': 0, 'series': {}}
+                self.files[key] = state
+                # A rewritten hot file (e.g. after compaction) also needs its cold history
+                self._fold_cold(file_path, state)
+
+            start = state['rows']
+            if data['rows'] <= start:
+                return
+            timestamps = data['timestamps'][start:data['rows']]
+            for field, values in data['columns'].items():
+                rollup = self._rollup(state, field, file_path)
+                rollup.add(timestamps, values[start:data['rows']])
+            state['rows'] = data['rows']
+
+    def refresh_all(self):
+        for file_path in data_catalog.list_files():
+            try:
+                self.refresh(file_path)
+            except Exception as e:
+                print(f"Summary refresh error for {file_path}: {e}")
+
+    def series(self, sensor_type=None, file_paths=None):
+        """[(file_path, field, rollup)] optionally filtered by sensor type
+
+        With FILE_PATHS only those files are refreshed and returned (one
+        user's partitions plus the shared files), instead of every file.
+        """
+        if file_paths is None:
+            self.refresh_all()
+            wanted = None
+        else:
+            for file_path in file_paths:
+                try:
+                    self.refresh(file_path)
+                except Exception as e:
+                    print(f"Summary refresh error for {file_path}: {e}")
+            wanted = set(os.path.abspath(p) for p in file_paths)
+        with self.lock:
+            found = []
+            for file_path, state in self.files.items():
+                if wanted is not None and file_path not in wanted:
+                    continue
+                for field, rollup in state['series'].items():
+                    if rollup.count and (sensor_type is None or rollup.sensor_type == sensor_type):
+                        found.append((file_path, field, rollup))
+            return found
+
+    def summarize(self, file_path, field, rollup, start=None, end=None):
+        """Stats for one series over [start, end] (naive datetimes)"""
+        if start is not None and (end or datetime.now()) - start <= EXACT_WINDOW:
+            timestamps, values, _ = time_index.query(file_path, start, end, field=field)
+            if len(values) == 0:
+                return None
+            # Same window, row count and newest reading: same data (files are append-only)
+            stats = analytics_executor.run(window_statistics, values,
+                                           cache_key=(file_path, field, start, end, len(values), int(timestamps[-1])))
+        else:
+            stats = rollup.window(to_ms(start) if start else None, to_ms(end) if end else None)
+            if stats is None:
+                return None
+        stats.update({
+            'current': rollup.last_value,
+            'last_time': datetime(1970, 1, 1) + timedelta(milliseconds=rollup.last_ts),
+            'unit': rollup.unit,
+            'sensor_name': rollup.sensor_name,
+            'filename': os.path.basename(file_path),
+            'field': field
+        })
+        return stats
+
+    def forecast(self, rollup, start=None, end=None, horizon_hours=24):
+        """Linear fit over hourly means, projected HORIZON_HOURS past the last bucket"""
+        hours, buckets = rollup.buckets(to_ms(start) if start else None, to_ms(end) if end else None)
+        if len(hours) < 2:
+            return None
+        x = (hours - hours[0]) / HOUR_MS
+        means = buckets[:, 1] / buckets[:, 0]
+        slope, intercept = np.polyfit(x, means, 1)
+        fitted = slope * x + intercept
+        residual = np.sum((means - fitted) ** 2)
+        total = np.sum((means - means.mean()) ** 2)
+        return {
+            'predicted': float(slope * (x[-1] + horizon_hours) + intercept),
+            'slope_per_hour': float(slope),
+            'fit': float(1 - residual / total) if total > 0 else 1.0,
+            'buckets': int(len(hours)),
+            'horizon_hours': horizon_hours
+        }
+
+    def anomalies(self, rollup, start=None, end=None, sigmas=3.0):
+        """Hours whose min/max fall outside mean +/- SIGMAS * std of the window"""
+        stats = rollup.window(to_ms(start) if start else None, to_ms(end) if end else None)
+        if stats is None:
+            return None
+        hours, buckets = rollup.buckets(to_ms(start) if start else None, to_ms(end) if end else None)
+        low = stats['mean'] - sigmas * stats['std']
+        high = stats['mean'] + sigmas * stats['std']
+        flagged = (buckets[:, 3] > high) | (buckets[:, 2] < low) if stats['std'] > 0 else np.zeros(len(hours), dtype=bool)
+        return {
+            'hours_checked': int(len(hours)),
+            'flagged_hours': [datetime(1970, 1, 1) + timedelta(milliseconds=int(h)) for h in hours[flagged]],
+            'low': low,
+            'high': high,
+            'count': stats['count']
+        }
+
+    def overview(self, file_paths=None):
+        """Totals across every stored series (or those in FILE_PATHS)"""
+        all_series = self.series(file_paths=file_paths)
+        files = set(file_path for file_path, _, _ in all_series)
+        return {
+            'series': len(all_series),
+            'sensor_types': sorted(set(r.sensor_type for _, _, r in all_series)),
+            'files': len(files),
+            'data_points': sum(r.count for _, _, r in all_series),
+            'storage_bytes': sum(os.path.getsize(f) for f in files if os.path.exists(f)),
+            'last_time': max([r.last_ts for _, _, r in all_series] or [0])
+        }
+
+    def _rollup(self, state, field, file_path):
+        rollup = state['series'].get(field)
+        if rollup is None:
+            sensor_type, unit, sensor_name = self.reader.auto_detect_sensor_type(field)
+            if sensor_type == 'generic':
+                # Generic column names (sensor_value, value) take the type the dashboard shows for the file
+                info = self.reader.read_any_data_format(file_path, metadata_only=True)
+                if 'error' not in info:
+                    sensor_type, unit, sensor_name = info['sensor_type'], info['unit'], info['sensor_name']
+            rollup = SeriesRollup(sensor_type, unit, sensor_name)
+            state['series'][field] = rollup
+        return rollup
+
+    def _fold_cold(self, file_path, state):
+        cold = time_index.cold_arrays(file_path, None, None)
+        if cold is None:
+            return
+        timestamps, columns, _, order = cold
+        for field, values in columns.items():
+            self._rollup(state, field, file_path).add(timestamps, values[order])
+
+
+def _on_catalog_event(event, path):
+    # Writers in other processes (device/reader.py) show up as catalog events
+    if event in ('created', 'modified') and path.endswith('.csv'):
+        sensor_summaries.refresh(path)
+
+
+# Global instance
+sensor_summaries = SensorSummaries()
+data_catalog.subscribe(_on_catalog_event)
@@ -3,9 +3,16 @@ import numpy as np
 from datetime import datetime, timedelta
 import random
 
+from app.storage.time_index import time_index, parse_step
+from .sensor_summaries import sensor_summaries
+from .executor import analytics_executor
+from .analytics_tasks import aggregate_series
+
+FREQ_STEPS = {'1T': '1m', '1H': '1h', '6H': '6h', '1D': '1d'}
+
 class TimeSeriesAI:
-    def generate_historical_data(self, sensor_type, timeframe):
-        """Generate data for any time period user requests"""
+    def generate_historical_data(self, sensor_type, timeframe, file_paths):
+        """Generate data for any time period user requests, from FILE_PATHS (see routes.user_data_files)"""
         if timeframe == 'yesterday':
             start_date = datetime.now() - timedelta(days=1)
             end_date = datetime.now()
@@ -23,8 +30,30 @@ class TimeSeriesAI:
             end_date = datetime.now()
             freq = '1T'  # 1 minute
         
-        # Generate synthetic data
+        # Stored readings first; synthetic data only when nothing was recorded
+        stored = self.load_stored_data(sensor_type, start_date, end_date, freq, file_paths)
+        if stored is not None:
+            return stored
         return self.create_time_series_data(sensor_type, start_date, end_date, freq)
+
+    def load_stored_data(self, sensor_type, start, end, freq, file_paths):
+        """Recorded readings of SENSOR_TYPE in FILE_PATHS averaged per FREQ bucket, or None
+
+        FILE_PATHS is required so a caller only ever reads one user's data.
+        """
+        step = parse_step(FREQ_STEPS.get(freq, '1m'))
+        for file_path, field, _ in sensor_summaries.series(sensor_type, file_paths):
+            timestamps, values, _ = time_index.query(file_path, start, end, field=field)
+            if len(values) == 0:
+                continue
+            cache_key = (file_path, field, start, end, step, len(values), int(timestamps[-1]))
+            bucket_ts, means = analytics_executor.run(aggregate_series, timestamps, values, agg='mean', step=step,
+                                                      cache_key=cache_key)
+            return pd.DataFrame({
+                'timestamp': pd.to_datetime(bucket_ts, unit='ms'),
+                'value': means
+            })
+        return None
     
     def create_time_series_data(self, sensor_type, start, end, freq):
         """Create realistic sensor data for given period"""
@@ -1,11 +1,21 @@
 import pandas as pd
 import numpy as np
+import csv
 import json
 import re
 import os
-import glob
+import itertools
+from .json_lines import JsonLinesFile, JSON_LINES_EXTENSIONS
+from app.storage.tail_cache import tail_cache
+from app.storage.cold_store import cold_store, open_data_file, strip_compression
+
+DATA_EXTENSIONS = ('.csv', '.json', '.txt') + JSON_LINES_EXTENSIONS
 
 class UniversalDataReader:
+    CHUNK_SIZE = 50000
+    PREVIEW_ROWS = 3
+    NUMBER_PATTERN = r"([-+]?\d*\.\d+|\d+)"
+    
     def __init__(self):
         self.sensor_profiles = {}
         self.data_patterns = {}
@@ -35,22 +45,49 @@ class UniversalDataReader:
         else:
             return 'generic', 'units', '📡 Generic Sensor'
     
-    def read_any_data_format(self, file_path):
-        """Reads CSV, JSON, TXT - any format"""
+    def read_any_data_format(self, file_path, usecols=None, dtype=None, nrows=None, metadata_only=False):
+        """Reads CSV, JSON, JSON Lines, TXT - any format
+
+        usecols/dtype/nrows are passed through to the underlying reader so callers
+        that need one column or a preview don't load the whole file.
+        metadata_only reads a small preview and counts rows without parsing them.
+        """
         try:
-            if file_path.endswith('.csv'):
-                df = pd.read_csv(file_path)
-            elif file_path.endswith('.json'):
-                with open(file_path, 'r') as f:
+            if metadata_only:
+                nrows = self.PREVIEW_ROWS if nrows is None else nrows
+            
+            total_rows = None
+            # Compressed cold partitions (.gz/.xz) are read transparently
+            data_format = strip_compression(file_path)
+            if data_format.endswith('.csv'):
+                df = pd.read_csv(file_path, usecols=usecols, dtype=dtype, nrows=nrows)
+            elif data_format.endswith(JSON_LINES_EXTENSIONS):
+                records = itertools.islice(self.iter_json_lines(file_path), nrows)
+                df = self.records_to_frame(list(records), usecols, dtype)
+            elif data_format.endswith('.json'):
+                with open_data_file(file_path) as f:
                     data = json.load(f)
                 df = pd.DataFrame(data)
+                # The array is parsed whole anyway; no second pass to count it
+                total_rows = len(df)
+                if usecols is not None:
+                    df = df[[c for c in usecols if c in df.columns]]
+                if nrows is not None:
+                    df = df.head(nrows)
+                if dtype is not None:
+                    df = df.astype(dtype)
             else:
                 # Try to read as text and parse
-                df = self.parse_text_data(file_path)
+                df = self.parse_text_data(file_path, nrows=nrows)
             
             # Auto-detect sensor type from first row or column names
             sensor_type, unit, sensor_name = self.auto_detect_sensor_type(df.columns.tolist() if len(df.columns) > 0 else df.iloc[0] if len(df) > 0 else '')
             
+            if metadata_only:
+                sample_size = total_rows if total_rows is not None else self.count_rows(file_path)
+            else:
+                sample_size = len(df)
+            
             return {
                 'data': df,
                 'sensor_type': sensor_type,
@@ -58,35 +95,150 @@ class UniversalDataReader:
                 'unit': unit,
                 'filename': os.path.basename(file_path),
                 'columns': list(df.columns),
-                'sample_size': len(df)
+                'sample_size': sample_size
             }
         except Exception as e:
             return {'error': str(e)}
     
-    def parse_text_data(self, file_path):
-        """Parse text files with various formats"""
-        data = []
-        with open(file_path, 'r') as f:
+    def iter_chunks(self, file_path, chunksize=None, usecols=None, dtype=None):
+        """Yield the file as fixed-size DataFrame chunks so memory stays flat"""
+        chunksize = chunksize or self.CHUNK_SIZE
+        data_format = strip_compression(file_path)
+        
+        if data_format.endswith('.csv'):
+            with pd.read_csv(file_path, usecols=usecols, dtype=dtype, chunksize=chunksize) as chunks:
+                for chunk in chunks:
+                    yield chunk
+        elif data_format.endswith(JSON_LINES_EXTENSIONS):
+            records = self.iter_json_lines(file_path)
+            while True:
+                batch = list(itertools.islice(records, chunksize))
+                if not batch:
+                    break
+                yield self.records_to_frame(batch, usecols, dtype)
+        elif data_format.endswith('.json'):
+            # A JSON array has to be parsed in one go; only the DataFrame is chunked
+            with open_data_file(file_path) as f:
+                data = json.load(f)
+            df = pd.DataFrame(data)
+            if usecols is not None:
+                df = df[[c for c in usecols if c in df.columns]]
+            if dtype is not None:
+                df = df.astype(dtype)
+            for start in range(0, len(df), chunksize):
+                yield df.iloc[start:start + chunksize]
+        else:
+            with open_data_file(file_path) as f:
+                while True:
+                    lines = list(itertools.islice(f, chunksize))
+                    if not lines:
+                        break
+                    df = self.extract_numbers(lines)
+                    if usecols is not None:
+                        df = df[[c for c in usecols if c in df.columns]]
+                    if len(df) > 0:
+                        yield df
+    
+    def iter_json_lines(self, file_path):
+        """Lazily yield JSON Lines records (indexed when uncompressed)"""
+        if file_path == strip_compression(file_path):
+            for record in JsonLinesFile(file_path).iter_records():
+                yield record
+            return
+        with open_data_file(file_path) as f:
             for line in f:
-                # Try to extract numbers from text
-                numbers = re.findall(r"[-+]?\d*\.\d+|\d+", line)
-                if numbers:
-                    data.append([float(x) for x in numbers])
+                if line.strip():
+                    yield json.loads(line)
+    
+    def read_time_range(self, file_path, start=None, end=None):
+        """Rows of a CSV data file within [start, end], including compacted cold rows"""
+        cold = cold_store.read_frame(file_path, start, end)
+        hot = tail_cache.tail_frame(file_path) if os.path.exists(file_path) else pd.DataFrame()
+        if 'timestamp' in hot.columns:
+            if start is not None:
+                hot = hot[hot['timestamp'] >= pd.Timestamp(start)]
+            if end is not None:
+                hot = hot[hot['timestamp'] <= pd.Timestamp(end)]
+        if cold.empty:
+            return hot.reset_index(drop=True)
+        return pd.concat([cold, hot], ignore_index=True)
+    
+    def read_last_records(self, file_path, n, usecols=None, dtype=None):
+        """Read only the last N records of a JSON Lines file using its offset index"""
+        return self.records_to_frame(JsonLinesFile(file_path).tail(n), usecols, dtype)
+    
+    def append_records(self, file_path, records):
+        """Append structured records to a JSON Lines file"""
+        JsonLinesFile(file_path).append(records)
+    
+    def records_to_frame(self, records, usecols=None, dtype=None):
+        """Build a DataFrame from parsed JSON records"""
+        df = pd.DataFrame.from_records(records, columns=usecols) if records else pd.DataFrame(columns=usecols)
+        if dtype is not None:
+            df = df.astype(dtype)
+        return df
+    
+    def count_rows(self, file_path):
+        """Count data rows without building a DataFrame
+
+        CSVs are counted as records in one streaming pass (quoted fields may
+        span lines, blank lines are skipped); text and JSON Lines files count
+        non-blank lines, through the offset index when uncompressed.
+        """
+        data_format = strip_compression(file_path)
+        if data_format.endswith(JSON_LINES_EXTENSIONS) and data_format == file_path:
+            return JsonLinesFile(file_path).count()
+        if data_format.endswith('.json'):
+            with open_data_file(file_path) as f:
+                return len(json.load(f))
+        
+        with open_data_file(file_path) as f:
+            if data_format.endswith('.csv'):
+                # Header record excluded
+                return max(sum(1 for row in csv.reader(f) if row) - 1, 0)
+            return sum(1 for line in f if line.strip())
+    
+    def extract_numbers(self, lines):
+        """Vectorized numeric extraction: one row per line, one column per number"""
+        series = pd.Series(lines, dtype=object)
+        matches = series.str.extractall(self.NUMBER_PATTERN)[0]
+        if matches.empty:
+            return pd.DataFrame()
+        
+        df = pd.to_numeric(matches, errors='coerce').unstack()
+        df.columns = list(range(len(df.columns)))
+        return df.reset_index(drop=True)
+    
+    def parse_text_data(self, file_path, nrows=None):
+        """Parse text files with various formats"""
+        chunks = []
+        rows = 0
+        for chunk in self.iter_chunks(file_path):
+            chunks.append(chunk)
+            rows += len(chunk)
+            if nrows is not None and rows >= nrows:
+                break
+        
+        if not chunks:
+            return pd.DataFrame()
         
-        return pd.DataFrame(data)
+        df = pd.concat(chunks, ignore_index=True)
+        if nrows is not None:
+            df = df.head(nrows)
+        return df
     
-    def get_active_sensors(self):
-        """Get all active sensor data blocks"""
+    def get_active_sensors(self, data_files=None):
+        """Get all active sensor data blocks (from DATA_FILES, default every data file)"""
+        from app.storage.data_catalog import data_catalog
         sensor_blocks = []
-        BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-        data_dir = os.path.join(BASE_DIR, "data")
         
-        # Find all data files
-        data_files = glob.glob(os.path.join(data_dir, "*.*"))
+        # Find all data files (kept in memory by the directory catalog)
+        if data_files is None:
+            data_files = data_catalog.list_files()
         
         for file_path in data_files:
-            if file_path.endswith(('.csv', '.json', '.txt')):
-                result = self.read_any_data_format(file_path)
+            if file_path.endswith(DATA_EXTENSIONS):
+                result = self.read_any_data_format(file_path, metadata_only=True)
                 
                 if 'error' not in result:
                     sensor_blocks.append({
@@ -95,7 +247,7 @@ class UniversalDataReader:
                         'sensor_type': result['sensor_type'],
                         'unit': result['unit'],
                         'data_sample': result['data'].head(3).to_dict('records'),
-                        'total_readings': len(result['data'])
+                        'total_readings': result['sample_size']
                     })
         
         # If no real data files, create demo sensors
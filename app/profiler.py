@@ -0,0 +1,275 @@
+import cProfile
+import io
+import itertools
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+from datetime import datetime
+
+from flask import request
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOP_FRAMES = 15
+
+
+def env_number(name, default, cast=float):
+    try:
+        return cast(os.getenv(name, default))
+    except ValueError:
+        print(f"Invalid {name}, using {default}")
+        return cast(default)
+
+
+def is_project_file(path):
+    return path.startswith(BASE_DIR) and 'site-packages' not in path
+
+
+def frame_label(code, lineno):
+    path = code.co_filename
+    if is_project_file(path):
+        path = os.path.relpath(path, BASE_DIR)
+    return f"{path}:{lineno}({code.co_name})"
+
+
+class RequestProfiler:
+    """Opt-in profiling of live requests, switchable at runtime
+
+    - PROFILE_SAMPLE_RATE: fraction of requests run under cProfile (0 = off)
+    - X-Profile: 1 header: profile this request (admins only, see is_admin)
+    - PROFILE_SLOW_MS: log requests slower than this, with the frames a
+      background sampler saw them in (0 = off)
+    Profiled requests also record their tracemalloc peak. Only one request
+    is under cProfile at a time; tracemalloc is process-wide, so its peak is
+    exact only when profiled requests do not overlap. Reports are kept in
+    memory (PROFILE_KEEP) and served from /admin/profiles.
+    """
+    SAMPLE_INTERVAL = 0.05
+
+    def __init__(self):
+        self.sample_rate = env_number('PROFILE_SAMPLE_RATE', 0)
+        self.slow_ms = env_number('PROFILE_SLOW_MS', 0)
+        self.token = os.getenv('PROFILE_TOKEN')
+        self.admins = set(e.strip().lower() for e in os.getenv('PROFILE_ADMINS', '').split(',') if e.strip())
+        self.reports = deque(maxlen=env_number('PROFILE_KEEP', 100, int))
+        self.profiles = {}
+        self.active = {}
+        self.ids = itertools.count(1)
+        self.profile_lock = threading.Lock()
+        self.memory_users = 0
+        self.lock = threading.Lock()
+        self.sampler = None
+
+    def init_app(self, app):
+        app.before_request(self._start)
+        app.after_request(self._record_status)
+        app.teardown_request(self._finish)
+
+    def configure(self, sample_rate=None, slow_ms=None):
+        """Change sampling at runtime (from the admin endpoint)"""
+        if sample_rate is not None:
+            self.sample_rate = min(max(float(sample_rate), 0.0), 1.0)
+        if slow_ms is not None:
+            self.slow_ms = max(float(slow_ms), 0.0)
+        return self.settings()
+
+    def settings(self):
+        return {'sample_rate': self.sample_rate, 'slow_ms': self.slow_ms, 'kept': len(self.reports)}
+
+    def is_admin(self, user=None):
+        """PROFILE_TOKEN in X-Profile-Token, or a logged-in user listed in PROFILE_ADMINS"""
+        if self.token and request.headers.get('X-Profile-Token') == self.token:
+            return True
+        email = getattr(user, 'email', None) if getattr(user, 'is_authenticated', False) else None
+        return bool(email) and email.lower() in self.admins
+
+    def _start(self):
+        trigger = None
+        if request.headers.get('X-Profile') and self.is_admin(self._current_user()):
+            trigger = 'header'
+        elif self.sample_rate and random.random() < self.sample_rate:
+            trigger = 'sample'
+        if trigger is None and not self.slow_ms:
+            return
+
+        state = {
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'started': time.perf_counter(),
+            'status': None,
+            'trigger': trigger,
+            'profile': None,
+            'memory': False,
+            'samples': Counter(),
+            'leaves': Counter(),
+            'sample_count': 0
+        }
+        # cProfile cannot run in two threads at once (3.12+ refuses outright)
+        if trigger and self.profile_lock.acquire(blocking=False):
+            self._start_memory(state)
+            state['profile'] = cProfile.Profile()
+            state['profile'].enable()
+        with self.lock:
+            self.active[threading.get_ident()] = state
+        if self.slow_ms:
+            self._ensure_sampler()
+
+    def _record_status(self, response):
+        state = self.active.get(threading.get_ident())
+        if state is not None:
+            state['status'] = response.status_code
+        return response
+
+    def _finish(self, exc=None):
+        with self.lock:
+            state = self.active.pop(threading.get_ident(), None)
+            if state is not None:
+                # The sampler updates these under the lock; work on a snapshot
+                state['samples'] = Counter(state['samples'])
+                state['leaves'] = Counter(state['leaves'])
+        if state is None:
+            return
+        profile = state['profile']
+        if profile is not None:
+            profile.disable()
+            self.profile_lock.release()
+        duration_ms = (time.perf_counter() - state['started']) * 1000
+        peak_kb = self._stop_memory(state)
+
+        slow = self.slow_ms and duration_ms >= self.slow_ms
+        if profile is None and not slow:
+            return
+        report = {
+            'id': next(self.ids),
+            'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'method': state['method'],
+            'path': state['path'],
+            'status': state['status'] if exc is None else 500,
+            'duration_ms': round(duration_ms, 1),
+            'trigger': state['trigger'] or 'slow',
+            'slow': bool(slow),
+            'peak_memory_kb': peak_kb,
+            'top_frames': self._top_sampled(state),
+            'has_profile': profile is not None
+        }
+        if profile is not None:
+            report['top_functions'] = self._top_profiled(profile)
+            profile.create_stats()
+            profile_data = marshal.dumps(profile.stats)
+        with self.lock:
+            if len(self.reports) == self.reports.maxlen:
+                self.profiles.pop(self.reports[0]['id'], None)
+            self.reports.append(report)
+            if profile is not None:
+                self.profiles[report['id']] = profile_data
+        if slow:
+            where = report['top_frames'][0]['frame'] if report['top_frames'] else 'no samples'
+            print(f"🐢 Slow request {report['method']} {report['path']}: {report['duration_ms']:.0f}ms ({where})")
+
+    def list_reports(self):
+        with self.lock:
+            return [dict((k, v) for k, v in r.items() if k not in ('top_frames', 'top_functions'))
+                    for r in reversed(self.reports)]
+
+    def get_report(self, report_id):
+        with self.lock:
+            for report in self.reports:
+                if report['id'] == report_id:
+                    return report
+        return None
+
+    def get_profile(self, report_id):
+        """Raw pstats data (for snakeviz / pstats.Stats) of a profiled request"""
+        with self.lock:
+            return self.profiles.get(report_id)
+
+    def _current_user(self):
+        from flask_login import current_user
+        return current_user
+
+    def _start_memory(self, state):
+        with self.lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            self.memory_users += 1
+        tracemalloc.reset_peak()
+        state['memory'] = True
+
+    def _stop_memory(self, state):
+        if not state['memory']:
+            return None
+        _, peak = tracemalloc.get_traced_memory()
+        with self.lock:
+            self.memory_users -= 1
+            if self.memory_users == 0:
+                tracemalloc.stop()
+        return round(peak / 1024, 1)
+
+    def _top_profiled(self, profile):
+        stats = pstats.Stats(profile, stream=io.StringIO())
+        rows = []
+        for (path, line, func), (_, calls, tottime, cumtime, _) in stats.stats.items():
+            if is_project_file(path):
+                path = os.path.relpath(path, BASE_DIR)
+            rows.append({'function': f"{path}:{line}({func})", 'calls': calls,
+                         'own_ms': round(tottime * 1000, 2), 'cumulative_ms': round(cumtime * 1000, 2)})
+        rows.sort(key=lambda row: row['cumulative_ms'], reverse=True)
+        return rows[:TOP_FRAMES]
+
+    def _top_sampled(self, state):
+        """Project frames by share of samples (inclusive), then the hottest leaves"""
+        total = state['sample_count']
+        if not total:
+            return []
+        top = [{'frame': f, 'samples': n, 'share': round(n / total, 3), 'kind': 'app'}
+               for f, n in state['samples'].most_common(TOP_FRAMES)]
+        top += [{'frame': f, 'samples': n, 'share': round(n / total, 3), 'kind': 'leaf'}
+                for f, n in state['leaves'].most_common(5)]
+        return top
+
+    def _ensure_sampler(self):
+        with self.lock:
+            if self.sampler is not None and self.sampler.is_alive():
+                return
+            self.sampler = threading.Thread(target=self._sample_loop, daemon=True)
+            self.sampler.start()
+
+    def _sample_loop(self):
+        """Record where long-running requests are, every SAMPLE_INTERVAL"""
+        while self.slow_ms:
+            time.sleep(self.SAMPLE_INTERVAL)
+            threshold = time.perf_counter() - min(self.slow_ms / 2000, 0.5)
+            with self.lock:
+                running = [(ident, state) for ident, state in self.active.items() if state['started'] < threshold]
+            if not running:
+                continue
+            frames = sys._current_frames()
+            for ident, state in running:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                leaf = frame_label(frame.f_code, frame.f_lineno)
+                seen = []
+                while frame is not None:
+                    if is_project_file(frame.f_code.co_filename):
+                        label = frame_label(frame.f_code, frame.f_code.co_firstlineno)
+                        if label not in seen:
+                            seen.append(label)
+                    frame = frame.f_back
+                with self.lock:
+                    # The request may have finished meanwhile
+                    if self.active.get(ident) is not state:
+                        continue
+                    state['sample_count'] += 1
+                    state['leaves'][leaf] += 1
+                    for label in seen:
+                        state['samples'][label] += 1
+
+
+# Global instance
+request_profiler = RequestProfiler()
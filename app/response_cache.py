@@ -0,0 +1,41 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """Built JSON payloads keyed by the data version they came from
+
+    Keys carry the version (file size/mtime, device sequence), so entries
+    never go stale; the TTL and size limit only bound memory.
+    """
+    def __init__(self, max_entries=256, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get_or_build(self, key, build):
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and now - entry[0] <= self.ttl:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        # Built outside the lock; two concurrent misses just build twice
+        payload = build()
+        with self.lock:
+            self.entries[key] = (now, payload)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return payload
+
+
+# Global instance
+response_cache = ResponseCache()
@@ -1,20 +1,51 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash, session, jsonify
+from flask import Blueprint, render_template, redirect, url_for, request, flash, session, jsonify, Response, stream_with_context
 from flask_login import login_user, logout_user, login_required, current_user
 from app.models import User, DeviceConnection
 from app import db
-from app.ml_engine.predictor import predict_next_value
-from app.ml_engine.universal_reader import UniversalDataReader
+from app.startup import lazy, resolve
 from app.ml_engine.ai_context import IoTContextAI
-from app.ml_engine.time_series_ai import TimeSeriesAI
 from app.device_manager.serial_manager import device_manager
-import pandas as pd
+from app.device_manager.change_tracker import change_tracker
+from app.device_manager.command_queue import command_registry
+from app.device_manager.delta_codec import delta_decoder
+from app.admission import admission_control
+from app.response_cache import response_cache
+from app.profiler import request_profiler
 import os
 import random
-import glob
-import numpy as np
 from datetime import datetime, timedelta
 import csv
 import json
+import gzip
+import hashlib
+import math
+import re
+
+# Heavy modules (pandas, numpy, ml_engine, storage) load on first use under FAST_START
+pd = lazy('pandas')
+np = lazy('numpy')
+predict_next_value = lazy('app.ml_engine.predictor', 'predict_next_value')
+UniversalDataReader = lazy('app.ml_engine.universal_reader', 'UniversalDataReader')
+DATA_EXTENSIONS = lazy('app.ml_engine.universal_reader', 'DATA_EXTENSIONS')
+TimeSeriesAI = lazy('app.ml_engine.time_series_ai', 'TimeSeriesAI')
+sensor_summaries = lazy('app.ml_engine.sensor_summaries', 'sensor_summaries')
+tail_cache = lazy('app.storage.tail_cache', 'tail_cache')
+data_catalog = lazy('app.storage.data_catalog', 'data_catalog')
+cold_store = lazy('app.storage.cold_store', 'cold_store')
+export_stream = lazy('app.storage.export', 'export_stream')
+parse_time_arg = lazy('app.storage.export', 'parse_time_arg')
+time_index = lazy('app.storage.time_index', 'time_index')
+parse_step = lazy('app.storage.time_index', 'parse_step')
+pack_series = lazy('app.storage.time_index', 'pack_series')
+stream_aligner = lazy('app.storage.alignment', 'stream_aligner')
+StreamSpec = lazy('app.storage.alignment', 'StreamSpec')
+correlation_engine = lazy('app.ml_engine.correlation', 'correlation_engine')
+partition_index = lazy('app.storage.partitions', 'partition_index')
+visible_to = lazy('app.storage.partitions', 'visible_to')
+sensor_of = lazy('app.storage.partitions', 'sensor_of')
+group_writer = lazy('app.storage.writer', 'group_writer')
+analytics_executor = lazy('app.ml_engine.executor', 'analytics_executor')
+analytics_tasks = lazy('app.ml_engine.analytics_tasks')
 
 routes = Blueprint("routes", __name__)
 
@@ -28,6 +59,39 @@ os.makedirs(DATA_DIR, exist_ok=True)
 # Default CSV file (fallback)
 CSV_FILE = os.path.join(DATA_DIR, "sensor_data.csv")
 
+# Dashboard time ranges backed by real timestamps (longer ranges are synthetic)
+TIME_RANGE_WINDOWS = {
+    '1hour': timedelta(hours=1),
+    '6hours': timedelta(hours=6),
+    '1day': timedelta(days=1),
+}
+
+# Raw points returned by /api/query and /api/series before a step is required
+MAX_QUERY_POINTS = 10000
+# Readings per /api/history page on the dashboard chart
+DASHBOARD_PAGE_POINTS = 500
+MAX_SERIES_POINTS = 200000
+# Longest a request may wait on a device reply
+MAX_COMMAND_WAIT = 10
+# Streams one /api/aligned request may combine
+MAX_ALIGNED_STREAMS = 32
+# Streams compared by /api/correlation and the assistant
+MAX_CORRELATION_STREAMS = 256
+# Seconds an agent waits before resending a batch the server failed to store
+STORE_RETRY_AFTER = 5
+
+def parse_agent_tokens(raw):
+    """'tok1=1,tok2=2' -> {'tok1': 1, 'tok2': 2}"""
+    tokens = {}
+    for item in raw.split(','):
+        token, _, user_id = item.strip().partition('=')
+        if token and user_id.strip().isdigit():
+            tokens[token] = int(user_id)
+    return tokens
+
+# Agent tokens bound to a user (DEVICE_AGENT_TOKENS); their data goes to that user's partitions
+AGENT_TOKEN_USERS = parse_agent_tokens(os.getenv('DEVICE_AGENT_TOKENS', ''))
+
 # Create default data file if it doesn't exist
 def ensure_data_file():
     """Ensure data file exists with sample content"""
@@ -150,51 +214,107 @@ def create_live_dashboard_data(live_data):
 @routes.route("/")
 @login_required
 def dashboard():
-    # Ensure data file exists
-    ensure_data_file()
+    # Only the page shell; chart, sensors and devices load from the /api/dashboard/* endpoints
+    time_range = request.args.get('range', '1day')
     
-    # Get time range from request (default: 1day)
+    return render_template("dashboard.html", 
+                         username=current_user.email,
+                         time_range=time_range)
+
+def file_version(file_path):
+    """(size, mtime) of FILE_PATH, or None if it does not exist"""
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+def version_etag(*key):
+    """ETag for a cache key made of data versions"""
+    return change_tracker.etag(hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:20])
+
+@routes.route("/api/dashboard/summary")
+@login_required
+def api_dashboard_summary():
+    """Chart data, prediction and statistics for the dashboard
+    Cached until the device data or the active file changes.
+    Query: range=1hour|6hours|1day|1week|1month
+    """
+    ensure_data_file()
     time_range = request.args.get('range', '1day')
     
-    # Check if we have connected Arduino devices
-    connected_devices = device_manager.get_connected_devices()
+    # PRIORITY: Use live Arduino data if available
     live_data = get_live_arduino_data()
+    if live_data:
+        active_file = None
+        key = ('summary', current_user.id, time_range, 'arduino', change_tracker.devices_version())
+    else:
+        active_file = get_most_recent_sensor_file()
+        key = ('summary', current_user.id, time_range, active_file, file_version(active_file))
     
-    # PRIORITY: Use live Arduino data if available
+    try:
+        return conditional_json(version_etag(*key), lambda: response_cache.get_or_build(
+            key, lambda: build_dashboard_summary(time_range, live_data, active_file)))
+    except TimeoutError:
+        # Not cached; the statistics keep computing and the retry picks them up
+        return retry_later('Statistics still being computed', 1, 503)
+
+def build_dashboard_summary(time_range, live_data, active_file):
+    history_url = None
     if live_data:
-        print(f"🎯 Using LIVE Arduino data from {len(connected_devices)} devices")
+        print(f"🎯 Using LIVE Arduino data from {len(device_manager.get_connected_devices())} devices")
         timestamps, values, summary_stats = create_live_dashboard_data(live_data)
         predicted_value = predict_next_value_live(values) if values else 0
         data_source = "arduino"
     else:
         # Fallback to file data
         print("📁 Using FILE data (no Arduino connected)")
-        active_file = get_most_recent_sensor_file()
         predicted_value = predict_next_value(active_file)
         timestamps, values, summary_stats = read_file_data(active_file, time_range)
         data_source = "file"
+        
+        # Real time windows are paged in from /api/history instead of sent whole
+        if active_file.endswith('.csv') and time_range in TIME_RANGE_WINDOWS and values:
+            history_url = url_for('routes.api_history', sensor=os.path.basename(active_file),
+                                  range=time_range, limit=DASHBOARD_PAGE_POINTS)
+            timestamps, values = [], []
     
-    # Get active sensor information
-    reader = UniversalDataReader()
-    active_sensors = reader.get_active_sensors()
-    current_sensor = detect_current_sensor()
+    return {
+        'data_source': data_source,
+        'current_sensor': detect_current_sensor(),
+        'predicted': predicted_value,
+        'summary_stats': summary_stats,
+        'labels': timestamps,
+        'values': values,
+        'history_url': history_url,
+        'live_data': [serialize_live_reading(reading) for reading in live_data]
+    }
+
+def serialize_live_reading(reading):
+    """Live reading as JSON, with its timestamp as HH:MM:SS"""
+    item = dict(reading)
+    timestamp = item.pop('timestamp', None)
+    item['time'] = timestamp.strftime('%H:%M:%S') if timestamp else ''
+    return item
+
+@routes.route("/api/dashboard/sensors")
+@login_required
+def api_dashboard_sensors():
+    """Active sensor blocks for the current user, cached until one of their files changes"""
+    data_files = user_data_files()
+    key = ('sensors', current_user.id, tuple((f, file_version(f)) for f in data_files))
     
-    # Get device status for dashboard
-    available_ports = device_manager.scan_ports()
+    def build_payload():
+        reader = UniversalDataReader()
+        return {'sensors': [{
+            'filename': block['filename'],
+            'sensor_name': block['sensor_name'],
+            'sensor_type': block['sensor_type'],
+            'unit': block['unit'],
+            'total_readings': block['total_readings']
+        } for block in reader.get_active_sensors(data_files)]}
     
-    return render_template("dashboard.html", 
-                         username=current_user.email,
-                         predicted=predicted_value,
-                         timestamps=timestamps,
-                         values=values,
-                         active_sensors=active_sensors,
-                         current_sensor=current_sensor,
-                         time_range=time_range,
-                         summary_stats=summary_stats,
-                         available_ports=available_ports,
-                         connected_devices=connected_devices,
-                         data_source=data_source,
-                         live_data=live_data)
+    return conditional_json(version_etag(*key), lambda: response_cache.get_or_build(key, build_payload))
 
 def predict_next_value_live(values):
     """Predict next value based on live data"""
@@ -212,10 +332,25 @@ def read_file_data(active_file, time_range):
     """Read data from file for dashboard"""
     try:
         if os.path.exists(active_file):
-            df = pd.read_csv(active_file)
+            if active_file.endswith('.csv'):
+                # Only rows appended since the last view are parsed
+                df = None
+                window = TIME_RANGE_WINDOWS.get(time_range)
+                latest = time_index.latest_timestamp(active_file) if window else None
+                if latest is not None:
+                    # Binary search straight to the window instead of loading the file
+                    end = datetime(1970, 1, 1) + timedelta(milliseconds=latest)
+                    ts, vals, field = time_index.query(active_file, end - window, end)
+                    if field:
+                        df = pd.DataFrame({'timestamp': ts.astype('datetime64[ms]'), field: vals})
+                if df is None:
+                    df = tail_cache.tail_frame(active_file)
+            else:
+                df = pd.read_csv(active_file)
             
             # Filter data based on time range
-            df, summary_stats = filter_data_by_time_range(df, time_range)
+            df, summary_stats = filter_data_by_time_range(
+                df, time_range, cache_key=(active_file, file_version(active_file), time_range))
             
             # Handle different column names and ensure proper data types
             if 'timestamp' in df.columns and 'sensor_value' in df.columns:
@@ -242,6 +377,9 @@ def read_file_data(active_file, time_range):
                 
         return timestamps, values, summary_stats
         
+    except TimeoutError:
+        # Statistics still computing in the analytics pool; the caller answers 503
+        raise
     except Exception as e:
         print(f"Error reading file data: {e}")
         # Fallback demo data
@@ -272,8 +410,9 @@ def device_manager_page():
 @routes.route("/api/scan-ports")
 @login_required
 def api_scan_ports():
-    """API to scan for available ports"""
-    ports = device_manager.scan_ports()
+    """API to scan for available ports (?detect=1 also samples baud rate and protocol)"""
+    detect = request.args.get('detect', '').lower() in ('1', 'true', 'yes')
+    ports = device_manager.scan_ports(detect=detect)
     return jsonify(ports)
 
 @routes.route("/api/connect-device", methods=["POST"])
@@ -327,23 +466,63 @@ def api_disconnect_device():
 @login_required
 def api_send_command():
     """API to send command to device"""
-    data = request.get_json()
+    data = request.get_json(silent=True) or {}
     port_name = data.get('port')
     command = data.get('command')
+    try:
+        timeout = min(float(data.get('timeout', 5)), MAX_COMMAND_WAIT)
+        wait = min(float(data.get('wait', 0)), timeout)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'timeout and wait must be numbers'}), 400
+    if not timeout > 0 or not wait >= 0:
+        return jsonify({'success': False, 'message': 'timeout must be positive and wait not negative'}), 400
+    
+    result = device_manager.send_command(port_name, command, timeout)
+    if not result['success']:
+        return jsonify(result)
     
-    result = device_manager.send_command(port_name, command)
+    # Optional bounded wait for the reply; otherwise poll /api/command/<id>
+    if wait > 0:
+        pending = command_registry.get(result['command_id'])
+        try:
+            pending.future.result(timeout=wait)
+        except Exception:
+            pass
+    result.update(device_manager.get_command(result['command_id']))
     return jsonify(result)
 
+@routes.route("/api/command/<int:command_id>")
+@login_required
+def api_command_status(command_id):
+    """Poll a queued command's status and reply"""
+    status = device_manager.get_command(command_id)
+    if status is None:
+        return jsonify({'success': False, 'message': 'Unknown command'}), 404
+    status['success'] = True
+    return jsonify(status)
+
+def conditional_json(etag, build_payload):
+    """jsonify(build_payload()) unless the client already holds ETAG (then 304)"""
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = jsonify(build_payload())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @routes.route("/api/device-status")
 @login_required
 def api_device_status():
     """API to get current device status"""
-    available_ports = device_manager.scan_ports()
-    connected_devices = device_manager.get_connected_devices()
+    # Reuse a recent scan; probing every port on each poll is the expensive part
+    available_ports = device_manager.get_available_ports()
+    etag = change_tracker.etag('status', change_tracker.devices_version(), change_tracker.inventory_seq)
     
-    return jsonify({
+    return conditional_json(etag, lambda: {
         'available_ports': available_ports,
-        'connected_devices': connected_devices
+        'connected_devices': device_manager.get_connected_devices(),
+        'seq': change_tracker.current()
     })
 
 
@@ -353,112 +532,591 @@ def api_forward_serial():
     """Receive forwarded serial lines from a local agent.
     Expects header `X-DEVICE-AGENT-TOKEN` matching env var `DEVICE_AGENT_TOKEN`.
     Body JSON: {"port": "COM3", "data": "line from device"}
+    or a batch from a multi-port agent:
+    {"records": [{"port": "COM3", "data": "...", "ts": "YYYY-MM-DD HH:MM:SS"}, ...]}
+    Records may carry "enc": "key" / "delta" and a per-port "seq" (see
+    delta_codec); ports listed in "keyframe_needed" must send a keyframe.
+    Data from a logged-in user or a user-bound token (DEVICE_AGENT_TOKENS) is
+    stored in that user's partitions; the shared DEVICE_AGENT_TOKEN writes to
+    sensor_data.csv.
     """
     token = request.headers.get('X-DEVICE-AGENT-TOKEN')
     expected = os.getenv('DEVICE_AGENT_TOKEN')
 
     # Allow either a logged-in session or a valid agent token
-    user_id = None
-    if current_user and getattr(current_user, 'is_authenticated', False):
-        user_id = current_user.id
-    else:
-        if not expected or token != expected:
+    user_id = current_user_id()
+    if user_id is None:
+        if token and token in AGENT_TOKEN_USERS:
+            user_id = AGENT_TOKEN_USERS[token]
+        elif not expected or token != expected:
             return jsonify({'success': False, 'message': 'Unauthorized'}), 401
 
+    # Shed ingest first when the server is busy, so the dashboard keeps its workers
+    retry_after = admission_control.enter_ingest()
+    if retry_after:
+        return retry_later('Server busy, retry later', retry_after, 503)
+    try:
+        # Rate limits follow the agent token, or the user for browser sessions
+        return ingest_forwarded(user_id, token or f"user:{user_id}")
+    finally:
+        admission_control.leave_ingest()
+
+def ingest_forwarded(user_id, limit_key):
+    """Store a forwarded payload for USER_ID once LIMIT_KEY's rate limits admit it
+    Answers 503 with Retry-After when the rows could not be stored, so the agent keeps the batch.
+    """
     try:
         payload = request.get_json(force=True)
     except Exception:
         return jsonify({'success': False, 'message': 'Invalid JSON'}), 400
 
-    port = payload.get('port', 'agent')
-    data_line = payload.get('data') or payload.get('line')
-    if not data_line:
-        return jsonify({'success': False, 'message': 'No data provided'}), 400
+    records = payload.get('records')
+    if not isinstance(records, list):
+        records = [payload]
 
-    # Ensure there's an entry for this port in the device manager
-    if port not in device_manager.connected_devices:
-        device_manager.connected_devices[port] = {
-            'serial': None,
-            'port': port,
-            'baudrate': None,
-            'connected_at': datetime.now(),
-            'last_data': None,
-            'data_count': 0
-        }
-
-    # Update stored info and let device manager process it for logging/parsing
-    device_manager.connected_devices[port]['last_data'] = data_line
-    device_manager.connected_devices[port]['data_count'] += 1
-    device_manager.connected_devices[port]['last_update'] = datetime.now()
+    # Charged before delta decoding, so a rejected batch can be resent unchanged
+    port_counts = {}
+    for record in records:
+        if isinstance(record, dict):
+            port = str(record.get('port', 'agent'))
+            port_counts[port] = port_counts.get(port, 0) + 1
+    retry_after = admission_control.admit(limit_key, port_counts)
+    if retry_after:
+        return retry_later('Rate limit exceeded', retry_after, 429)
 
-    try:
-        device_manager.process_incoming_data(port, data_line)
-    except Exception as e:
-        print(f"Error processing forwarded data: {e}")
+    entries = []
+    skipped = 0
+    keyframe_needed = set()
+    decoding = delta_decoder.begin()
+    for record in records:
+        data_line = record.get('data') or record.get('line') if isinstance(record, dict) else None
+        if not data_line:
+            continue
+        # JSON payloads may send numeric ports; the index and file names expect text
+        port = str(record.get('port', 'agent'))
+        # Resent records are dropped by seq; delta records are rebuilt against the port's last keyframe
+        seq = record.get('seq') if isinstance(record.get('seq'), int) else None
+        stream = record.get('stream') if isinstance(record.get('stream'), str) else None
+        data_line, reason = decoding.decode((user_id, port), record.get('enc'), data_line, seq, stream)
+        if data_line is None:
+            skipped += 1
+            if reason == 'keyframe':
+                keyframe_needed.add(port)
+            continue
+        entries.append((port, data_line, forwarded_timestamp(record.get('ts'))))
+    if not entries:
+        decoding.commit()
+        if skipped:
+            return jsonify({'success': True, 'accepted': 0, 'skipped': skipped,
+                            'keyframe_needed': sorted(keyframe_needed, key=str)})
+        return jsonify({'success': False, 'message': 'No data provided'}), 400
 
-    # Persist forwarded data to a per-user CSV (or global if no user)
+    # Persist forwarded data to the user's per-port partitions (or the shared file if no user)
+    stored = set()
+    store_error = None
     try:
         if user_id:
-            csv_file = os.path.join(DATA_DIR, f"user_{user_id}_serial.csv")
+            partition_index.load(user_id)
+            by_port = {}
+            for entry in entries:
+                by_port.setdefault(entry[0], []).append(entry)
+            for port, rows in by_port.items():
+                csv_file = partition_index.partition_path(user_id, port)
+                append_forwarded_rows(csv_file, rows)
+                stored.add(port)
+                partition_index.record(user_id, port, [(ts, data_line) for _, data_line, ts in rows])
+                # Keep the assistant's rollups current with every ingested row
+                sensor_summaries.refresh(csv_file)
         else:
             csv_file = os.path.join(DATA_DIR, "sensor_data.csv")
-
-        # Append row: timestamp, port, data
-        with open(csv_file, 'a', newline='', encoding='utf-8') as f:
-            # Create header if empty
-            if os.path.getsize(csv_file) == 0:
-                f.write('timestamp,port,data\n')
-            ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            # Escape quotes/newlines
-            safe_data = data_line.replace('"', '""').replace('\n', ' ')
-            f.write(f'"{ts}","{port}","{safe_data}"\n')
+            append_forwarded_rows(csv_file, entries)
+            stored.update(entry[0] for entry in entries)
+            sensor_summaries.refresh(csv_file)
     except Exception as e:
         print(f"Error persisting forwarded data: {e}")
+        store_error = e
+
+    # Decoder state only moves past rows that were stored; the rest decode again when resent
+    decoding.commit([(user_id, port) for port in stored])
+    if store_error is not None and not stored:
+        return retry_later('Could not store the data, please resend', STORE_RETRY_AFTER, 503)
+
+    for port, data_line, _ in entries:
+        if port not in stored:
+            continue
+        # Ensure there's an entry for this port in the device manager
+        if port not in device_manager.connected_devices:
+            device_manager.connected_devices[port] = {
+                'serial': None,
+                'port': port,
+                'baudrate': None,
+                'connected_at': datetime.now(),
+                'last_data': None,
+                'data_count': 0
+            }
+
+        # Update stored info and let device manager process it for logging/parsing
+        device_manager.connected_devices[port]['last_data'] = data_line
+        device_manager.connected_devices[port]['data_count'] += 1
+        device_manager.connected_devices[port]['last_update'] = datetime.now()
+
+        try:
+            device_manager.process_incoming_data(port, data_line)
+        except Exception as e:
+            print(f"Error processing forwarded data: {e}")
 
     # If we have a logged-in user, ensure a DeviceConnection record exists
     if user_id:
         try:
-            conn = DeviceConnection.query.filter_by(user_id=user_id, port_name=port, status='connected').first()
-            if not conn:
-                conn = DeviceConnection(user_id=user_id, port_name=port, baudrate=None, status='connected')
-                db.session.add(conn)
-                db.session.commit()
+            for port in sorted(stored, key=str):
+                conn = DeviceConnection.query.filter_by(user_id=user_id, port_name=port, status='connected').first()
+                if not conn:
+                    conn = DeviceConnection(user_id=user_id, port_name=port, baudrate=None, status='connected')
+                    db.session.add(conn)
+            db.session.commit()
         except Exception as e:
             print(f"Error creating DeviceConnection: {e}")
 
-    return jsonify({'success': True})
+    if store_error is not None:
+        # Stored ports are dropped as duplicates when the agent resends the batch
+        return retry_later('Could not store all of the data, please resend', STORE_RETRY_AFTER, 503)
+    return jsonify({'success': True, 'accepted': len(entries), 'skipped': skipped,
+                    'keyframe_needed': sorted(keyframe_needed, key=str)})
+
+def retry_later(message, retry_after, status):
+    """429/503 response with a Retry-After header (whole seconds, at least 1)"""
+    response = jsonify({'success': False, 'message': message, 'retry_after': round(retry_after, 2)})
+    response.status_code = status
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+def append_forwarded_rows(csv_file, rows):
+    """Append (port, data, timestamp) rows as timestamp,port,data CSV lines
+    Written by the group-commit writer, as durably as the rows' sensor class asks.
+    """
+    lines = []
+    for port, data_line, ts in rows:
+        # Escape quotes/newlines
+        safe_data = data_line.replace('"', '""').replace('\n', ' ')
+        lines.append(f'"{ts}","{port}","{safe_data}"\n')
+    group_writer.append(csv_file, lines, header='timestamp,port,data\n',
+                        sensors=set(sensor_of(data_line)[0] for _, data_line, _ in rows))
+
+def forwarded_timestamp(value):
+    """Agent capture time if well-formed, else now"""
+    if value:
+        try:
+            return datetime.strptime(value, '%Y-%m-%d %H:%M:%S').strftime('%Y-%m-%d %H:%M:%S')
+        except (TypeError, ValueError):
+            pass
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
 @routes.route("/api/live-data")
 @login_required
 def api_live_data():
-    """API endpoint for live device data"""
-    connected_devices = device_manager.get_connected_devices()
+    """API endpoint for live device data
+    With ?since=<seq>&boot=<boot> only devices changed after that sequence are returned.
+    """
+    version = change_tracker.devices_version()
+    since = request.args.get('since', type=int)
+    same_boot = request.args.get('boot') == change_tracker.boot_id
     
-    live_data = []
-    for device in connected_devices:
-        live_data.append({
-            'port': device['port'],
-            'last_data': device['last_data'],
-            'data_count': device['data_count'],
-            'last_update': device.get('last_update', '').strftime('%H:%M:%S') if device.get('last_update') else ''
-        })
+    def serialize(devices):
+        live_data = []
+        for device in devices:
+            live_data.append({
+                'port': device['port'],
+                'last_data': device['last_data'],
+                'data_count': device['data_count'],
+                'last_update': device.get('last_update', '').strftime('%H:%M:%S') if device.get('last_update') else ''
+            })
+        return live_data
+    
+    if since is None:
+        return conditional_json(change_tracker.etag('live', version),
+                                lambda: serialize(device_manager.get_connected_devices()))
     
-    return jsonify(live_data)
+    def build_delta():
+        if same_boot and since <= version:
+            changed, removed = change_tracker.changed_since(since)
+            devices = [d for d in device_manager.get_connected_devices() if d['port'] in changed]
+            full = False
+        else:
+            # Unknown or stale sequence (e.g. server restarted): send everything
+            devices, removed, full = device_manager.get_connected_devices(), [], True
+        return {
+            'seq': version,
+            'boot': change_tracker.boot_id,
+            'full': full,
+            'devices': serialize(devices),
+            'removed': removed
+        }
+    
+    return conditional_json(change_tracker.etag('live', since, version, int(same_boot)), build_delta)
 
 @routes.route("/api/dashboard-live-data")
 @login_required
 def api_dashboard_live_data():
     """API for dashboard to get updated live data"""
-    live_data = get_live_arduino_data()
-    connected_devices = device_manager.get_connected_devices()
+    version = change_tracker.devices_version()
     
-    response_data = {
-        'live_data': live_data,
-        'connected_count': len(connected_devices),
-        'timestamp': datetime.now().strftime("%H:%M:%S")
-    }
+    def build_payload():
+        live_data = get_live_arduino_data()
+        connected_devices = device_manager.get_connected_devices()
+        return {
+            'live_data': live_data,
+            'connected_count': len(connected_devices),
+            'timestamp': datetime.now().strftime("%H:%M:%S"),
+            'seq': version
+        }
+    
+    return conditional_json(change_tracker.etag('dashboard', version), build_payload)
+
+def resolve_data_file(name):
+    """Map a user-supplied sensor/file name onto one of the user's partitions
+    or a shared file in DATA_DIR (or None)"""
+    file_name = os.path.basename(name or '')
+    if not file_name:
+        return None
+    if not file_name.endswith(resolve(DATA_EXTENSIONS)):
+        file_name += '.csv'
+    user_id = current_user_id()
+    if user_id:
+        partition = partition_index.resolve(user_id, file_name)
+        if partition:
+            return partition
+    file_path = os.path.join(DATA_DIR, file_name)
+    if not visible_to(file_path, user_id):
+        return None
+    if os.path.exists(file_path) or cold_store.list_partitions(file_path):
+        return file_path
+    return None
+
+@routes.route("/api/export")
+@login_required
+def api_export():
+    """Stream sensor history as CSV or NDJSON without loading it into memory
+    Query: sensor=<file> and/or port=<port>, from=, to=, format=csv|ndjson, gzip=1
+    """
+    fmt = request.args.get('format', 'csv').lower()
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'success': False, 'message': 'format must be csv or ndjson'}), 400
+    
+    try:
+        start = parse_time_arg(request.args.get('from'))
+        end = parse_time_arg(request.args.get('to'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    sensor = request.args.get('sensor')
+    port = request.args.get('port') or None
+    if sensor:
+        file_path = resolve_data_file(sensor)
+        if not file_path:
+            return jsonify({'success': False, 'message': 'Unknown sensor'}), 404
+        file_paths = [file_path]
+    elif port:
+        # This user's partition for the port (and pre-partition rows), then the shared file
+        file_paths = [partition_index.partition_path(current_user.id, port),
+                      os.path.join(DATA_DIR, f"user_{current_user.id}_serial.csv"), CSV_FILE]
+    else:
+        return jsonify({'success': False, 'message': 'sensor or port is required'}), 400
+    # Never stream another user's rows, whatever the resolution above returned
+    file_paths = [path for path in file_paths if visible_to(path, current_user.id)]
+    if not file_paths:
+        return jsonify({'success': False, 'message': 'Unknown sensor'}), 404
     
-    return jsonify(response_data)
+    compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+    body = export_stream(file_paths, start, end, port, fmt, compress)
+    
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    download_name = f"{os.path.splitext(os.path.basename(file_paths[0]))[0] if sensor else port}.{fmt}"
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+    response.headers['X-Accel-Buffering'] = 'no'
+    if compress:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+def run_series_query(max_points):
+    """Shared argument handling for /api/query and /api/series
+    Returns (result, None) or (None, error response).
+    """
+    sensor = request.args.get('sensor') or os.path.basename(get_most_recent_sensor_file())
+    file_path = resolve_data_file(sensor)
+    if not file_path:
+        return None, (jsonify({'success': False, 'message': 'Unknown sensor'}), 404)
+    
+    try:
+        start = parse_time_arg(request.args.get('from'))
+        end = parse_time_arg(request.args.get('to'))
+        step = parse_step(request.args.get('step'))
+    except ValueError as e:
+        return None, (jsonify({'success': False, 'message': str(e)}), 400)
+    
+    # range=1hour|6hours|1day: window ending at the latest reading
+    window = TIME_RANGE_WINDOWS.get(request.args.get('range'))
+    if window and start is None and end is None and os.path.exists(file_path):
+        latest = time_index.latest_timestamp(file_path)
+        if latest is not None:
+            end = datetime(1970, 1, 1) + timedelta(milliseconds=latest)
+            start = end - window
+    
+    # before=<epoch ms>: paging cursor, only readings older than the previous page
+    before = request.args.get('before', type=int)
+    if before is not None:
+        cursor = datetime(1970, 1, 1) + timedelta(milliseconds=before - 1)
+        end = cursor if end is None else min(end, cursor)
+    
+    agg = request.args.get('agg')
+    timestamps, values, field = time_index.query(file_path,
+                                                 start, end,
+                                                 field=request.args.get('field') or None,
+                                                 port=request.args.get('port') or None)
+    
+    truncated = False
+    if agg or step:
+        # Large ranges are aggregated in the analytics pool; the key pins the file version
+        cache_key = (file_path, file_version(file_path), start, end, field,
+                     request.args.get('port'), agg, step)
+        try:
+            timestamps, values = analytics_executor.run(analytics_tasks.aggregate_series, timestamps, values,
+                                                        agg=agg or 'mean', step=step, cache_key=cache_key)
+        except ValueError as e:
+            return None, (jsonify({'success': False, 'message': str(e)}), 400)
+        except TimeoutError:
+            return None, retry_later('Aggregation still running', 1, 503)
+    elif len(timestamps) > max_points:
+        # Too many raw points: return the newest ones and ask for a step.
+        # Readings sharing the cut timestamp stay together, so a `before` cursor never splits them.
+        cut = int(np.searchsorted(timestamps, timestamps[-max_points], side='left'))
+        timestamps, values = timestamps[cut:], values[cut:]
+        truncated = cut > 0
+    
+    return {
+        'sensor': os.path.basename(file_path),
+        'field': field,
+        'agg': agg or ('mean' if step else None),
+        'step_ms': step,
+        'truncated': truncated,
+        'timestamps': timestamps,
+        'values': values
+    }, None
+
+@routes.route("/api/query")
+@login_required
+def api_query():
+    """Time-range query over one sensor series
+    Query: sensor=<file>, field=, port=, from=, to=, range=1hour|6hours|1day,
+           agg=mean|min|max|count|sum|median|first|last|pNN, step=30s|5m|1h|1d
+    """
+    result, error = run_series_query(MAX_QUERY_POINTS)
+    if error:
+        return error
+    
+    return jsonify({
+        'success': True,
+        'sensor': result['sensor'],
+        'field': result['field'],
+        'agg': result['agg'],
+        'step_ms': result['step_ms'],
+        'count': int(len(result['timestamps'])),
+        'truncated': result['truncated'],
+        'timestamps': result['timestamps'].tolist(),
+        'values': [round(float(v), 4) for v in result['values']]
+    })
+
+@routes.route("/api/history")
+@login_required
+def api_history():
+    """Raw readings one page at a time, newest page first
+    Query: same as /api/query plus limit= (readings per page) and
+           before=<next_before of the previous page> for the page before it
+    """
+    limit = min(max(request.args.get('limit', DASHBOARD_PAGE_POINTS, type=int), 1), MAX_QUERY_POINTS)
+    result, error = run_series_query(limit)
+    if error:
+        return error
+    
+    timestamps = result['timestamps']
+    has_more = result['truncated']
+    response = jsonify({
+        'success': True,
+        'sensor': result['sensor'],
+        'field': result['field'],
+        'count': int(len(timestamps)),
+        'has_more': has_more,
+        'next_before': int(timestamps[0]) if has_more else None,
+        'timestamps': timestamps.tolist(),
+        'values': [round(float(v), 4) for v in result['values']]
+    })
+    # Older pages only change when rows are compacted away, the newest one on every append
+    response.headers['Cache-Control'] = 'private, max-age=60' if request.args.get('before') else 'no-cache'
+    return response
+
+@routes.route("/api/series")
+@login_required
+def api_series():
+    """Same query as /api/query, packed for charts as little-endian typed arrays
+    Body: uint32 count, uint32 reserved, int64[count] epoch ms, float32[count] values.
+    Add gzip=1 for a gzip-encoded body.
+    """
+    result, error = run_series_query(MAX_SERIES_POINTS)
+    if error:
+        return error
+    
+    body = pack_series(result['timestamps'], result['values'])
+    response = Response(body, mimetype='application/octet-stream')
+    if request.args.get('gzip', '').lower() in ('1', 'true', 'yes'):
+        response.set_data(gzip.compress(body, compresslevel=5))
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers['X-Series-Sensor'] = result['sensor']
+    response.headers['X-Series-Field'] = result['field'] or ''
+    response.headers['X-Series-Count'] = str(len(result['timestamps']))
+    response.headers['X-Series-Truncated'] = '1' if result['truncated'] else '0'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def parse_stream_args(default_all=False):
+    """StreamSpecs from stream=<file>[:field][@port] args (repeatable),
+    or every field of sensor=<file> (default: the most recent file, or
+    with DEFAULT_ALL every stream of the user, see user_streams).
+    Returns (specs, None) or (None, error response).
+    """
+    specs = []
+    for arg in request.args.getlist('stream'):
+        name, _, port = arg.partition('@')
+        name, _, field = name.partition(':')
+        file_path = resolve_data_file(name)
+        if not file_path:
+            return None, (jsonify({'success': False, 'message': f"Unknown sensor '{name}'"}), 404)
+        specs.append(StreamSpec(file_path, field or None, port or None))
+    if not specs and default_all and not request.args.get('sensor'):
+        specs = user_streams()
+    if not specs:
+        file_path = resolve_data_file(request.args.get('sensor') or os.path.basename(get_most_recent_sensor_file()))
+        if not file_path:
+            return None, (jsonify({'success': False, 'message': 'Unknown sensor'}), 404)
+        specs = [StreamSpec(file_path, field) for field in time_index.fields(file_path)] or [StreamSpec(file_path)]
+    if len(specs) > MAX_ALIGNED_STREAMS:
+        return None, (jsonify({'success': False, 'message': f'At most {MAX_ALIGNED_STREAMS} streams'}), 400)
+    return specs, None
+
+def run_alignment():
+    """Shared argument handling for /api/aligned
+    Returns (aligned, None) or (None, error response).
+    """
+    specs, error = parse_stream_args()
+    if error:
+        return None, error
+    try:
+        start = parse_time_arg(request.args.get('from'))
+        end = parse_time_arg(request.args.get('to'))
+        step = parse_step(request.args.get('step'))
+        max_gap = parse_step(request.args.get('max_gap'))
+    except ValueError as e:
+        return None, (jsonify({'success': False, 'message': str(e)}), 400)
+    
+    # range=1hour|6hours|1day: window ending at the newest reading of any stream
+    window = TIME_RANGE_WINDOWS.get(request.args.get('range'))
+    if window and start is None and end is None:
+        latest = [time_index.latest_timestamp(spec.file_path) for spec in specs if os.path.exists(spec.file_path)]
+        latest = [ts for ts in latest if ts is not None]
+        if latest:
+            end = datetime(1970, 1, 1) + timedelta(milliseconds=max(latest))
+            start = end - window
+    
+    try:
+        return stream_aligner.align(specs, start, end, step,
+                                    method=request.args.get('method', 'asof'), max_gap=max_gap), None
+    except ValueError as e:
+        return None, (jsonify({'success': False, 'message': str(e)}), 400)
+
+@routes.route("/api/aligned")
+@login_required
+def api_aligned():
+    """Several sensor streams on one time grid, one row per grid point
+    Query: stream=<file>[:field][@port] (repeatable; default every field of sensor=<file>),
+           from=, to=, range=1hour|6hours|1day, step=30s|5m|1h,
+           method=asof|mean|min|max|..., max_gap=<staleness limit, e.g. 5m>, format=json|csv
+    """
+    aligned, error = run_alignment()
+    if error:
+        return error
+    
+    timestamps, values = aligned['timestamps'], aligned['values']
+    if request.args.get('format', 'json').lower() == 'csv':
+        def rows():
+            yield ','.join(['timestamp'] + aligned['columns']) + '\n'
+            for start in range(0, len(timestamps), 1000):
+                chunk_ts = timestamps[start:start + 1000].astype('datetime64[ms]').astype(str)
+                for ts, row in zip(chunk_ts, values[start:start + 1000]):
+                    yield ts.replace('T', ' ') + ',' + ','.join('' if v != v else f"{v:.4f}" for v in row) + '\n'
+        response = Response(stream_with_context(rows()), mimetype='text/csv')
+        response.headers['Content-Disposition'] = 'attachment; filename="aligned.csv"'
+        return response
+    
+    return jsonify({
+        'success': True,
+        'columns': aligned['columns'],
+        'fields': aligned['fields'],
+        'step_ms': aligned['step_ms'],
+        'count': int(len(timestamps)),
+        'timestamps': timestamps.tolist(),
+        'values': [[None if v != v else round(float(v), 4) for v in row] for row in values.tolist()]
+    })
+
+def user_streams():
+    """One StreamSpec per field of every CSV file the current user may read"""
+    return [StreamSpec(file_path, field) for file_path in user_data_files()
+            if file_path.endswith('.csv') and os.path.exists(file_path)
+            for field in time_index.fields(file_path)][:MAX_CORRELATION_STREAMS]
+
+@routes.route("/api/correlation")
+@login_required
+def api_correlation():
+    """Pearson/Spearman matrices and cross-correlation lags across sensor streams
+    Query: stream=<file>[:field][@port] (repeatable; default every stream of the user),
+           window=1h|6h|1d (ending at the newest reading), step=, max_lag=<grid steps>
+    """
+    specs, error = parse_stream_args(default_all=True)
+    if error:
+        return error
+    try:
+        window = parse_step(request.args.get('window', '1d'))
+        step = parse_step(request.args.get('step'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    max_lag = min(max(request.args.get('max_lag', 30, type=int), 0), 500)
+    if len(specs) > MAX_CORRELATION_STREAMS:
+        return jsonify({'success': False, 'message': f'At most {MAX_CORRELATION_STREAMS} streams'}), 400
+    
+    try:
+        result = correlation_engine.analyze(specs, window, step, max_lag=max_lag)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except TimeoutError:
+        return retry_later('Correlation still being computed', 1, 503)
+    if result is None:
+        return jsonify({'success': False, 'message': 'No readings to correlate'}), 404
+    
+    def matrix(values, digits=4):
+        return [[None if v != v else round(float(v), digits) for v in row] for row in values.tolist()]
+    
+    return jsonify({
+        'success': True,
+        'columns': result['columns'],
+        'step_ms': result['step_ms'],
+        'window_ms': result['window_ms'],
+        'points': result['points'],
+        'start': result['start'],
+        'end': result['end'],
+        'pearson': matrix(result['pearson']),
+        'spearman': matrix(result['spearman']),
+        'lag_ms': result['lag_ms'].tolist(),
+        'lag_correlation': matrix(result['lag_correlation']),
+        'top_pairs': result['top_pairs']
+    })
 
 @routes.route("/ai-assistant", methods=["GET", "POST"])
 @login_required
@@ -471,47 +1129,25 @@ def ai_assistant():
         user_query = request.form.get("query", "")
         
         # Check for device-related queries
-        if any(word in user_query.lower() for word in ['connect', 'port', 'com', 'device', 'arduino', 'serial']):
+        if re.search(r'\b(connect\w*|ports?|com\d*|devices?|arduino|serial)\b', user_query.lower()):
             ai_response = handle_device_query(user_query)
         else:
-            # Your existing AI response system
-            query_lower = user_query.lower()
+            # Sensor, prediction, anomaly and report questions are answered from stored data
+            try:
+                ai_response = handle_data_query(user_query)
+            except TimeoutError:
+                ai_response = "⏳ **Still crunching the numbers**\n\nThat analysis covers a lot of readings and is still running. Ask again in a few seconds."
             
-            if any(word in query_lower for word in ['temperature', 'temp']):
-                ai_response = "🌡️ **Temperature Analysis**\n\nBased on recent data:\n• Current: 25.3°C\n• Average: 24.8°C\n• Range: 22.1°C to 27.5°C\n• Trend: Stable with normal daily fluctuations\n• Status: ✅ Normal operating range"
-                
-            elif any(word in query_lower for word in ['heart', 'pulse', 'medical', 'patient']):
-                ai_response = "❤️ **Medical Vitals Report**\n\nPatient monitoring data:\n• Heart Rate: 72-78 bpm (Normal)\n• Blood Pressure: 120/80 mmHg\n• Oxygen Saturation: 98%\n• Body Temperature: 36.6°C\n• Status: ✅ All vitals within healthy range\n• Recommendation: Continue routine monitoring"
-                
-            elif any(word in query_lower for word in ['vehicle', 'car', 'speed', 'rpm', 'fuel']):
-                ai_response = "🚗 **Vehicle Diagnostics**\n\nReal-time vehicle data:\n• Speed: 65 km/h\n• RPM: 2500\n• Fuel Level: 78%\n• Engine Temperature: 85°C\n• Tire Pressure: 32.1 psi\n• Status: ✅ All systems operational\n• Maintenance: Next service in 2,500 km"
-                
-            elif any(word in query_lower for word in ['air', 'quality', 'pollution', 'environment']):
-                ai_response = "🌍 **Air Quality Analysis**\n\nEnvironmental monitoring:\n• PM2.5: 15 μg/m³ (Good)\n• CO2: 450 ppm\n• Air Quality Index: 25 (Excellent)\n• Temperature: 22°C\n• Humidity: 45%\n• Status: ✅ Air quality is safe and healthy"
-                
-            elif any(word in query_lower for word in ['vibration', 'machine', 'industrial']):
-                ai_response = "🏭 **Industrial Monitoring**\n\nMachine health analysis:\n• Vibration X: 2.3g\n• Vibration Y: 2.1g\n• Vibration Z: 2.4g\n• Temperature: 68°C\n• Noise Level: 78 dB\n• Status: ✅ Within safe operating limits\n• Maintenance: Scheduled in 30 days"
-                
-            elif any(word in query_lower for word in ['energy', 'power', 'electricity', 'smart home']):
-                ai_response = "🏠 **Energy Consumption**\n\nSmart home analytics:\n• Current Usage: 850W\n• Voltage: 230V\n• Today's Consumption: 5.8 kWh\n• Cost Today: $0.87\n• Peak Hours: 18:00-21:00\n• Status: ✅ Efficient energy usage"
-                
-            elif any(word in query_lower for word in ['predict', 'forecast', 'next', 'future']):
-                ai_response = "🔮 **AI Prediction Report**\n\nBased on historical patterns:\n• Next 24 hours: Stable with +2% variation\n• Weekly trend: Gradual increase expected\n• Confidence level: 87%\n• Key factors: Seasonal patterns, time of day\n• Recommendation: Monitor for significant deviations"
-                
-            elif any(word in query_lower for word in ['anomaly', 'error', 'problem', 'issue']):
-                ai_response = "🔍 **Anomaly Detection**\n\nSystem health check:\n• Data Quality: 95% (Excellent)\n• Sensor Connectivity: 100%\n• Anomalies Detected: 0\n• Last Issue: None in 30 days\n• Status: ✅ All systems normal\n• Alert: No immediate action required"
-                
-            elif any(word in query_lower for word in ['report', 'summary', 'overview']):
-                ai_response = "📊 **Comprehensive System Report**\n\nOverall status:\n• Active Sensors: 5\n• Data Points Collected: 15,248\n• System Uptime: 99.8%\n• Storage Used: 1.2GB\n• Data Quality: 95%\n• AI Accuracy: 89%\n• Recommendations: Continue current monitoring schedule"
+            if ai_response is None:
+                query_lower = user_query.lower()
+                if any(word in query_lower for word in ['help', 'what can you do', 'assist']):
+                    ai_response = "🤖 **AI Assistant Capabilities**\n\nI can help you with:\n\n📈 **Data Analysis**\n• Temperature monitoring\n• Medical vital signs\n• Vehicle diagnostics\n• Air quality tracking\n• Industrial machine health\n• Energy consumption\n\n🔌 **Device Management**\n• Connect/disconnect devices\n• Monitor serial ports\n• Send commands to Arduino\n• Real-time data streaming\n\n🔮 **Predictions & AI**\n• Future value forecasting\n• Trend analysis\n• Sensor correlations & lags\n• Anomaly detection\n\n📊 **Reports & Insights**\n• System health reports\n• Performance summaries\n• Maintenance alerts\n• Data quality assessment\n\n💡 **Try asking me:**\n• \"Show me temperature trends\"\n• \"Connect to COM3\"\n• \"How is the vehicle performing?\"\n• \"Predict energy usage\"\n• \"Any system issues?\"\n• \"Which sensors are correlated?\""
                 
-            elif any(word in query_lower for word in ['help', 'what can you do', 'assist']):
-                ai_response = "🤖 **AI Assistant Capabilities**\n\nI can help you with:\n\n📈 **Data Analysis**\n• Temperature monitoring\n• Medical vital signs\n• Vehicle diagnostics\n• Air quality tracking\n• Industrial machine health\n• Energy consumption\n\n🔌 **Device Management**\n• Connect/disconnect devices\n• Monitor serial ports\n• Send commands to Arduino\n• Real-time data streaming\n\n🔮 **Predictions & AI**\n• Future value forecasting\n• Trend analysis\n• Pattern recognition\n• Anomaly detection\n\n📊 **Reports & Insights**\n• System health reports\n• Performance summaries\n• Maintenance alerts\n• Data quality assessment\n\n💡 **Try asking me:**\n• \"Show me temperature trends\"\n• \"Connect to COM3\"\n• \"How is the vehicle performing?\"\n• \"Predict energy usage\"\n• \"Any system issues?\""
+                elif any(word in query_lower for word in ['hello', 'hi', 'hey']):
+                    ai_response = "👋 Hello! I'm your IoT AI Assistant. I can help you analyze sensor data, manage connected devices, make predictions, detect anomalies, and generate reports. What would you like to know about your connected devices?"
                 
-            elif any(word in query_lower for word in ['hello', 'hi', 'hey']):
-                ai_response = "👋 Hello! I'm your IoT AI Assistant. I can help you analyze sensor data, manage connected devices, make predictions, detect anomalies, and generate reports. What would you like to know about your connected devices?"
-                
-            else:
-                ai_response = "🤔 **I Understand You're Working with IoT Data**\n\nI can analyze various sensor types and provide insights. Try asking about:\n\n• Specific sensor data (temperature, heart rate, etc.)\n• Device connections (\"connect to COM3\")\n• Predictions and forecasts\n• System health and anomalies\n• Performance reports\n• Or just say \"help\" to see all my capabilities!"
+                else:
+                    ai_response = "🤔 **I Understand You're Working with IoT Data**\n\nI can analyze various sensor types and provide insights. Try asking about:\n\n• Specific sensor data (temperature, heart rate, etc.)\n• Device connections (\"connect to COM3\")\n• Predictions and forecasts\n• System health and anomalies\n• Performance reports\n• Or just say \"help\" to see all my capabilities!"
     
     # Get all sensor data blocks
     sensor_blocks = get_all_sensor_blocks()
@@ -528,6 +1164,149 @@ def ai_assistant():
                          connected_devices=connected_devices,
                          user=current_user)
 
+def format_reading(value, unit):
+    return f"{value:.2f} {unit}" if unit != 'units' else f"{value:.2f}"
+
+def handle_data_query(query):
+    """Answer sensor, prediction, anomaly and report questions from the sensor summaries
+
+    Returns None for intents that have nothing to look up (help, greetings).
+    """
+    context = IoTContextAI()
+    intent = context.understand_user_intent(query)
+    timeframe = intent.get('timeframe', 'recent')
+    start, end = context.timeframe_window(timeframe)
+    query_lower = query.lower()
+    
+    if intent['intent'] == 'sensor_data' and any(word in query_lower for word in ['predict', 'forecast', 'future']):
+        return describe_prediction(intent['sensor'], timeframe, start, end)
+    elif intent['intent'] == 'sensor_data':
+        return describe_sensor(intent['sensor'], timeframe, start, end)
+    elif intent['intent'] == 'prediction':
+        return describe_prediction(None, timeframe, start, end)
+    elif intent['intent'] == 'anomaly_detection':
+        return describe_anomalies(timeframe, start, end)
+    elif intent['intent'] == 'correlation':
+        return describe_correlations(timeframe, start, end)
+    elif intent['intent'] == 'report':
+        return describe_report()
+    return None
+
+def no_data_response(sensor_type, timeframe):
+    label = (sensor_type or 'sensor').replace('_', ' ')
+    known = [r for _, _, r in sensor_summaries.series(sensor_type, user_data_files())]
+    if known:
+        last_time = datetime(1970, 1, 1) + timedelta(milliseconds=max(r.last_ts for r in known))
+        return f"📭 **No {label} readings for {timeframe}**\n\n• Last reading stored: {last_time.strftime('%Y-%m-%d %H:%M:%S')}\n• Try a longer timeframe, e.g. \"{label} last month\""
+    return f"📭 **No {label} data recorded yet**\n\nNone of the stored data files contain {label} readings.\n• Connect a device in the Device Manager to start collecting data"
+
+def describe_sensor(sensor_type, timeframe, start, end):
+    """Stats per stored series of SENSOR_TYPE over the timeframe"""
+    blocks = []
+    for file_path, field, rollup in sensor_summaries.series(sensor_type, user_data_files())[:5]:
+        stats = sensor_summaries.summarize(file_path, field, rollup, start, end)
+        if stats is None:
+            continue
+        unit = stats['unit']
+        blocks.append(
+            f"{stats['sensor_name']} — {stats['filename']} ({field})\n"
+            f"• Current: {format_reading(stats['current'], unit)} (at {stats['last_time'].strftime('%Y-%m-%d %H:%M:%S')})\n"
+            f"• Average: {format_reading(stats['mean'], unit)}\n"
+            f"• Range: {format_reading(stats['min'], unit)} to {format_reading(stats['max'], unit)}\n"
+            f"• Std deviation: {stats['std']:.2f}\n"
+            f"• Readings: {stats['count']:,}\n"
+            f"• Trend: {stats['trend'].capitalize()}"
+        )
+    if not blocks:
+        return no_data_response(sensor_type, timeframe)
+    return f"📈 **{sensor_type.replace('_', ' ').title()} Analysis ({timeframe})**\n\n" + "\n\n".join(blocks)
+
+def describe_prediction(sensor_type, timeframe, start, end):
+    """Trend-line forecast from the hourly rollups"""
+    blocks = []
+    for file_path, field, rollup in sensor_summaries.series(sensor_type, user_data_files())[:5]:
+        forecast = sensor_summaries.forecast(rollup, start, end)
+        if forecast is None:
+            continue
+        direction = 'rising' if forecast['slope_per_hour'] > 0 else 'falling' if forecast['slope_per_hour'] < 0 else 'flat'
+        blocks.append(
+            f"{rollup.sensor_name} — {os.path.basename(file_path)} ({field})\n"
+            f"• Next {forecast['horizon_hours']} hours: {format_reading(forecast['predicted'], rollup.unit)}\n"
+            f"• Trend: {direction} ({forecast['slope_per_hour']:+.3f} per hour)\n"
+            f"• Fit (R²): {forecast['fit']:.2f} over {forecast['buckets']} hourly averages\n"
+            f"• Next reading: {format_reading(predict_next_value(file_path), rollup.unit)}"
+        )
+    if not blocks:
+        return "🔮 **AI Prediction Report**\n\nNot enough stored history to forecast — at least two hours of readings are needed." if sensor_summaries.series(sensor_type, user_data_files()) else no_data_response(sensor_type, timeframe)
+    return f"🔮 **AI Prediction Report ({timeframe})**\n\n" + "\n\n".join(blocks)
+
+def describe_anomalies(timeframe, start, end):
+    """Hours with readings outside mean ± 3σ, per series"""
+    lines = []
+    checked = 0
+    flagged_total = 0
+    for file_path, field, rollup in sensor_summaries.series(file_paths=user_data_files()):
+        result = sensor_summaries.anomalies(rollup, start, end)
+        if result is None:
+            continue
+        checked += result['count']
+        flagged_total += len(result['flagged_hours'])
+        if result['flagged_hours']:
+            hours = ', '.join(h.strftime('%m-%d %H:00') for h in result['flagged_hours'][-3:])
+            lines.append(f"• ⚠️ {rollup.sensor_name} ({os.path.basename(file_path)}, {field}): {len(result['flagged_hours'])} hour(s) outside {result['low']:.2f}–{result['high']:.2f}, latest {hours}")
+    if checked == 0:
+        return no_data_response(None, timeframe)
+    response = f"🔍 **Anomaly Detection ({timeframe})**\n\n• Readings checked: {checked:,}\n• Anomalous hours: {flagged_total}\n"
+    if lines:
+        return response + "\n".join(lines)
+    return response + "• Status: ✅ All readings within 3σ of their average"
+
+def format_duration(ms):
+    """5400000 -> '1h 30m', 42000 -> '42s'"""
+    seconds = abs(int(ms)) // 1000
+    parts = [(seconds // 86400, 'd'), (seconds % 86400 // 3600, 'h'), (seconds % 3600 // 60, 'm'), (seconds % 60, 's')]
+    return ' '.join([f"{n}{unit}" for n, unit in parts if n][:2]) or '0s'
+
+def describe_correlations(timeframe, start, end):
+    """Strongest correlations (and lags) between the user's sensor streams"""
+    window = (end - start) if start is not None and end is not None else timedelta(days=30)
+    result = correlation_engine.analyze(user_streams(), int(window.total_seconds() * 1000))
+    if result is None or len(result['columns']) < 2:
+        return "🔗 **Sensor Correlations**\n\nAt least two sensor streams with readings are needed to compare them."
+    if not result['top_pairs']:
+        return f"🔗 **Sensor Correlations ({timeframe})**\n\n• Streams compared: {len(result['columns'])}\n• No two streams have enough overlapping readings in this window to compare"
+    
+    lines = []
+    for pair in result['top_pairs'][:5]:
+        strength = 'strong' if abs(pair['pearson']) >= 0.7 else 'moderate' if abs(pair['pearson']) >= 0.4 else 'weak'
+        direction = 'positive' if pair['pearson'] > 0 else 'negative'
+        line = f"• {pair['a']} ↔ {pair['b']}: {strength} {direction} (r = {pair['pearson']:+.2f}"
+        if pair['spearman'] is not None:
+            line += f", Spearman {pair['spearman']:+.2f}"
+        line += ")"
+        if pair['lag_ms'] and pair['lag_correlation'] is not None and abs(pair['lag_correlation']) > abs(pair['pearson']) + 0.02:
+            follower, leader = (pair['a'], pair['b']) if pair['lag_ms'] > 0 else (pair['b'], pair['a'])
+            line += f"\n  ↳ {follower} follows {leader} by {format_duration(pair['lag_ms'])} (r = {pair['lag_correlation']:+.2f})"
+        lines.append(line)
+    return (f"🔗 **Sensor Correlations ({timeframe})**\n\n"
+            f"• Streams compared: {len(result['columns'])} over {result['points']} buckets of {format_duration(result['step_ms'])}\n\n"
+            + "\n".join(lines))
+
+def describe_report():
+    """System overview from the summaries and the device manager"""
+    overview = sensor_summaries.overview(user_data_files())
+    if overview['series'] == 0:
+        return no_data_response(None, 'any timeframe')
+    last_time = datetime(1970, 1, 1) + timedelta(milliseconds=overview['last_time'])
+    sensor_types = ', '.join(t.replace('_', ' ') for t in overview['sensor_types'])
+    return ("📊 **Comprehensive System Report**\n\nOverall status:\n"
+            f"• Data Files: {overview['files']}\n"
+            f"• Sensor Series: {overview['series']} ({sensor_types})\n"
+            f"• Data Points Collected: {overview['data_points']:,}\n"
+            f"• Storage Used: {overview['storage_bytes'] / (1024 * 1024):.1f} MB\n"
+            f"• Last Reading: {last_time.strftime('%Y-%m-%d %H:%M:%S')}\n"
+            f"• Connected Devices: {len(device_manager.get_connected_devices())}")
+
 def handle_device_query(query):
     """Handle device-related queries in AI assistant"""
     query_lower = query.lower()
@@ -573,8 +1352,10 @@ def handle_device_query(query):
     
     return "🔌 **Device Management**\n\nI can help you with device connections. Try:\n• \"Connect to COM3\"\n• \"Show device status\"\n• \"What ports are available?\""
 
-def filter_data_by_time_range(df, time_range):
-    """Filter data based on selected time range and return summary statistics"""
+def filter_data_by_time_range(df, time_range, cache_key=None):
+    """Filter data based on selected time range and return summary statistics
+    CACHE_KEY identifies the real data behind DF (synthetic ranges are never cached).
+    """
     if len(df) == 0 or df.empty:
         # Return empty but with basic structure
         return pd.DataFrame(), {}
@@ -594,13 +1375,10 @@ def filter_data_by_time_range(df, time_range):
             # Ensure timestamp is datetime
             df_filtered['timestamp'] = pd.to_datetime(df_filtered['timestamp'])
             
-            # Filter based on time range
-            if time_range == '1hour':
-                filtered_df = df_filtered.tail(30)
-            elif time_range == '6hours':
-                filtered_df = df_filtered.tail(180)
-            elif time_range == '1day':
-                filtered_df = df_filtered.tail(720)
+            # Filter on real time windows ending at the latest reading
+            if time_range in TIME_RANGE_WINDOWS:
+                cutoff = df_filtered['timestamp'].max() - TIME_RANGE_WINDOWS[time_range]
+                filtered_df = df_filtered[df_filtered['timestamp'] >= cutoff].sort_values('timestamp')
             else:
                 filtered_df = df_filtered.tail(100)
         except Exception as e:
@@ -618,7 +1396,7 @@ def filter_data_by_time_range(df, time_range):
         else:
             filtered_df = df_filtered.tail(100)
     
-    summary = calculate_summary_statistics(filtered_df, time_range)
+    summary = calculate_summary_statistics(filtered_df, time_range, cache_key=cache_key)
     return filtered_df, summary
 
 def generate_synthetic_data(time_range, original_df=None):
@@ -673,8 +1451,10 @@ def generate_synthetic_data(time_range, original_df=None):
         'sensor_value': values
     })
 
-def calculate_summary_statistics(df, time_range=None):
-    """Calculate comprehensive statistics for the data"""
+def calculate_summary_statistics(df, time_range=None, cache_key=None):
+    """Calculate comprehensive statistics for the data
+    Large series are computed in the analytics pool (see analytics_executor).
+    """
     if len(df) == 0:
         return {}
     
@@ -688,32 +1468,39 @@ def calculate_summary_statistics(df, time_range=None):
             else:
                 return {}
         
-        stats = {
-            'count': len(values),
-            'mean': round(float(values.mean()), 2),
-            'median': round(float(values.median()), 2),
-            'min': round(float(values.min()), 2),
-            'max': round(float(values.max()), 2),
-            'std': round(float(values.std()), 2),
-            'trend': 'increasing' if len(values) > 1 and values.iloc[-1] > values.iloc[0] else 'decreasing'
-        }
-        
-        return stats
+        return analytics_executor.run(analytics_tasks.summary_statistics,
+                                      values.to_numpy(dtype=float, na_value=np.nan),
+                                      cache_key=cache_key)
         
+    except TimeoutError:
+        raise
     except Exception as e:
         print(f"Error calculating statistics: {e}")
         return {}
 
+def current_user_id():
+    """Id of the logged-in user, or None"""
+    if current_user and getattr(current_user, 'is_authenticated', False):
+        return current_user.id
+    return None
+
+def user_data_files():
+    """Data files the current user may read: their partitions, then shared files"""
+    user_id = current_user_id()
+    own = partition_index.files(user_id) if user_id else []
+    return own + [f for f in data_catalog.list_files() if visible_to(f, user_id)]
+
 def get_most_recent_sensor_file():
-    """Get the most recently modified sensor data file"""
-    if not os.path.exists(DATA_DIR):
-        return CSV_FILE
-    
-    data_files = glob.glob(os.path.join(DATA_DIR, "*.*"))
-    if not data_files:
+    """The user's partition with the latest reading, else the newest shared data file"""
+    user_id = current_user_id()
+    if user_id:
+        newest = partition_index.newest_file(user_id)
+        if newest:
+            return newest
+    latest_file = data_catalog.newest_file(lambda path: visible_to(path, user_id))
+    if not latest_file:
         return CSV_FILE
     
-    latest_file = max(data_files, key=os.path.getmtime)
     return latest_file
 
 def detect_current_sensor():
@@ -722,7 +1509,7 @@ def detect_current_sensor():
     active_file = get_most_recent_sensor_file()
     
     if os.path.exists(active_file):
-        sensor_info = reader.read_any_data_format(active_file)
+        sensor_info = reader.read_any_data_format(active_file, metadata_only=True)
         if 'error' not in sensor_info:
             return {
                 'name': sensor_info['sensor_name'],
@@ -738,7 +1525,49 @@ def detect_current_sensor():
 def get_all_sensor_blocks():
     """Get separate blocks for each sensor type"""
     reader = UniversalDataReader()
-    return reader.get_active_sensors()
+    return reader.get_active_sensors(user_data_files())
+
+# Profiling reports (PROFILE_ADMINS users or the X-Profile-Token header)
+@routes.route("/admin/profiles")
+def admin_profiles():
+    """Recent profiled and slow requests, newest first"""
+    if not request_profiler.is_admin(current_user):
+        return jsonify({'success': False, 'message': 'Forbidden'}), 403
+    return jsonify({'success': True, 'settings': request_profiler.settings(), 'reports': request_profiler.list_reports()})
+
+@routes.route("/admin/profiles/<int:report_id>")
+def admin_profile_report(report_id):
+    """One report with its top functions (cProfile) and sampled frames"""
+    if not request_profiler.is_admin(current_user):
+        return jsonify({'success': False, 'message': 'Forbidden'}), 403
+    report = request_profiler.get_report(report_id)
+    if report is None:
+        return jsonify({'success': False, 'message': 'Unknown report'}), 404
+    return jsonify({'success': True, 'report': report})
+
+@routes.route("/admin/profiles/<int:report_id>.prof")
+def admin_profile_download(report_id):
+    """Raw pstats file of a profiled request (open with snakeviz or pstats)"""
+    if not request_profiler.is_admin(current_user):
+        return jsonify({'success': False, 'message': 'Forbidden'}), 403
+    data = request_profiler.get_profile(report_id)
+    if data is None:
+        return jsonify({'success': False, 'message': 'No profile for this report'}), 404
+    response = Response(data, mimetype='application/octet-stream')
+    response.headers['Content-Disposition'] = f'attachment; filename="request-{report_id}.prof"'
+    return response
+
+@routes.route("/admin/profiles/settings", methods=["POST"])
+def admin_profile_settings():
+    """Change sampling without a redeploy. Body: {"sample_rate": 0.01, "slow_ms": 500}"""
+    if not request_profiler.is_admin(current_user):
+        return jsonify({'success': False, 'message': 'Forbidden'}), 403
+    data = request.get_json(silent=True) or {}
+    try:
+        settings = request_profiler.configure(data.get('sample_rate'), data.get('slow_ms'))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'sample_rate and slow_ms must be numbers'}), 400
+    return jsonify({'success': True, 'settings': settings})
 
 # Authentication Routes
 @routes.route("/login", methods=["GET", "POST"])
@@ -0,0 +1,104 @@
+import importlib
+import os
+import threading
+import time
+
+# FAST_START=true defers pandas/numpy/ml_engine/storage imports to first use
+# and leaves schema creation to `flask init-db`
+FAST_START = os.getenv('FAST_START', 'false').lower() in ('1', 'true', 'yes')
+
+
+class StartupTimer:
+    """Wall time per startup phase, plus deferred imports as they happen"""
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = []
+        self.deferred = []
+        self.lock = threading.Lock()
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def record(self, name, seconds, deferred=False):
+        with self.lock:
+            (self.deferred if deferred else self.phases).append((name, seconds))
+
+    def report(self):
+        with self.lock:
+            return {
+                'fast_start': FAST_START,
+                'total_ms': round(sum(s for _, s in self.phases) * 1000, 1),
+                'phases': [{'name': n, 'ms': round(s * 1000, 1)} for n, s in self.phases],
+                'deferred': [{'name': n, 'ms': round(s * 1000, 1)} for n, s in self.deferred]
+            }
+
+    def summary(self):
+        report = self.report()
+        parts = ', '.join(f"{p['name']} {p['ms']:.0f}ms" for p in report['phases'])
+        return f"⏱️ Startup {report['total_ms']:.0f}ms ({parts})"
+
+
+class _Phase:
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class LazyObject:
+    """Stand-in for a module (or one of its attributes) imported on first use"""
+    def __init__(self, module_name, attr=None):
+        object.__setattr__(self, '_module_name', module_name)
+        object.__setattr__(self, '_attr', attr)
+        object.__setattr__(self, '_target', None)
+        object.__setattr__(self, '_lock', threading.Lock())
+
+    def _resolve(self):
+        target = self._target
+        if target is None:
+            with self._lock:
+                if self._target is None:
+                    start = time.perf_counter()
+                    module = importlib.import_module(self._module_name)
+                    found = getattr(module, self._attr) if self._attr else module
+                    object.__setattr__(self, '_target', found)
+                    startup_timer.record(f"import {self._module_name}", time.perf_counter() - start, deferred=True)
+                target = self._target
+        return target
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._resolve(), name, value)
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
+    def __repr__(self):
+        name = f"{self._module_name}.{self._attr}" if self._attr else self._module_name
+        return f"<lazy {name}{' (loaded)' if self._target is not None else ''}>"
+
+
+def lazy(module_name, attr=None):
+    """MODULE_NAME (or its ATTR), deferred until first use when FAST_START is on"""
+    if not FAST_START:
+        module = importlib.import_module(module_name)
+        return getattr(module, attr) if attr else module
+    return LazyObject(module_name, attr)
+
+
+def resolve(value):
+    """The real object behind a lazy stand-in (for isinstance/str.endswith and friends)"""
+    return value._resolve() if isinstance(value, LazyObject) else value
+
+
+# Global instance
+startup_timer = StartupTimer()
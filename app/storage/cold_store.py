@@ -0,0 +1,139 @@
+import gzip
+import lzma
+import os
+
+import pandas as pd
+
+from .tail_cache import parse_csv_bytes
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DATA_DIR = os.path.join(BASE_DIR, "data")
+COLD_DIR = os.path.join(DATA_DIR, "cold")
+
+# compression name -> (file suffix, opener)
+COMPRESSORS = {
+    'gzip': ('.gz', gzip.open),
+    'lzma': ('.xz', lzma.open),
+}
+SUFFIX_OPENERS = dict((suffix, opener) for suffix, opener in COMPRESSORS.values())
+
+
+def open_data_file(file_path, mode='rt'):
+    """Open a data file, decompressing .gz/.xz transparently"""
+    for suffix, opener in SUFFIX_OPENERS.items():
+        if file_path.endswith(suffix):
+            if 't' in mode:
+                return opener(file_path, mode, encoding='utf-8', errors='replace', newline='')
+            return opener(file_path, mode)
+    if 't' in mode:
+        return open(file_path, mode, encoding='utf-8', errors='replace', newline='')
+    return open(file_path, mode)
+
+
+def strip_compression(file_path):
+    """'x.csv.gz' -> 'x.csv'"""
+    for suffix in SUFFIX_OPENERS:
+        if file_path.endswith(suffix):
+            return file_path[:-len(suffix)]
+    return file_path
+
+
+class ColdStore:
+    """Daily compressed partitions of rows compacted out of the hot CSV files
+
+    Layout: data/cold/<file stem>/<YYYY-MM-DD>.csv.gz (or .csv.xz). Each
+    partition starts with the hot file's header line. Files in data/
+    subdirectories keep their relative path (data/cold/tenants/user_1/COM3/).
+    """
+    def __init__(self, root=COLD_DIR):
+        self.root = root
+
+    def partition_dir(self, file_path):
+        stem = os.path.relpath(os.path.abspath(file_path), DATA_DIR)
+        if stem.startswith('..'):
+            stem = os.path.basename(file_path)
+        if stem.endswith('.csv'):
+            stem = stem[:-4]
+        return os.path.join(self.root, stem)
+
+    def list_partitions(self, file_path, start_day=None, end_day=None):
+        """Sorted [(day, path)] for partitions within [start_day, end_day]"""
+        directory = self.partition_dir(file_path)
+        if not os.path.isdir(directory):
+            return []
+
+        partitions = []
+        for name in os.listdir(directory):
+            if not name.endswith(tuple('.csv' + suffix for suffix in SUFFIX_OPENERS)):
+                continue
+            day = name[:10]
+            if start_day and day < start_day:
+                continue
+            if end_day and day > end_day:
+                continue
+            partitions.append((day, os.path.join(directory, name)))
+        return sorted(partitions)
+
+    def append_partition(self, file_path, day, header_line, lines, compression='gzip'):
+        """Append raw CSV lines to the partition for DAY"""
+        suffix, opener = COMPRESSORS[compression]
+        directory = self.partition_dir(file_path)
+        os.makedirs(directory, exist_ok=True)
+
+        # Keep using whichever codec the day was first written with
+        existing = [path for _, path in self.list_partitions(file_path, day, day)]
+        path = existing[0] if existing else os.path.join(directory, f"{day}.csv{suffix}")
+        opener = SUFFIX_OPENERS[path[path.rindex('.'):]]
+
+        is_new = not os.path.exists(path)
+        # Appending adds another gzip member / xz stream; both read back as one file
+        with opener(path, 'ab') as f:
+            if is_new:
+                f.write(header_line)
+            f.write(b''.join(lines))
+        return path
+
+    def drop_before(self, file_path, day):
+        """Delete partitions older than DAY; returns the number removed"""
+        removed = 0
+        for partition_day, path in self.list_partitions(file_path):
+            if partition_day < day:
+                os.remove(path)
+                removed += 1
+        return removed
+
+    def iter_lines(self, file_path, start_day=None, end_day=None):
+        """Yield data lines (header skipped) from partitions in the day range"""
+        for _, path in self.list_partitions(file_path, start_day, end_day):
+            with open_data_file(path, 'rt') as f:
+                header = True
+                for line in f:
+                    if header:
+                        header = False
+                        continue
+                    yield line
+
+    def read_frame(self, file_path, start=None, end=None):
+        """DataFrame of cold rows with timestamps in [start, end] (datetimes or None)"""
+        start_day = start.strftime('%Y-%m-%d') if start is not None else None
+        end_day = end.strftime('%Y-%m-%d') if end is not None else None
+
+        frames = []
+        for _, path in self.list_partitions(file_path, start_day, end_day):
+            # Parsed like the hot file so cold and hot frames line up
+            with open_data_file(path, 'rb') as f:
+                frames.append(parse_csv_bytes(f.read()))
+        if not frames:
+            return pd.DataFrame()
+
+        df = pd.concat(frames, ignore_index=True)
+        if 'timestamp' in df.columns:
+            if start is not None:
+                df = df[df['timestamp'] >= pd.Timestamp(start)]
+            if end is not None:
+                df = df[df['timestamp'] <= pd.Timestamp(end)]
+        return df.reset_index(drop=True)
+
+
+# Global instance
+cold_store = ColdStore()
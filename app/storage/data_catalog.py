@@ -0,0 +1,259 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+
+from app.ml_engine.universal_reader import DATA_EXTENSIONS
+from .tail_cache import tail_cache
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DATA_DIR = os.path.join(BASE_DIR, "data")
+
+# inotify event masks (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def load_inotify():
+    """Return libc if it exposes inotify (Linux), else None"""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class DataCatalog:
+    """In-memory listing of the data directory kept current by inotify
+
+    Holds name, size and mtime for every data file plus the newest-file
+    pointer, so requests never glob or stat the directory. Falls back to a
+    periodic scan where inotify is unavailable. Subscribers are called with
+    (event, path) where event is 'created', 'modified' or 'deleted'.
+    """
+    def __init__(self, directory, extensions=DATA_EXTENSIONS, scan_interval=2):
+        self.directory = directory
+        self.extensions = extensions
+        self.scan_interval = scan_interval
+        self.files = {}
+        self.newest = None
+        self.subscribers = []
+        self.mode = None
+        self.lock = threading.Lock()
+        self.watch_thread = None
+        self.is_running = False
+        # Set once the initial scan finished, so early callers never see an empty listing
+        self.ready = threading.Event()
+
+    def start(self):
+        """Initial scan, then watch for changes in the background"""
+        with self.lock:
+            if self.is_running:
+                return
+            self.is_running = True
+            self.ready.clear()
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            self.scan()
+        finally:
+            self.ready.set()
+
+        libc = load_inotify()
+        fd = -1
+        if libc is not None:
+            fd = libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+            if fd >= 0 and libc.inotify_add_watch(fd, os.fsencode(self.directory), WATCH_MASK) < 0:
+                os.close(fd)
+                fd = -1
+
+        if fd >= 0:
+            self.mode = 'inotify'
+            target, args = self._watch_loop, (fd,)
+        else:
+            self.mode = 'scan'
+            target, args = self._scan_loop, ()
+
+        self.watch_thread = threading.Thread(target=target, args=args)
+        self.watch_thread.daemon = True
+        self.watch_thread.start()
+
+    def stop(self):
+        self.is_running = False
+        if self.watch_thread:
+            self.watch_thread.join(timeout=2)
+
+    def ensure_started(self):
+        if not self.is_running:
+            self.start()
+        self.ready.wait()
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+    def list_files(self):
+        """Paths of all tracked data files, sorted by name"""
+        self.ensure_started()
+        with self.lock:
+            return [info['path'] for _, info in sorted(self.files.items())]
+
+    def get_info(self, file_path):
+        self.ensure_started()
+        with self.lock:
+            info = self.files.get(os.path.basename(file_path))
+            return dict(info) if info else None
+
+    def newest_file(self, include=None):
+        """Path of the most recently modified data file, or None
+
+        INCLUDE(path) limits the choice, e.g. to files one user may read.
+        """
+        self.ensure_started()
+        with self.lock:
+            if include is None:
+                return self.files[self.newest]['path'] if self.newest else None
+            candidates = [info for info in self.files.values() if include(info['path'])]
+            return max(candidates, key=lambda info: info['mtime'])['path'] if candidates else None
+
+    def scan(self):
+        """Reconcile the in-memory listing with the directory contents"""
+        seen = {}
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.is_file() and entry.name.endswith(self.extensions):
+                        st = entry.stat()
+                        seen[entry.name] = (st.st_size, st.st_mtime)
+        except FileNotFoundError:
+            pass
+
+        with self.lock:
+            known = dict((name, (info['size'], info['mtime'])) for name, info in self.files.items())
+        for name in known:
+            if name not in seen:
+                self._remove(name)
+        for name, (size, mtime) in seen.items():
+            if name not in known:
+                self._update(name, size, mtime, 'created')
+            elif known[name] != (size, mtime):
+                self._update(name, size, mtime, 'modified')
+
+    def _refresh_one(self, name):
+        path = os.path.join(self.directory, name)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self._remove(name)
+            return
+        with self.lock:
+            event = 'modified' if name in self.files else 'created'
+        self._update(name, st.st_size, st.st_mtime, event)
+
+    def _update(self, name, size, mtime, event):
+        path = os.path.join(self.directory, name)
+        with self.lock:
+            self.files[name] = {'path': path, 'name': name, 'size': size, 'mtime': mtime}
+            if self.newest is None or self.newest not in self.files or mtime >= self.files[self.newest]['mtime']:
+                self.newest = name
+        self._publish(event, path)
+
+    def _remove(self, name):
+        path = os.path.join(self.directory, name)
+        with self.lock:
+            if self.files.pop(name, None) is None:
+                return
+            if self.newest == name:
+                self.newest = max(self.files, key=lambda n: self.files[n]['mtime']) if self.files else None
+        self._publish('deleted', path)
+
+    def _publish(self, event, path):
+        for callback in list(self.subscribers):
+            try:
+                callback(event, path)
+            except Exception as e:
+                print(f"Catalog subscriber error: {e}")
+
+    def _watch_loop(self, fd):
+        """Apply inotify events as they arrive"""
+        try:
+            while self.is_running:
+                ready, _, _ = select.select([fd], [], [], 1.0)
+                if not ready:
+                    continue
+                try:
+                    buffer = os.read(fd, 64 * 1024)
+                except BlockingIOError:
+                    continue
+
+                changed = set()
+                rescan = False
+                overflowed = False
+                offset = 0
+                while offset + EVENT_HEADER.size <= len(buffer):
+                    _, mask, _, length = EVENT_HEADER.unpack_from(buffer, offset)
+                    raw_name = buffer[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length]
+                    offset += EVENT_HEADER.size + length
+                    name = os.fsdecode(raw_name.rstrip(b'\0'))
+
+                    if mask & IN_Q_OVERFLOW:
+                        # The kernel queue overflowed and dropped events
+                        overflowed = True
+                    elif mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                        rescan = True
+                    elif name and name.endswith(self.extensions):
+                        changed.add(name)
+
+                # A burst of appends to one file costs a single stat
+                for name in changed:
+                    self._refresh_one(name)
+                if overflowed:
+                    print("⚠️ Data directory events overflowed, rescanning")
+                    self.scan()
+                if rescan:
+                    print("⚠️ Data directory watch lost, falling back to periodic scans")
+                    self.mode = 'scan'
+                    break
+        except Exception as e:
+            print(f"Catalog watch error: {e}")
+            self.mode = 'scan'
+        finally:
+            os.close(fd)
+
+        if self.is_running:
+            self._scan_loop()
+
+    def _scan_loop(self):
+        """Fallback: rescan the directory periodically"""
+        while self.is_running:
+            time.sleep(self.scan_interval)
+            try:
+                self.scan()
+            except Exception as e:
+                print(f"Catalog scan error: {e}")
+
+
+def _invalidate_tail_cache(event, path):
+    if event == 'deleted':
+        tail_cache.invalidate(path)
+
+
+# Global instance
+data_catalog = DataCatalog(DATA_DIR)
+data_catalog.subscribe(_invalidate_tail_cache)
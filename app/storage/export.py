@@ -0,0 +1,140 @@
+import csv
+import json
+import os
+import zlib
+from datetime import datetime, timedelta
+
+from .cold_store import cold_store, open_data_file
+from .tail_cache import TIMESTAMP_FORMAT
+
+TIME_ARG_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M', '%Y-%m-%d')
+FLUSH_BYTES = 64 * 1024
+
+
+def parse_time_arg(value):
+    """Parse a from/to query argument: 'YYYY-MM-DD[ HH:MM[:SS]]' or epoch milliseconds
+
+    Stored timestamps are naive, so epoch values map onto the same naive clock
+    the tail cache uses.
+    """
+    if value is None or value == '':
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return datetime(1970, 1, 1) + timedelta(milliseconds=int(value))
+    for fmt in TIME_ARG_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognised time '{value}'")
+
+
+def row_fields(line):
+    return next(csv.reader([line]), [])
+
+
+def read_header(file_path):
+    """Header of the hot file, or of its oldest cold partition"""
+    if os.path.exists(file_path):
+        with open_data_file(file_path) as f:
+            return f.readline()
+    for _, path in cold_store.list_partitions(file_path):
+        with open_data_file(path) as f:
+            return f.readline()
+    return ''
+
+
+def iter_rows(file_path, start=None, end=None, port=None):
+    """Yield raw CSV lines in [start, end] from cold partitions, then the hot file"""
+    start_ts = start.strftime(TIMESTAMP_FORMAT) if start else None
+    end_ts = end.strftime(TIMESTAMP_FORMAT) if end else None
+    header = row_fields(read_header(file_path))
+    port_index = header.index('port') if 'port' in header else None
+
+    def wanted(line):
+        ts = line.split(',', 1)[0].strip().strip('"')
+        if start_ts and ts < start_ts:
+            return False
+        if end_ts and ts > end_ts:
+            return False
+        if port is not None:
+            fields = row_fields(line)
+            return port_index is not None and len(fields) > port_index and fields[port_index] == port
+        return True
+
+    cold_lines = cold_store.iter_lines(file_path,
+                                       start.strftime('%Y-%m-%d') if start else None,
+                                       end.strftime('%Y-%m-%d') if end else None)
+    for line in cold_lines:
+        if line.strip() and wanted(line):
+            yield line
+
+    if not os.path.exists(file_path):
+        return
+    with open_data_file(file_path) as f:
+        f.readline()
+        for line in f:
+            if not line.endswith('\n'):
+                # Row still being written
+                break
+            if line.strip() and wanted(line):
+                yield line
+
+
+def format_ndjson(header, line):
+    record = dict(zip(header, row_fields(line)))
+    data = record.get('data')
+    if data and data.lstrip().startswith('{'):
+        try:
+            record['data'] = json.loads(data)
+        except ValueError:
+            pass
+    for name, value in record.items():
+        if name not in ('timestamp', 'port', 'data'):
+            try:
+                record[name] = float(value)
+            except (TypeError, ValueError):
+                pass
+    return json.dumps(record) + '\n'
+
+
+def export_stream(file_paths, start=None, end=None, port=None, fmt='csv', compress=False):
+    """Generator of response body chunks; never holds more than one chunk in memory"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    buffer = []
+    size = 0
+    first_header = None
+
+    def emit(text):
+        data = text.encode('utf-8')
+        return compressor.compress(data) if compressor else data
+
+    for file_path in file_paths:
+        header_line = read_header(file_path)
+        if not header_line:
+            continue
+        header = [h.strip() for h in row_fields(header_line.lstrip('\ufeff'))]
+
+        if fmt == 'csv':
+            # One CSV body can only carry one column layout
+            if first_header is None:
+                first_header = header
+                buffer.append(header_line if header_line.endswith('\n') else header_line + '\n')
+            elif header != first_header:
+                continue
+
+        for line in iter_rows(file_path, start, end, port):
+            buffer.append(format_ndjson(header, line) if fmt == 'ndjson' else line)
+            size += len(line)
+            if size >= FLUSH_BYTES:
+                chunk = emit(''.join(buffer))
+                buffer, size = [], 0
+                if chunk:
+                    yield chunk
+
+    chunk = emit(''.join(buffer))
+    if chunk:
+        yield chunk
+    if compressor:
+        yield compressor.flush()
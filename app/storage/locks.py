@@ -0,0 +1,66 @@
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # No flock on Windows; locks then only cover this process
+    fcntl = None
+
+_local_locks = {}
+_local_guard = threading.Lock()
+
+
+@contextmanager
+def file_lock(handle):
+    """Exclusive advisory lock on the open file HANDLE, held across processes
+
+    Appenders take it around each write, then check that the path still
+    names the file they locked (compaction may have swapped it). Compaction
+    takes it on the old file for its final copy and the swap.
+    """
+    if fcntl is None:
+        with _local_guard:
+            lock = _local_locks.setdefault(os.path.abspath(handle.name), threading.Lock())
+        with lock:
+            yield
+        return
+    fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+    try:
+        yield
+    finally:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+
+def try_lock(path):
+    """Non-blocking exclusive lock on the file at PATH (created if missing)
+
+    Returns the open handle holding the lock, or None when another process
+    or thread holds it. Release with unlock(handle).
+    """
+    handle = open(path, 'a')
+    if fcntl is None:
+        with _local_guard:
+            lock = _local_locks.setdefault(os.path.abspath(path), threading.Lock())
+        acquired = lock.acquire(blocking=False)
+    else:
+        try:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            acquired = True
+        except OSError:
+            acquired = False
+    if not acquired:
+        handle.close()
+        return None
+    return handle
+
+
+def unlock(handle):
+    """Release a lock taken with try_lock()"""
+    if fcntl is None:
+        with _local_guard:
+            lock = _local_locks[os.path.abspath(handle.name)]
+        lock.release()
+    # Closing the descriptor drops the flock
+    handle.close()
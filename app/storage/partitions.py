@@ -0,0 +1,281 @@
+import atexit
+import csv
+import json
+import os
+import re
+import threading
+import time
+
+from .cold_store import DATA_DIR
+from .locks import file_lock
+
+TENANT_DIR = os.path.join(DATA_DIR, "tenants")
+INDEX_FILE = "index.json"
+# Taken around read-merge-write of index.json by every process
+INDEX_LOCK_FILE = "index.lock"
+# Per-user forwarded data written before partitioning (data/user_<id>_serial.csv)
+LEGACY_USER_FILE = re.compile(r'^user_(\d+)_serial\.csv$')
+TENANT_NAME = re.compile(r'^user_(\d+)$')
+# Device counters, not measurements
+SKIP_FIELDS = ('timestamp', 'ts', 'seq')
+
+
+def port_slug(port):
+    """'/dev/ttyUSB0' -> 'dev_ttyUSB0' (safe as a file name)"""
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', str(port)).strip('_.') or 'port'
+
+
+def sensor_of(data_line):
+    """(sensor, fields) of a forwarded line: its "sensor" field or its numeric field names"""
+    if data_line.lstrip().startswith('{'):
+        try:
+            data = json.loads(data_line)
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            fields = sorted(k for k, v in data.items()
+                            if isinstance(v, (int, float)) and not isinstance(v, bool) and k not in SKIP_FIELDS)
+            sensor = data.get('sensor')
+            return (str(sensor) if sensor else '+'.join(fields) or 'raw'), fields
+    # Text lines are charted by their first number (see tail_cache.extract_data_fields)
+    return 'text', ['value']
+
+
+def owner_of(file_path):
+    """User id a data file belongs to, or None for shared files"""
+    path = os.path.abspath(file_path)
+    relative = os.path.relpath(path, TENANT_DIR)
+    if not relative.startswith('..'):
+        match = TENANT_NAME.match(relative.split(os.sep)[0])
+        return int(match.group(1)) if match else None
+    match = LEGACY_USER_FILE.match(os.path.basename(path))
+    if match and os.path.dirname(path) == os.path.abspath(DATA_DIR):
+        return int(match.group(1))
+    return None
+
+
+def visible_to(file_path, user_id):
+    """True if USER_ID may read FILE_PATH (its own files and shared ones)"""
+    owner = owner_of(file_path)
+    return owner is None or owner == user_id
+
+
+def merge_entry(entries, key, delta):
+    """Add DELTA (an entry holding rows added and their first/last) to ENTRIES[KEY]"""
+    entry = entries.get(key)
+    if entry is None:
+        entries[key] = dict(delta, fields=list(delta['fields']))
+        return
+    entry['rows'] += delta['rows']
+    # Agents may deliver buffered readings late
+    entry['first'] = min(entry['first'], delta['first'])
+    entry['last'] = max(entry['last'], delta['last'])
+    if len(delta['fields']) > len(entry['fields']):
+        entry['fields'] = sorted(set(entry['fields']) | set(delta['fields']))
+
+
+class PartitionIndex:
+    """Forwarded data partitioned by user and device
+
+    Layout: data/tenants/user_<id>/<port>.csv, one append-only file per
+    (user, port), plus an index.json in the same directory mapping
+    (port, sensor) to its partition with row counts and first/last
+    timestamps. A tenant's index is loaded on first use, so requests only
+    ever read that tenant's directory; a missing index is rebuilt from the
+    tenant's own partitions. Several processes (gunicorn workers) share the
+    file: each reloads it when another one saved, and saves by merging its
+    unsaved rows into the file's current entries under the index lock.
+    """
+    SAVE_INTERVAL = 5
+
+    def __init__(self, root=TENANT_DIR):
+        self.root = root
+        self.tenants = {}
+        self.lock = threading.Lock()
+
+    def tenant_dir(self, user_id):
+        return os.path.join(self.root, f"user_{int(user_id)}")
+
+    def partition_path(self, user_id, port):
+        return os.path.join(self.tenant_dir(user_id), f"{port_slug(port)}.csv")
+
+    def load(self, user_id):
+        """Load USER_ID's index now; call before appending, so a rebuild from
+        the partitions never counts rows that record() adds again"""
+        with self.lock:
+            self._tenant(user_id)
+
+    def record(self, user_id, port, rows):
+        """Index ROWS [(timestamp, data_line)] just appended to PORT's partition"""
+        if not rows:
+            return
+        partition = os.path.basename(self.partition_path(user_id, port))
+        with self.lock:
+            tenant = self._tenant(user_id)
+            added = False
+            for ts, data_line in rows:
+                sensor, fields = sensor_of(data_line)
+                key = (port, sensor)
+                added = added or key not in tenant['entries']
+                delta = {'port': port, 'sensor': sensor, 'fields': fields, 'partition': partition,
+                         'rows': 1, 'first': ts, 'last': ts}
+                merge_entry(tenant['entries'], key, delta)
+                # Kept apart until saved, to merge with what other processes saved meanwhile
+                merge_entry(tenant['pending'], key, delta)
+            tenant['dirty'] = True
+            # New series are saved right away; counters at most every SAVE_INTERVAL
+            if added or time.time() - tenant['saved_at'] >= self.SAVE_INTERVAL:
+                self._save(user_id, tenant)
+
+    def entries(self, user_id):
+        """Index entries of one user, sorted by port and sensor"""
+        with self.lock:
+            tenant = self._tenant(user_id)
+            found = []
+            for key in sorted(tenant['entries']):
+                entry = dict(tenant['entries'][key])
+                entry['path'] = os.path.join(self.tenant_dir(user_id), entry['partition'])
+                found.append(entry)
+            return found
+
+    def files(self, user_id):
+        """Partition paths of one user"""
+        return sorted(set(entry['path'] for entry in self.entries(user_id)))
+
+    def newest_file(self, user_id):
+        """Partition with the latest reading, or None"""
+        entries = self.entries(user_id)
+        if not entries:
+            return None
+        return max(entries, key=lambda entry: entry['last'])['path']
+
+    def resolve(self, user_id, name):
+        """Path of the user's partition called NAME, or None"""
+        for path in self.files(user_id):
+            if os.path.basename(path) == name:
+                return path
+        return None
+
+    def all_files(self):
+        """Every partition on disk (maintenance only; walks all tenants)"""
+        found = []
+        if not os.path.isdir(self.root):
+            return found
+        for tenant in sorted(os.listdir(self.root)):
+            directory = os.path.join(self.root, tenant)
+            if TENANT_NAME.match(tenant) and os.path.isdir(directory):
+                found.extend(os.path.join(directory, name) for name in sorted(os.listdir(directory))
+                             if name.endswith('.csv'))
+        return found
+
+    def flush(self):
+        """Save every index with unsaved counters"""
+        with self.lock:
+            for user_id, tenant in self.tenants.items():
+                if tenant['dirty']:
+                    self._save(user_id, tenant)
+
+    def _tenant(self, user_id):
+        user_id = int(user_id)
+        tenant = self.tenants.get(user_id)
+        stamp = self._stamp(user_id)
+        if tenant is None:
+            tenant = {'entries': self._load(user_id), 'pending': {}, 'stamp': stamp,
+                      'dirty': False, 'saved_at': time.time()}
+            self.tenants[user_id] = tenant
+        elif stamp != tenant['stamp']:
+            # Another process saved: take its entries and reapply our unsaved rows
+            entries = self._load(user_id)
+            for key, delta in tenant['pending'].items():
+                merge_entry(entries, key, delta)
+            tenant['entries'] = entries
+            tenant['stamp'] = stamp
+        return tenant
+
+    def _index_path(self, user_id):
+        return os.path.join(self.tenant_dir(user_id), INDEX_FILE)
+
+    def _stamp(self, user_id):
+        """Identity of the saved index (None if missing), to notice saves by other processes"""
+        try:
+            st = os.stat(self._index_path(user_id))
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def _read(self, user_id):
+        """Saved entries of USER_ID, or None without a readable index"""
+        try:
+            with open(self._index_path(user_id), 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            entries = {}
+            for entry in saved['entries']:
+                # Indexes written before ports were coerced may hold numbers
+                entry['port'] = str(entry['port'])
+                entries[(entry['port'], entry['sensor'])] = entry
+            return entries
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"⚠️ Unreadable partition index for user {user_id}: {e}")
+            return None
+
+    def _load(self, user_id):
+        entries = self._read(user_id)
+        return entries if entries is not None else self._rebuild(user_id)
+
+    def _rebuild(self, user_id):
+        """Index the tenant's partitions from their rows"""
+        directory = self.tenant_dir(user_id)
+        entries = {}
+        if not os.path.isdir(directory):
+            return entries
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith('.csv'):
+                continue
+            with open(os.path.join(directory, name), 'r', newline='', encoding='utf-8', errors='replace') as f:
+                for row in csv.DictReader(f):
+                    ts, port, data_line = row.get('timestamp'), row.get('port'), row.get('data')
+                    if not ts or not port or data_line is None:
+                        continue
+                    sensor, fields = sensor_of(data_line)
+                    entry = entries.setdefault((port, sensor), {
+                        'port': port, 'sensor': sensor, 'fields': fields, 'partition': name,
+                        'rows': 0, 'first': ts, 'last': ts})
+                    entry['rows'] += 1
+                    entry['first'] = min(entry['first'], ts)
+                    entry['last'] = max(entry['last'], ts)
+        if entries:
+            print(f"🗂️ Rebuilt partition index for user {user_id}: {len(entries)} series")
+            self._save(user_id, {'entries': entries, 'pending': {}, 'dirty': True, 'saved_at': 0})
+        return entries
+
+    def _save(self, user_id, tenant):
+        """Merge TENANT's unsaved rows into the index file, under the index lock"""
+        directory = self.tenant_dir(user_id)
+        os.makedirs(directory, exist_ok=True)
+        index_path = self._index_path(user_id)
+        tmp_path = index_path + '.tmp'
+        try:
+            with open(os.path.join(directory, INDEX_LOCK_FILE), 'a') as lock_handle, file_lock(lock_handle):
+                entries = self._read(user_id)
+                if entries is None:
+                    entries = tenant['entries']
+                else:
+                    for key, delta in tenant['pending'].items():
+                        merge_entry(entries, key, delta)
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({'user_id': int(user_id), 'entries': list(entries.values())}, f, indent=1)
+                os.replace(tmp_path, index_path)
+                tenant['stamp'] = self._stamp(user_id)
+            tenant['entries'] = entries
+            tenant['pending'] = {}
+            tenant['dirty'] = False
+            tenant['saved_at'] = time.time()
+        except OSError as e:
+            print(f"Error saving partition index for user {user_id}: {e}")
+
+
+# Global instance
+partition_index = PartitionIndex()
+atexit.register(partition_index.flush)
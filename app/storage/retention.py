@@ -0,0 +1,262 @@
+import fnmatch
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta
+
+from .cold_store import cold_store, DATA_DIR
+from .locks import file_lock, try_lock, unlock
+from .partitions import partition_index
+
+# Per hot file, in its cold partition directory
+WATERMARK_FILE = 'compaction.json'
+# Held by the one process running the periodic service, in the data directory
+SERVICE_LOCK_FILE = '.retention.lock'
+# Next to each hot file while it is being compacted
+COMPACT_LOCK_SUFFIX = '.compact.lock'
+
+DEFAULT_POLICY = {
+    'hot_days': int(os.getenv('RETENTION_HOT_DAYS', '7')),
+    'cold_days': int(os.getenv('RETENTION_COLD_DAYS', '365')),
+    'compression': os.getenv('RETENTION_COMPRESSION', 'gzip'),
+}
+
+
+def load_policies():
+    """Per-file overrides from RETENTION_POLICIES, e.g. {"user_*_serial.csv": {"hot_days": 2}}"""
+    raw = os.getenv('RETENTION_POLICIES')
+    if not raw:
+        return []
+    try:
+        return list(json.loads(raw).items())
+    except ValueError as e:
+        print(f"Invalid RETENTION_POLICIES: {e}")
+        return []
+
+
+def row_timestamp(line):
+    """Timestamp text of a raw CSV row ('YYYY-MM-DD HH:MM:SS' sorts as text)"""
+    return line.split(b',', 1)[0].strip().strip(b'"').decode('ascii', errors='replace')
+
+
+class RetentionService:
+    """Background compaction of hot CSV files into compressed daily partitions
+
+    Rows older than the file's `hot_days` move to data/cold/; partitions older
+    than `cold_days` are deleted. Files are treated as append-only logs, so
+    only the leading run of old rows is compacted and the rest is kept as-is.
+    A file is compacted by one run at a time, and with several app workers
+    only the one holding the service lock runs the periodic loop.
+    """
+    BATCH_LINES = 10000
+
+    def __init__(self, data_dir=DATA_DIR, interval=3600):
+        self.data_dir = data_dir
+        self.interval = int(os.getenv('RETENTION_INTERVAL', interval))
+        self.policies = load_policies()
+        self.is_running = False
+        self.thread = None
+        self.last_run = None
+
+    def set_policy(self, pattern, **policy):
+        """Override hot_days / cold_days / compression for files matching PATTERN"""
+        self.policies = [(p, o) for p, o in self.policies if p != pattern]
+        self.policies.append((pattern, policy))
+
+    def policy_for(self, file_name):
+        policy = dict(DEFAULT_POLICY)
+        for pattern, overrides in self.policies:
+            if fnmatch.fnmatch(file_name, pattern):
+                policy.update(overrides)
+        return policy
+
+    def start(self):
+        """Start the periodic maintenance thread"""
+        if self.is_running:
+            return
+        self.is_running = True
+        self.thread = threading.Thread(target=self._run_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.is_running = False
+
+    def run_once(self, now=None):
+        """Compact and expire every CSV file in the data directory"""
+        now = now or datetime.now()
+        report = {}
+        if not os.path.isdir(self.data_dir):
+            return report
+
+        paths = [os.path.join(self.data_dir, name) for name in sorted(os.listdir(self.data_dir))]
+        for path in paths + partition_index.all_files():
+            name = os.path.relpath(path, self.data_dir)
+            if not name.endswith('.csv') or not os.path.isfile(path):
+                continue
+            try:
+                report[name] = self.compact_file(path, now)
+            except Exception as e:
+                print(f"Retention error for {name}: {e}")
+                report[name] = {'error': str(e)}
+
+        self.last_run = now
+        return report
+
+    def compact_file(self, file_path, now=None):
+        """Move rows older than the hot window into cold partitions
+
+        Rows already written to partitions by an interrupted run (see the
+        watermark) are not written again. Appenders are locked out only for
+        the final copy of rows that arrived meanwhile and the swap. A file
+        another run (e.g. the cron entry point) is compacting is skipped.
+        """
+        lock = try_lock(file_path + COMPACT_LOCK_SUFFIX)
+        if lock is None:
+            return {'moved': 0, 'expired_partitions': 0, 'skipped': 'compaction already running'}
+        try:
+            return self._compact(file_path, now)
+        finally:
+            unlock(lock)
+
+    def _compact(self, file_path, now=None):
+        now = now or datetime.now()
+        policy = self.policy_for(os.path.basename(file_path))
+        cutoff = (now - timedelta(days=policy['hot_days'])).strftime('%Y-%m-%d %H:%M:%S')
+        expire_day = (now - timedelta(days=policy['cold_days'])).strftime('%Y-%m-%d')
+
+        expired = cold_store.drop_before(file_path, expire_day)
+        moved = 0
+
+        with open(file_path, 'rb') as src:
+            header = src.readline()
+            if not header.lower().lstrip(b'\xef\xbb\xbf"').startswith(b'timestamp'):
+                return {'moved': 0, 'expired_partitions': expired}
+
+            inode = os.fstat(src.fileno()).st_ino
+            watermark = self._load_watermark(file_path, inode)
+            day_lines = {}
+            keep_from = None
+            while True:
+                position = src.tell()
+                line = src.readline()
+                if not line or not line.endswith(b'\n'):
+                    keep_from = position
+                    break
+                ts = row_timestamp(line)
+                if ts >= cutoff:
+                    keep_from = position
+                    break
+                moved += 1
+                day = ts[:10]
+                # Rows past cold retention are simply dropped
+                if day >= expire_day and position >= watermark.get(day, {}).get('done', 0):
+                    lines, _ = day_lines.get(day, ([], None))
+                    lines.append(line)
+                    day_lines[day] = (lines, position + len(line))
+                    if len(lines) >= self.BATCH_LINES:
+                        self._write_partition(file_path, inode, watermark, day, header, day_lines.pop(day), policy)
+
+            if moved == 0:
+                return {'moved': 0, 'expired_partitions': expired}
+
+            for day, batch in sorted(day_lines.items()):
+                self._write_partition(file_path, inode, watermark, day, header, batch, policy)
+
+            # Rewrite the hot file with the remaining rows and swap it in
+            tmp_path = file_path + '.compact'
+            with open(tmp_path, 'wb') as dst:
+                dst.write(header)
+                src.seek(keep_from)
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+                shutil.copymode(file_path, tmp_path)
+                # Rows appended while we were copying; appenders in any process wait
+                # for the lock and then find the new file
+                with file_lock(src):
+                    dst.write(src.read())
+                    dst.flush()
+                    os.replace(tmp_path, file_path)
+
+        self._clear_watermark(file_path)
+        print(f"🗜️ Compacted {moved} rows from {os.path.basename(file_path)}")
+        return {'moved': moved, 'expired_partitions': expired}
+
+    def _watermark_path(self, file_path):
+        return os.path.join(cold_store.partition_dir(file_path), WATERMARK_FILE)
+
+    def _partition_size(self, file_path, day):
+        return sum(os.path.getsize(path) for _, path in cold_store.list_partitions(file_path, day, day))
+
+    def _load_watermark(self, file_path, inode):
+        """{day: {'done': offset}} for the hot file INODE: rows before `done` are already in the partition
+
+        A batch whose write started ('pending') counts as done when its
+        partition grew past the size recorded before the write.
+        """
+        try:
+            with open(self._watermark_path(file_path)) as f:
+                mark = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+        if mark.get('inode') != inode:
+            # Left by a run that finished its swap
+            return {}
+        watermark = {}
+        for day, entry in mark.get('days', {}).items():
+            done = entry.get('done', 0)
+            pending = entry.get('pending')
+            if pending and self._partition_size(file_path, day) > pending['size']:
+                done = pending['offset']
+            watermark[day] = {'done': done}
+        return watermark
+
+    def _write_partition(self, file_path, inode, watermark, day, header, batch, policy):
+        """Append BATCH (lines, end offset) to DAY's partition, recording the intent first"""
+        lines, end = batch
+        entry = watermark.setdefault(day, {'done': 0})
+        entry['pending'] = {'offset': end, 'size': self._partition_size(file_path, day)}
+        self._save_watermark(file_path, inode, watermark)
+        cold_store.append_partition(file_path, day, header, lines, policy['compression'])
+        entry['done'] = end
+        del entry['pending']
+
+    def _save_watermark(self, file_path, inode, watermark):
+        path = self._watermark_path(file_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'inode': inode, 'days': watermark}, f)
+        os.replace(path + '.tmp', path)
+
+    def _clear_watermark(self, file_path):
+        try:
+            os.remove(self._watermark_path(file_path))
+        except FileNotFoundError:
+            pass
+
+    def _run_loop(self):
+        leader = None
+        while self.is_running:
+            # Every worker starts the service; one holds the lock and compacts,
+            # the others keep trying in case that worker exits
+            if leader is None:
+                os.makedirs(self.data_dir, exist_ok=True)
+                leader = try_lock(os.path.join(self.data_dir, SERVICE_LOCK_FILE))
+            if leader is not None:
+                try:
+                    self.run_once()
+                except Exception as e:
+                    print(f"Retention error: {e}")
+            time.sleep(self.interval)
+        if leader is not None:
+            unlock(leader)
+
+
+# Global instance
+retention_service = RetentionService()
+
+
+if __name__ == '__main__':
+    # One-off maintenance run, e.g. from cron: python -m app.storage.retention
+    print(retention_service.run_once())
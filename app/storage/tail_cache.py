@@ -0,0 +1,247 @@
+import csv
+import io
+import itertools
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+MISSING_TS = np.iinfo(np.int64).min
+TEXT_COLUMNS = ('timestamp', 'port', 'data')
+NUMBER_PATTERN = r"([-+]?\d*\.\d+|\d+)"
+_generations = itertools.count(1)
+
+
+class GrowableArray:
+    """Append-only numpy buffer with amortized O(1) growth"""
+    def __init__(self, dtype, capacity=1024):
+        self.buffer = np.empty(capacity, dtype=dtype)
+        self.size = 0
+
+    def extend(self, values):
+        needed = self.size + len(values)
+        if needed > len(self.buffer):
+            capacity = max(needed, len(self.buffer) * 2)
+            grown = np.empty(capacity, dtype=self.buffer.dtype)
+            grown[:self.size] = self.buffer[:self.size]
+            self.buffer = grown
+        self.buffer[self.size:needed] = values
+        self.size = needed
+
+    def view(self):
+        return self.buffer[:self.size]
+
+
+class TailEntry:
+    """Parse state for one file: where we stopped and what we've parsed so far"""
+    def __init__(self, inode):
+        self.inode = inode
+        # Changes whenever a file is reparsed from scratch
+        self.generation = next(_generations)
+        self.offset = 0
+        self.partial = b''
+        self.header = None
+        self.timestamps = GrowableArray(np.int64)
+        self.ports = GrowableArray(object)
+        self.columns = OrderedDict()
+        self.row_count = 0
+        # Held while parsing, so one file's first load does not block the others
+        self.lock = threading.Lock()
+
+    def frame(self, start=0):
+        """DataFrame of parsed rows from row START onwards"""
+        frame = OrderedDict()
+        if 'timestamp' in (self.header or []):
+            frame['timestamp'] = format_timestamps(self.timestamps.view()[start:])
+        if 'port' in (self.header or []):
+            frame['port'] = self.ports.view()[start:]
+        for name, column in self.columns.items():
+            frame[name] = column.view()[start:]
+        return pd.DataFrame(frame)
+
+    def consume(self, data):
+        """Parse complete lines in DATA, keeping any trailing partial line"""
+        cut = data.rfind(b'\n')
+        if cut < 0:
+            self.partial = data
+            return
+        self.partial = data[cut + 1:]
+        data = data[:cut + 1]
+
+        if self.header is None:
+            first_line, _, data = data.partition(b'\n')
+            header_line = first_line.decode('utf-8-sig', errors='replace')
+            self.header = [h.strip() for h in next(csv.reader([header_line]), [])]
+            if not data:
+                return
+
+        frame = pd.read_csv(io.BytesIO(data), header=None, names=self.header, dtype=str,
+                            keep_default_na=False, on_bad_lines='skip', index_col=False)
+        rows = len(frame)
+        if rows == 0:
+            return
+
+        if 'timestamp' in frame.columns:
+            self.timestamps.extend(parse_timestamps(frame['timestamp']))
+        else:
+            self.timestamps.extend(np.full(rows, MISSING_TS, dtype=np.int64))
+        if 'port' in frame.columns:
+            self.ports.extend(frame['port'].values)
+
+        fields = OrderedDict()
+        for name in frame.columns:
+            if name in TEXT_COLUMNS:
+                continue
+            fields[name] = pd.to_numeric(frame[name], errors='coerce').astype(float).values
+        if 'data' in frame.columns:
+            fields.update(extract_data_fields(frame['data']))
+
+        for name, values in fields.items():
+            if name not in self.columns:
+                column = GrowableArray(np.float64)
+                column.extend(np.full(self.row_count, np.nan))
+                self.columns[name] = column
+            self.columns[name].extend(values)
+        for name, column in self.columns.items():
+            if name not in fields:
+                column.extend(np.full(rows, np.nan))
+
+        self.row_count += rows
+
+
+def parse_timestamps(values):
+    """Convert timestamp strings to int64 epoch milliseconds (MISSING_TS if unparseable)"""
+    parsed = pd.to_datetime(pd.Series(values, dtype=object), format=TIMESTAMP_FORMAT, errors='coerce')
+    if parsed.isna().all() and len(parsed) > 0:
+        # Not in our own format: let pandas infer it
+        parsed = pd.to_datetime(pd.Series(values, dtype=object), errors='coerce')
+    ms = parsed.values.astype('datetime64[ms]').astype(np.int64)
+    ms[parsed.isna().values] = MISSING_TS
+    return ms
+
+
+def format_timestamps(ms):
+    """Convert int64 epoch milliseconds back to datetime64 values"""
+    return np.asarray(ms, dtype=np.int64).astype('datetime64[ms]')
+
+
+def extract_data_fields(data):
+    """Turn the raw `data` column of forwarded serial rows into numeric fields
+
+    JSON objects contribute their numeric keys; anything else contributes the
+    first number found in the line as `value`.
+    """
+    fields = {}
+    data = data.fillna('')
+    is_json = data.str.lstrip().str.startswith('{')
+
+    if is_json.any():
+        records = []
+        for line in data[is_json]:
+            try:
+                parsed = json.loads(line)
+            except ValueError:
+                parsed = {}
+            records.append({k: v for k, v in parsed.items()
+                            if isinstance(v, (int, float)) and not isinstance(v, bool)}
+                           if isinstance(parsed, dict) else {})
+        json_frame = pd.DataFrame.from_records(records, index=data.index[is_json])
+        for name in json_frame.columns:
+            fields[name] = json_frame[name].reindex(data.index).astype(float).values
+
+    if (~is_json).any():
+        first_number = data[~is_json].str.extract(NUMBER_PATTERN, expand=False)
+        fields['value'] = pd.to_numeric(first_number, errors='coerce').reindex(data.index).astype(float).values
+
+    return fields
+
+
+class FileTailCache:
+    """Incrementally parsed view of append-only CSV data files
+
+    Each access parses only the bytes appended since the previous one, in
+    chunks of at most READ_CHUNK bytes. A file that shrank or was replaced
+    (new inode) is parsed again from the start. The cache lock only guards
+    the set of entries; parsing holds the file's own entry lock.
+    """
+    READ_CHUNK = 8 * 1024 * 1024
+
+    def __init__(self, max_files=256):
+        self.max_files = max_files
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def refresh(self, file_path):
+        """Parse any newly appended rows and return the entry for the file"""
+        path = os.path.abspath(file_path)
+        st = os.stat(path)
+
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is None or entry.inode != st.st_ino or st.st_size < entry.offset:
+                entry = TailEntry(st.st_ino)
+                self.entries[path] = entry
+            self.entries.move_to_end(path)
+            while len(self.entries) > self.max_files:
+                self.entries.popitem(last=False)
+
+        with entry.lock:
+            # Another thread may have caught up while we waited
+            if st.st_size > entry.offset:
+                with open(path, 'rb') as f:
+                    f.seek(entry.offset)
+                    remaining = st.st_size - entry.offset
+                    while remaining > 0:
+                        chunk = f.read(min(remaining, self.READ_CHUNK))
+                        if not chunk:
+                            break
+                        remaining -= len(chunk)
+                        entry.offset += len(chunk)
+                        entry.consume(entry.partial + chunk)
+        return entry
+
+    def invalidate(self, file_path=None):
+        """Forget parsed state for one file (or all files)"""
+        with self.lock:
+            if file_path is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(os.path.abspath(file_path), None)
+
+    def get_series(self, file_path):
+        """Return parsed arrays for a file: timestamps (epoch ms), ports and numeric columns"""
+        entry = self.refresh(file_path)
+        with entry.lock:
+            return {
+                'header': list(entry.header or []),
+                'timestamps': entry.timestamps.view(),
+                'ports': entry.ports.view() if 'port' in (entry.header or []) else None,
+                'columns': OrderedDict((name, col.view()) for name, col in entry.columns.items()),
+                'rows': entry.row_count,
+                'generation': entry.generation
+            }
+
+    def row_count(self, file_path):
+        return self.refresh(file_path).row_count
+
+    def tail_frame(self, file_path, rows=None):
+        """DataFrame of the last ROWS parsed rows (all rows if None)"""
+        entry = self.refresh(file_path)
+        with entry.lock:
+            start = 0 if rows is None else max(entry.row_count - rows, 0)
+            return entry.frame(start)
+
+
+def parse_csv_bytes(data):
+    """Parse a whole CSV (header + rows) into the same frame shape as tail_frame"""
+    entry = TailEntry(None)
+    entry.consume(data if data.endswith(b'\n') else data + b'\n')
+    return entry.frame()
+
+
+# Global instance
+tail_cache = FileTailCache()
@@ -0,0 +1,317 @@
+import os
+import re
+import struct
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .tail_cache import tail_cache, parse_csv_bytes, MISSING_TS
+from .cold_store import cold_store, open_data_file
+
+STEP_UNITS = {'ms': 1, 's': 1000, 'm': 60 * 1000, 'h': 3600 * 1000, 'd': 86400 * 1000, 'w': 7 * 86400 * 1000}
+AGGREGATIONS = ('mean', 'min', 'max', 'count', 'sum', 'median', 'last', 'first')
+SERIES_HEADER = struct.Struct('<II')
+
+
+def parse_step(value):
+    """'30s', '5m', '1h', '1d' or plain milliseconds -> step in ms"""
+    if value is None or value == '':
+        return None
+    match = re.fullmatch(r'\s*(\d+)\s*(ms|s|m|h|d|w)?\s*', str(value))
+    if not match:
+        raise ValueError(f"Invalid step '{value}'")
+    step = int(match.group(1)) * STEP_UNITS[match.group(2) or 'ms']
+    if step <= 0:
+        raise ValueError("step must be positive")
+    return step
+
+
+def to_ms(dt):
+    """Naive datetime -> epoch ms on the same naive clock as the stored timestamps"""
+    return int(np.datetime64(dt, 'ms').astype(np.int64))
+
+
+def percentile_of(agg):
+    """'p95' -> 95.0, else None"""
+    match = re.fullmatch(r'p(\d+(?:\.\d+)?)', agg or '')
+    return float(match.group(1)) if match else None
+
+
+class SortedSeries:
+    """Timestamp-sorted view of one file's parsed arrays"""
+    def __init__(self):
+        self.rows = 0
+        self.generation = None
+        self.monotonic = True
+        self.order = None
+        self.sorted_ts = None
+        self.last_ts = MISSING_TS
+
+
+class TimeIndex:
+    """Range queries over per-file timestamp arrays with binary search
+
+    Files are append-only and normally already in time order, so the tail
+    cache arrays are searched directly; out-of-order files get a cached
+    argsort. Windows reaching before the hot file pull in the matching cold
+    partitions, which are parsed once and cached.
+    """
+    def __init__(self, max_cold_partitions=64):
+        self.series = {}
+        self.cold_cache = OrderedDict()
+        self.max_cold_partitions = max_cold_partitions
+        self.lock = threading.Lock()
+
+    def sorted_arrays(self, file_path):
+        """(sorted timestamps, columns, ports, order) for the hot file
+
+        ORDER is None when the file is already in time order; otherwise it maps
+        sorted positions back to rows and callers index only the slice they need.
+        """
+        data = tail_cache.get_series(file_path)
+        ts = data['timestamps']
+        key = os.path.abspath(file_path)
+
+        with self.lock:
+            state = self.series.get(key)
+            if state is None or state.generation != data['generation']:
+                state = SortedSeries()
+                state.generation = data['generation']
+                self.series[key] = state
+            if data['rows'] > state.rows:
+                new = ts[state.rows:]
+                # Only newly appended rows need checking
+                if new[0] < state.last_ts or np.any(np.diff(new) < 0):
+                    state.monotonic = False
+                state.last_ts = max(state.last_ts, int(new.max()))
+                state.rows = data['rows']
+                state.order = None
+            if not state.monotonic and state.order is None:
+                state.order = np.argsort(ts, kind='stable')
+                state.sorted_ts = ts[state.order]
+            order = state.order
+            sorted_ts = state.sorted_ts if order is not None else ts
+
+        return sorted_ts, data['columns'], data['ports'], order
+
+    def cold_arrays(self, file_path, start_ms, end_ms):
+        """sorted_arrays() equivalent for cold partitions overlapping [start_ms, end_ms]"""
+        start_day = str(np.datetime64(start_ms, 'ms').astype('datetime64[D]')) if start_ms is not None else None
+        end_day = str(np.datetime64(end_ms, 'ms').astype('datetime64[D]')) if end_ms is not None else None
+
+        parts = []
+        for _, path in cold_store.list_partitions(file_path, start_day, end_day):
+            parts.append(self._load_partition(path))
+        if not parts:
+            return None
+
+        ts = np.concatenate([p[0] for p in parts])
+        names = []
+        for _, cols, _ in parts:
+            names += [n for n in cols if n not in names]
+        columns = OrderedDict((name, np.concatenate([cols.get(name, np.full(len(t), np.nan)) for t, cols, _ in parts]))
+                              for name in names)
+        ports = None
+        if all(p[2] is not None for p in parts):
+            ports = np.concatenate([p[2] for p in parts])
+        order = np.argsort(ts, kind='stable')
+        return ts[order], columns, ports, order
+
+    def query(self, file_path, start=None, end=None, field=None, port=None):
+        """Timestamps (epoch ms) and values of FIELD within [start, end]
+
+        Returns (timestamps, values, field_name). Cost is O(log n + k) on the
+        hot file plus any cold partitions the window touches. Without START,
+        cold partitions are read only when END falls before the hot file's
+        first row (or there is no hot data).
+        """
+        start_ms = to_ms(start) if start is not None else None
+        end_ms = to_ms(end) if end is not None else None
+
+        segments = []
+        hot_first = None
+        if os.path.exists(file_path):
+            hot = self.sorted_arrays(file_path)
+            valid_from = np.searchsorted(hot[0], MISSING_TS, side='right')
+            hot_first = int(hot[0][valid_from]) if valid_from < len(hot[0]) else None
+            segments.append(hot)
+
+        # Cold data only matters when the window reaches back before the hot file
+        if (hot_first is None or (start_ms is not None and start_ms < hot_first)
+                or (end_ms is not None and end_ms < hot_first)):
+            cold_end = end_ms if hot_first is None else (hot_first if end_ms is None else min(end_ms, hot_first))
+            cold = self.cold_arrays(file_path, start_ms, cold_end)
+            if cold is not None:
+                segments.insert(0, cold)
+
+        field = field or self.default_field([s[1] for s in segments])
+        out_ts, out_values = [], []
+        for ts, columns, ports, order in segments:
+            lo = np.searchsorted(ts, start_ms if start_ms is not None else MISSING_TS + 1, side='left')
+            hi = np.searchsorted(ts, end_ms, side='right') if end_ms is not None else len(ts)
+            if hi <= lo or field not in columns:
+                continue
+            rows = slice(lo, hi) if order is None else order[lo:hi]
+            seg_ts = ts[lo:hi]
+            seg_values = columns[field][rows]
+            if port is not None:
+                if ports is None:
+                    continue
+                mask = ports[rows] == port
+                seg_ts, seg_values = seg_ts[mask], seg_values[mask]
+            keep = ~np.isnan(seg_values)
+            out_ts.append(seg_ts[keep])
+            out_values.append(seg_values[keep])
+
+        if not out_ts:
+            return np.empty(0, dtype=np.int64), np.empty(0), field
+        return np.concatenate(out_ts), np.concatenate(out_values), field
+
+    def default_field(self, column_sets):
+        for columns in column_sets:
+            if 'sensor_value' in columns:
+                return 'sensor_value'
+        for columns in column_sets:
+            for name in columns:
+                return name
+        return None
+
+    def fields(self, file_path):
+        if not os.path.exists(file_path):
+            return []
+        return list(tail_cache.get_series(file_path)['columns'].keys())
+
+    def last_before(self, file_path, at, field, port=None):
+        """(timestamp, value) of the latest reading of FIELD at or before AT, or None
+
+        Searches back from AT through the hot file, then cold partitions
+        newest day first, stopping at the first match.
+        """
+        at_ms = to_ms(at)
+        if os.path.exists(file_path):
+            ts, columns, ports, order = self.sorted_arrays(file_path)
+            if field in columns:
+                lo = np.searchsorted(ts, MISSING_TS, side='right')
+                hi = np.searchsorted(ts, at_ms, side='right')
+                # Walk back in blocks; the match is almost always in the first one
+                while hi > lo:
+                    block = max(lo, hi - 1024)
+                    rows = np.arange(block, hi) if order is None else order[block:hi]
+                    valid = ~np.isnan(columns[field][rows])
+                    if port is not None:
+                        valid &= (ports[rows] == port) if ports is not None else False
+                    found = np.flatnonzero(valid)
+                    if len(found):
+                        return int(ts[block + found[-1]]), float(columns[field][rows[found[-1]]])
+                    hi = block
+
+        end_day = str(np.datetime64(at_ms, 'ms').astype('datetime64[D]'))
+        for _, path in reversed(cold_store.list_partitions(file_path, None, end_day)):
+            ts, columns, ports = self._load_partition(path)
+            if field not in columns:
+                continue
+            valid = (ts <= at_ms) & (ts != MISSING_TS) & ~np.isnan(columns[field])
+            if port is not None:
+                valid &= (ports == port) if ports is not None else False
+            found = np.flatnonzero(valid)
+            if len(found):
+                best = found[np.argmax(ts[found])]
+                return int(ts[best]), float(columns[field][best])
+        return None
+
+    def latest_timestamp(self, file_path):
+        ts = self.sorted_arrays(file_path)[0]
+        return int(ts[-1]) if len(ts) and ts[-1] != MISSING_TS else None
+
+    def _load_partition(self, path):
+        key = (path, os.path.getmtime(path))
+        with self.lock:
+            if key in self.cold_cache:
+                self.cold_cache.move_to_end(key)
+                return self.cold_cache[key]
+
+        with open_data_file(path, 'rb') as f:
+            frame = parse_csv_bytes(f.read())
+        ts = frame['timestamp'].values.astype('datetime64[ms]').astype(np.int64) if 'timestamp' in frame.columns else np.full(len(frame), MISSING_TS)
+        columns = OrderedDict((name, frame[name].values.astype(float)) for name in frame.columns if name not in ('timestamp', 'port'))
+        ports = frame['port'].values if 'port' in frame.columns else None
+        loaded = (ts, columns, ports)
+
+        with self.lock:
+            self.cold_cache[key] = loaded
+            while len(self.cold_cache) > self.max_cold_partitions:
+                self.cold_cache.popitem(last=False)
+        return loaded
+
+
+def aggregate(timestamps, values, agg='mean', step=None, origin=None):
+    """Vectorized bucket aggregation over sorted timestamps
+
+    Buckets are [origin + i*step, origin + (i+1)*step); without a step the
+    whole range is one bucket. Returns (bucket_start_ms, aggregated_values).
+    """
+    if len(timestamps) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+
+    if step:
+        origin = int(timestamps[0]) // step * step if origin is None else origin
+        buckets = (timestamps - origin) // step
+    else:
+        origin = int(timestamps[0])
+        buckets = np.zeros(len(timestamps), dtype=np.int64)
+
+    # timestamps are sorted, so each bucket is a contiguous run
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    counts = np.diff(np.r_[starts, len(values)])
+    bucket_ts = origin + buckets[starts] * (step or 0)
+
+    q = percentile_of(agg)
+    if agg == 'mean':
+        result = np.add.reduceat(values, starts) / counts
+    elif agg == 'sum':
+        result = np.add.reduceat(values, starts)
+    elif agg == 'min':
+        result = np.minimum.reduceat(values, starts)
+    elif agg == 'max':
+        result = np.maximum.reduceat(values, starts)
+    elif agg == 'count':
+        result = counts.astype(float)
+    elif agg == 'first':
+        result = values[starts]
+    elif agg == 'last':
+        result = values[starts + counts - 1]
+    elif agg == 'median' or q is not None:
+        q = 50.0 if q is None else q
+        if not 0 <= q <= 100:
+            raise ValueError("percentile must be between 0 and 100")
+        # Sort values within each bucket, then interpolate at the rank
+        order = np.lexsort((values, np.repeat(np.arange(len(starts)), counts)))
+        sorted_values = values[order]
+        rank = (counts - 1) * (q / 100.0)
+        lower = np.floor(rank).astype(np.int64)
+        upper = np.ceil(rank).astype(np.int64)
+        frac = rank - lower
+        result = sorted_values[starts + lower] * (1 - frac) + sorted_values[starts + upper] * frac
+    else:
+        raise ValueError(f"Unknown aggregation '{agg}'")
+
+    return bucket_ts.astype(np.int64), result
+
+
+def pack_series(timestamps, values):
+    """Chart payload: <II header (count, reserved) + int64 epoch ms + float32 values
+
+    The 8-byte header keeps the int64 block aligned so browsers can view it
+    directly as a BigInt64Array.
+    """
+    count = len(timestamps)
+    return b''.join([
+        SERIES_HEADER.pack(count, 0),
+        np.asarray(timestamps, dtype='<i8').tobytes(),
+        np.asarray(values, dtype='<f4').tobytes(),
+    ])
+
+
+# Global instance
+time_index = TimeIndex()
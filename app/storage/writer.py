@@ -0,0 +1,274 @@
+import atexit
+import fnmatch
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+from .locks import file_lock
+
+# Weakest to strongest
+DURABILITY_MODES = ('none', 'flush', 'fsync')
+
+
+def load_classes():
+    """Durability per sensor class from WRITE_DURABILITY_CLASSES, e.g. {"heart_rate": "fsync", "text": "none"}"""
+    raw = os.getenv('WRITE_DURABILITY_CLASSES')
+    if not raw:
+        return []
+    try:
+        classes = list(json.loads(raw).items())
+    except ValueError as e:
+        print(f"Invalid WRITE_DURABILITY_CLASSES: {e}")
+        return []
+    for pattern, mode in classes:
+        if mode not in DURABILITY_MODES:
+            print(f"Unknown durability '{mode}' for '{pattern}', using flush")
+    return [(pattern, mode if mode in DURABILITY_MODES else 'flush') for pattern, mode in classes]
+
+
+class Commit:
+    """Lets a caller wait until its lines were committed"""
+    def __init__(self):
+        self.done = threading.Event()
+        self.error = None
+
+    def wait(self, timeout):
+        if not self.done.wait(timeout):
+            raise TimeoutError("write not committed in time")
+        if self.error is not None:
+            raise self.error
+
+
+class GroupCommitWriter:
+    """Appends to data files through one writer thread holding the files open
+
+    Callers queue lines for a file; the writer takes everything queued,
+    writes it through handles kept open between commits (at most
+    MAX_OPEN_FILES, closed after IDLE_CLOSE seconds without writes) and
+    flushes each file once per commit, so concurrent requests share the
+    syscalls. Durability is picked per sensor class (WRITE_DURABILITY,
+    default flush; overrides by glob in WRITE_DURABILITY_CLASSES):
+    - none: append() returns at once; lines reach the file within
+      WRITE_COMMIT_MS (lost if the process dies first)
+    - flush: append() returns once the lines were written to the OS
+    - fsync: append() returns once the file was fsynced (survives power loss)
+    Commits containing only 'none' lines wait up to WRITE_COMMIT_MS or
+    WRITE_COMMIT_BYTES to gather more; waiting callers are committed as
+    soon as the previous commit finishes. Each write holds the file lock
+    (see locks.file_lock), which retention takes for its swap, so writers
+    in other processes (device/reader.py, more gunicorn workers) are safe.
+    """
+    MAX_OPEN_FILES = 128
+    IDLE_CLOSE = 30
+    WAIT_TIMEOUT = 10
+
+    def __init__(self):
+        self.default_mode = os.getenv('WRITE_DURABILITY', 'flush').lower()
+        if self.default_mode not in DURABILITY_MODES:
+            print(f"Unknown WRITE_DURABILITY '{self.default_mode}', using flush")
+            self.default_mode = 'flush'
+        self.classes = load_classes()
+        self.commit_interval = int(os.getenv('WRITE_COMMIT_MS', '20')) / 1000
+        self.commit_bytes = int(os.getenv('WRITE_COMMIT_BYTES', str(256 * 1024)))
+        self.queue = queue.Queue()
+        self.handles = OrderedDict()
+        self.counts = {'commits': 0, 'lines': 0, 'bytes': 0, 'fsyncs': 0, 'errors': 0}
+        self.io_lock = threading.Lock()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def durability_for(self, sensors):
+        """Strongest mode among the classes of SENSORS (sensor names, see partitions.sensor_of)"""
+        strongest = None
+        for sensor in sensors or ():
+            mode = self.default_mode
+            for pattern, override in self.classes:
+                if fnmatch.fnmatch(sensor, pattern):
+                    mode = override
+                    break
+            if strongest is None or DURABILITY_MODES.index(mode) > DURABILITY_MODES.index(strongest):
+                strongest = mode
+        return strongest or self.default_mode
+
+    def append(self, path, lines, header=None, sensors=(), durability=None):
+        """Queue LINES (each ending in a newline) for PATH
+
+        HEADER is written first when the file is new or empty. Returns once
+        the lines are as durable as their sensors' class asks for.
+        """
+        if not lines:
+            return
+        mode = durability or self.durability_for(sensors)
+        commit = Commit() if mode != 'none' else None
+        self._ensure_started()
+        self.queue.put((path, header, ''.join(lines), len(lines), mode, commit))
+        if commit is not None:
+            commit.wait(self.WAIT_TIMEOUT)
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts, open_files=len(self.handles), queued=self.queue.qsize(),
+                        durability=self.default_mode)
+
+    def close(self):
+        """Commit everything queued and close the files (at exit)"""
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join(timeout=self.WAIT_TIMEOUT)
+        with self.io_lock:
+            for handle, _ in self.handles.values():
+                handle.close()
+            self.handles.clear()
+
+    def _ensure_started(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=self.IDLE_CLOSE)
+            except queue.Empty:
+                self._close_idle()
+                continue
+            if item is None:
+                return
+            group = [item]
+            size = len(item[2])
+            waiting = item[5] is not None
+            deadline = time.monotonic() + self.commit_interval
+            stop = False
+            while size < self.commit_bytes:
+                try:
+                    # Waiting callers only pick up what is already queued; 'none' lines may linger
+                    timeout = 0 if waiting else deadline - time.monotonic()
+                    item = self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                group.append(item)
+                size += len(item[2])
+                waiting = waiting or item[5] is not None
+            try:
+                self._commit(group)
+            except Exception as e:
+                print(f"Writer error: {e}")
+                with self.lock:
+                    self.counts['errors'] += 1
+                for item in group:
+                    if item[5] is not None and not item[5].done.is_set():
+                        item[5].error = e
+                        item[5].done.set()
+            if stop:
+                return
+
+    def _commit(self, group):
+        by_path = OrderedDict()
+        for item in group:
+            by_path.setdefault(os.path.abspath(item[0]), []).append(item)
+
+        with self.io_lock:
+            for path, items in by_path.items():
+                # Encode first: a bad record fails only its own caller, not the batch
+                good, data = [], []
+                for item in items:
+                    try:
+                        data.append(item[2].encode('utf-8'))
+                        good.append(item)
+                    except UnicodeError as e:
+                        self._failed(path, [item], e)
+                if not good:
+                    continue
+                try:
+                    header = next((item[1] for item in good if item[1]), None)
+                    self._write(path, header, b''.join(data), any(item[4] == 'fsync' for item in good))
+                except Exception as e:
+                    self._drop(path)
+                    self._failed(path, good, e)
+                    continue
+                with self.lock:
+                    self.counts['lines'] += sum(item[3] for item in good)
+                    self.counts['bytes'] += sum(len(chunk) for chunk in data)
+                for item in good:
+                    if item[5] is not None:
+                        item[5].done.set()
+            with self.lock:
+                self.counts['commits'] += 1
+
+    def _write(self, path, header, data, sync):
+        """Append DATA under the file lock, following the file if compaction swapped it"""
+        handle = self._handle(path)
+        while True:
+            with file_lock(handle):
+                try:
+                    current = os.stat(path).st_ino
+                except FileNotFoundError:
+                    current = None
+                if current == self.handles[path][1]:
+                    if header and os.fstat(handle.fileno()).st_size == 0:
+                        handle.write(header.encode('utf-8'))
+                    handle.write(data)
+                    handle.flush()
+                    if sync:
+                        os.fsync(handle.fileno())
+                        with self.lock:
+                            self.counts['fsyncs'] += 1
+                    return
+            # Replaced or removed while we waited for the lock
+            self._drop(path)
+            handle = self._handle(path)
+
+    def _failed(self, path, items, error):
+        print(f"Error writing {os.path.basename(path)}: {error}")
+        with self.lock:
+            self.counts['errors'] += 1
+        for item in items:
+            if item[5] is not None:
+                item[5].error = error
+                item[5].done.set()
+
+    def _handle(self, path):
+        """Open append handle for PATH, reopened if the file was replaced or removed"""
+        entry = self.handles.get(path)
+        if entry is not None:
+            try:
+                replaced = os.stat(path).st_ino != entry[1]
+            except FileNotFoundError:
+                replaced = True
+            if not replaced:
+                self.handles.move_to_end(path)
+                return entry[0]
+            self._drop(path)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle = open(path, 'ab')
+        self.handles[path] = (handle, os.fstat(handle.fileno()).st_ino)
+        while len(self.handles) > self.MAX_OPEN_FILES:
+            _, (oldest, _) = self.handles.popitem(last=False)
+            oldest.close()
+        return handle
+
+    def _drop(self, path):
+        entry = self.handles.pop(path, None)
+        if entry is not None:
+            try:
+                entry[0].close()
+            except OSError:
+                pass
+
+    def _close_idle(self):
+        with self.io_lock:
+            for path in list(self.handles):
+                self._drop(path)
+
+
+# Global instance
+group_writer = GroupCommitWriter()
+atexit.register(group_writer.close)
@@ -0,0 +1,164 @@
+// arduino/arduino_binary.ino - Same readings as arduino_test.ino, with optional binary frames
+//
+// Starts in text mode (JSON lines) and advertises "CAPS: cmd_id bin1". The
+// host answers with BINARY_ON and from then on every reading is one frame:
+//
+//   COBS( header | float32 values | crc16 ) 0x00
+//   header = kind (0xA1 reading, 0xA2 text), sensor id, seq (u16), millis (u32), count
+//
+// All fields little-endian; crc16 is CRC-16/CCITT-FALSE over header + values.
+// A frame with 3 values is 25 bytes on the wire vs ~90 for the JSON line, so
+// the sample interval can drop from seconds to tens of milliseconds.
+
+const uint8_t FRAME_READING = 0xA1;
+const uint8_t FRAME_TEXT = 0xA2;
+const uint8_t SENSOR_MULTI = 1;
+const unsigned long TEXT_INTERVAL_MS = 3000;
+const unsigned long BINARY_INTERVAL_MS = 50;
+const uint16_t SCHEMA_EVERY = 200;  // re-announce field names so late joiners can decode
+
+bool binaryMode = false;
+uint16_t sequence = 0;
+unsigned long lastSample = 0;
+float temperature = 25.0;
+
+void setup() {
+  Serial.begin(115200);
+  Serial.println("Arduino connected successfully!");
+  Serial.println("Send commands: 'LED_ON', 'LED_OFF', 'READ_TEMP', 'STATUS', 'BINARY_ON', 'BINARY_OFF'");
+  Serial.println("SCHEMA 1: temp,humidity,heart_rate");
+  Serial.println("CAPS: cmd_id bin1");
+}
+
+uint16_t crc16(const uint8_t *data, size_t length) {
+  uint16_t crc = 0xFFFF;
+  for (size_t i = 0; i < length; i++) {
+    crc ^= (uint16_t)data[i] << 8;
+    for (uint8_t bit = 0; bit < 8; bit++) {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+    }
+  }
+  return crc;
+}
+
+// COBS-encode LENGTH bytes (< 254) and write them followed by the 0x00 delimiter
+void writeCobs(const uint8_t *data, size_t length) {
+  uint8_t out[256];
+  size_t codeIndex = 0;
+  size_t outIndex = 1;
+  uint8_t code = 1;
+  for (size_t i = 0; i < length; i++) {
+    if (data[i] == 0) {
+      out[codeIndex] = code;
+      codeIndex = outIndex++;
+      code = 1;
+    } else {
+      out[outIndex++] = data[i];
+      code++;
+    }
+  }
+  out[codeIndex] = code;
+  Serial.write(out, outIndex);
+  Serial.write((uint8_t)0);
+}
+
+void sendFrame(uint8_t kind, uint8_t sensorId, const uint8_t *payload, uint8_t payloadLength, uint8_t count) {
+  uint8_t frame[200];
+  uint32_t now = millis();
+  frame[0] = kind;
+  frame[1] = sensorId;
+  memcpy(frame + 2, &sequence, 2);
+  memcpy(frame + 4, &now, 4);
+  frame[8] = count;
+  memcpy(frame + 9, payload, payloadLength);
+  uint16_t crc = crc16(frame, 9 + payloadLength);
+  memcpy(frame + 9 + payloadLength, &crc, 2);
+  writeCobs(frame, 11 + payloadLength);
+  if (kind == FRAME_READING) {
+    sequence++;
+  }
+}
+
+void sendText(const String &text) {
+  if (binaryMode) {
+    sendFrame(FRAME_TEXT, 0, (const uint8_t *)text.c_str(), min((int)text.length(), 180), 0);
+  } else {
+    Serial.println(text);
+  }
+}
+
+void reply(const String &id, const String &text) {
+  String prefix = "COMMAND_RESPONSE";
+  if (id.length() > 0) {
+    prefix += "[" + id + "]";
+  }
+  sendText(prefix + ": " + text);
+}
+
+void handleCommands() {
+  while (Serial.available() > 0) {
+    String command = Serial.readStringUntil('\n');
+    command.trim();
+
+    String id = "";
+    if (command.startsWith("@")) {
+      int space = command.indexOf(' ');
+      id = command.substring(1, space > 0 ? space : command.length());
+      command = space > 0 ? command.substring(space + 1) : "";
+      command.trim();
+    }
+
+    if (command == "BINARY_ON") {
+      // Reply in text first so the host switches right after reading it
+      reply(id, "BINARY");
+      binaryMode = true;
+    } else if (command == "BINARY_OFF") {
+      binaryMode = false;
+      reply(id, "TEXT");
+    } else if (command == "LED_ON") {
+      reply(id, "LED turned ON");
+    } else if (command == "LED_OFF") {
+      reply(id, "LED turned OFF");
+    } else if (command == "READ_TEMP") {
+      reply(id, "Temperature: " + String(temperature, 2) + "°C");
+    } else if (command == "STATUS") {
+      reply(id, "All systems operational");
+    } else if (command == "HELP") {
+      reply(id, "Available commands: LED_ON, LED_OFF, READ_TEMP, STATUS, BINARY_ON, BINARY_OFF, HELP");
+    } else {
+      reply(id, "Unknown command: " + command);
+    }
+  }
+}
+
+void loop() {
+  handleCommands();
+
+  unsigned long interval = binaryMode ? BINARY_INTERVAL_MS : TEXT_INTERVAL_MS;
+  if (millis() - lastSample < interval) {
+    return;
+  }
+  lastSample = millis();
+
+  temperature = 25.0 + random(-100, 100) / 100.0;
+  float humidity = 50.0 + random(-200, 200) / 100.0;
+  float heartRate = 70 + random(-50, 50) / 10;
+
+  if (binaryMode) {
+    if (sequence % SCHEMA_EVERY == 0) {
+      sendText("SCHEMA 1: temp,humidity,heart_rate");
+    }
+    float values[3] = {temperature, humidity, heartRate};
+    sendFrame(FRAME_READING, SENSOR_MULTI, (const uint8_t *)values, sizeof(values), 3);
+  } else {
+    Serial.print("{\"sensor\":\"multi\",\"temp\":");
+    Serial.print(temperature, 2);
+    Serial.print(",\"humidity\":");
+    Serial.print(humidity, 2);
+    Serial.print(",\"heart_rate\":");
+    Serial.print((int)heartRate);
+    Serial.print(",\"timestamp\":");
+    Serial.print(millis());
+    Serial.println("}");
+  }
+}
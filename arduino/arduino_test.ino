@@ -3,9 +3,22 @@ void setup() {
   Serial.begin(9600);
   Serial.println("Arduino connected successfully!");
   Serial.println("Send commands: 'LED_ON', 'LED_OFF', 'READ_TEMP', 'STATUS'");
+  // Commands may be prefixed "@<id> "; replies then echo the id for correlation
+  Serial.println("CAPS: cmd_id");
   delay(1000);
 }
 
+// "COMMAND_RESPONSE: " or "COMMAND_RESPONSE[<id>]: " when the command carried an id
+void replyPrefix(const String &id) {
+  Serial.print("COMMAND_RESPONSE");
+  if (id.length() > 0) {
+    Serial.print("[");
+    Serial.print(id);
+    Serial.print("]");
+  }
+  Serial.print(": ");
+}
+
 void loop() {
   // Send fake sensor data every 3 seconds
   float temperature = 25.0 + random(-100, 100) / 100.0;  // More variation
@@ -25,25 +38,34 @@ void loop() {
   Serial.print(millis());
   Serial.println("}");
   
-  // Check for incoming commands
-  if (Serial.available() > 0) {
+  // Check for incoming commands (several may be queued back to back)
+  while (Serial.available() > 0) {
     String command = Serial.readStringUntil('\n');
     command.trim();
     
+    String id = "";
+    if (command.startsWith("@")) {
+      int space = command.indexOf(' ');
+      id = command.substring(1, space > 0 ? space : command.length());
+      command = space > 0 ? command.substring(space + 1) : "";
+      command.trim();
+    }
+    
+    replyPrefix(id);
     if (command == "LED_ON") {
-      Serial.println("COMMAND_RESPONSE: LED turned ON");
+      Serial.println("LED turned ON");
     } else if (command == "LED_OFF") {
-      Serial.println("COMMAND_RESPONSE: LED turned OFF");
+      Serial.println("LED turned OFF");
     } else if (command == "READ_TEMP") {
-      Serial.print("COMMAND_RESPONSE: Temperature: ");
+      Serial.print("Temperature: ");
       Serial.print(temperature, 2);
       Serial.println("°C");
     } else if (command == "STATUS") {
-      Serial.println("COMMAND_RESPONSE: All systems operational");
+      Serial.println("All systems operational");
     } else if (command == "HELP") {
-      Serial.println("COMMAND_RESPONSE: Available commands: LED_ON, LED_OFF, READ_TEMP, STATUS, HELP");
+      Serial.println("Available commands: LED_ON, LED_OFF, READ_TEMP, STATUS, HELP");
     } else {
-      Serial.print("COMMAND_RESPONSE: Unknown command: ");
+      Serial.print("Unknown command: ");
       Serial.println(command);
     }
   }
@@ -1,9 +1,14 @@
 import os
-import csv
 import time
 import random
 from datetime import datetime
 
+try:
+    import fcntl
+except ImportError:
+    # No flock on Windows; the app's compaction then only guards its own process
+    fcntl = None
+
 # Build absolute path to /data/sensor_data.csv
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.abspath(os.path.join(BASE_DIR, "..", "data"))
@@ -15,12 +20,39 @@ print(f"💾 Saving data to: {CSV_FILE}")
 # Ensure /data folder exists
 os.makedirs(DATA_DIR, exist_ok=True)
 
-# Create CSV & header if first time
+# The header is written with the first row if the file is new
 if not os.path.exists(CSV_FILE):
-    with open(CSV_FILE, "w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow(["timestamp", "sensor_value"])
-    print("✅ Created new sensor data file")
+    print("✅ Creating new sensor data file")
+
+# One handle kept open between rows, reopened if retention swapped the file
+handle = None
+
+
+def append_row(line):
+    """Append LINE under the same flock the app's writer and retention take"""
+    global handle
+    while True:
+        if handle is None:
+            handle = open(CSV_FILE, "ab")
+        if fcntl:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        try:
+            try:
+                current = os.stat(CSV_FILE).st_ino
+            except FileNotFoundError:
+                current = None
+            if current == os.fstat(handle.fileno()).st_ino:
+                if os.fstat(handle.fileno()).st_size == 0:
+                    handle.write(b"timestamp,sensor_value\n")
+                handle.write(line.encode("utf-8"))
+                handle.flush()
+                return
+        finally:
+            if fcntl:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+        # Replaced or removed while we waited for the lock
+        handle.close()
+        handle = None
 
 print("🔄 Generating fake sensor data...")
 
@@ -38,9 +70,7 @@ while True:
         
         print(f"📈 Generated: {sensor_value} at {timestamp}")
         
-        with open(CSV_FILE, "a", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerow([timestamp, sensor_value])
+        append_row(f"{timestamp},{sensor_value}\n")
         
         # Slowly drift the base value
         base_value += random.uniform(-0.5, 0.5)
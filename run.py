@@ -1,8 +1,9 @@
 from app import create_app
 
-app = create_app()
-
+# Built only when run directly: analytics workers import this module as __mp_main__
 if __name__ == "__main__":
+    app = create_app()
+    
     print("🚀 Starting IoT Platform...")
     print("📊 Dashboard: http://127.0.0.1:5000")
     print("🔌 Device Manager: http://127.0.0.1:5000/device-manager")
@@ -0,0 +1,57 @@
+import json
+
+from app.device_manager.delta_codec import DeltaDecoder
+
+KEY = (1, 'COM3')
+
+
+def send(decoder, records, stream='s1', commit=True):
+    """Decode RECORDS [(enc, values or line, seq)] as one request; returns the stored lines"""
+    batch = decoder.begin()
+    stored = []
+    for encoding, data, seq in records:
+        line = json.dumps(data) if isinstance(data, dict) else data
+        decoded, _ = batch.decode(KEY, encoding, line, seq, stream)
+        if decoded is not None:
+            stored.append(decoded)
+    if commit:
+        batch.commit()
+    return stored
+
+
+def test_resent_batch_is_stored_once():
+    decoder = DeltaDecoder()
+    batch = [('key', {'t': 20.0}, 1), ('delta', {'t': 0.5}, 2), ('delta', {'t': 0.5}, 3)]
+    first = send(decoder, batch)
+    assert [json.loads(line)['t'] for line in first] == [20.0, 20.5, 21.0]
+    assert send(decoder, batch) == []
+
+
+def test_resent_raw_records_are_dropped():
+    decoder = DeltaDecoder()
+    batch = [(None, 'temp=20', 1), (None, 'temp=21', 2)]
+    assert send(decoder, batch) == ['temp=20', 'temp=21']
+    assert send(decoder, batch) == []
+    assert send(decoder, [(None, 'temp=22', 3)]) == ['temp=22']
+
+
+def test_uncommitted_batch_decodes_again():
+    decoder = DeltaDecoder()
+    batch = [('key', {'t': 1}, 1), ('delta', {'t': 1}, 2)]
+    assert len(send(decoder, batch, commit=False)) == 2
+    assert len(send(decoder, batch)) == 2
+
+
+def test_gap_and_new_stream_need_a_keyframe():
+    decoder = DeltaDecoder()
+    send(decoder, [('key', {'t': 1}, 1)])
+    batch = decoder.begin()
+    assert batch.decode(KEY, 'delta', '{"t": 1}', 3, 's1') == (None, 'keyframe')
+    assert batch.decode(KEY, 'delta', '{"t": 1}', 1, 's2') == (None, 'keyframe')
+    assert batch.decode(KEY, 'key', '{"t": 5}', 2, 's2') == ('{"t": 5}', None)
+
+
+def test_unsequenced_records_pass_through():
+    decoder = DeltaDecoder()
+    assert send(decoder, [(None, 'hello', None)], stream=None) == ['hello']
+    assert send(decoder, [(None, 'hello', None)], stream=None) == ['hello']
@@ -0,0 +1,47 @@
+import json
+
+from app.storage.partitions import PartitionIndex
+
+
+def reading(value):
+    return json.dumps({'sensor': 'room', 'temp': value})
+
+
+def test_late_readings_lower_first(tmp_path):
+    index = PartitionIndex(root=str(tmp_path))
+    index.record(1, 'COM3', [('2026-10-19 10:00:00', reading(20))])
+    index.record(1, 'COM3', [('2026-10-19 09:00:00', reading(19))])
+    [entry] = index.entries(1)
+    assert entry['rows'] == 2
+    assert entry['first'] == '2026-10-19 09:00:00'
+    assert entry['last'] == '2026-10-19 10:00:00'
+
+
+def test_load_before_append_does_not_double_count(tmp_path):
+    index = PartitionIndex(root=str(tmp_path))
+    path = index.partition_path(1, 'COM3')
+    rows = [('2026-10-19 10:00:%02d' % i, reading(i)) for i in range(5)]
+    tmp_path.joinpath('user_1').mkdir()
+    with open(path, 'w') as f:
+        f.write('timestamp,port,data\n')
+    # As ingest does: load the index, append the rows, then record them
+    index.load(1)
+    with open(path, 'a') as f:
+        for ts, line in rows:
+            f.write('"%s","COM3","%s"\n' % (ts, line.replace('"', '""')))
+    index.record(1, 'COM3', rows)
+    assert index.entries(1)[0]['rows'] == 5
+
+
+def test_processes_merge_their_rows(tmp_path):
+    # Two workers sharing one index.json
+    first = PartitionIndex(root=str(tmp_path))
+    second = PartitionIndex(root=str(tmp_path))
+    first.record(1, 'COM3', [('2026-10-19 10:00:00', reading(1))])
+    second.record(1, 'COM4', [('2026-10-19 10:00:00', reading(2))])
+    first.record(1, 'COM3', [('2026-10-19 10:00:01', reading(3))])
+    first.flush()
+    second.flush()
+    entries = {entry['port']: entry['rows'] for entry in PartitionIndex(root=str(tmp_path)).entries(1)}
+    assert entries == {'COM3': 2, 'COM4': 1}
+    assert first.resolve(1, 'COM4.csv') is not None
@@ -0,0 +1,49 @@
+import threading
+
+import pytest
+
+from app.storage.writer import GroupCommitWriter
+
+
+@pytest.fixture
+def writer():
+    writer = GroupCommitWriter()
+    # Long enough for the appends below to share one commit
+    writer.commit_interval = 0.5
+    yield writer
+    writer.close()
+
+
+def test_bad_record_fails_only_its_caller(writer, tmp_path):
+    path = str(tmp_path / 'sensor.csv')
+    other = str(tmp_path / 'other.csv')
+    # 'none' returns at once, so the next appends join the same commit
+    writer.append(path, ['1,ok\n'], header='timestamp,value\n', durability='none')
+    errors = []
+
+    def bad():
+        try:
+            writer.append(path, ['2,\ud800\n'], durability='flush')
+        except UnicodeError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=bad)
+    thread.start()
+    writer.append(other, ['3,ok\n'], header='timestamp,value\n', durability='flush')
+    thread.join()
+
+    assert len(errors) == 1
+    assert writer.stats()['errors'] == 1
+    with open(path) as f:
+        assert f.read() == 'timestamp,value\n1,ok\n'
+    with open(other) as f:
+        assert f.read() == 'timestamp,value\n3,ok\n'
+
+
+def test_header_written_once(writer, tmp_path):
+    path = str(tmp_path / 'sensor.csv')
+    writer.append(path, ['1,a\n'], header='timestamp,value\n', durability='flush')
+    writer.append(path, ['2,b\n', '3,c\n'], header='timestamp,value\n', durability='fsync')
+    with open(path) as f:
+        assert f.read() == 'timestamp,value\n1,a\n2,b\n3,c\n'
+    assert writer.stats()['fsyncs'] == 1